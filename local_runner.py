@@ -0,0 +1,167 @@
+"""
+Local backend of setup_pipeline.py.
+Runs the component commands of the pipeline DAG as subprocesses against local folders, with
+independent branches running concurrently. A step whose command, code and input contents are
+unchanged since its last successful run is skipped and its previous output is reused.
+"""
+import os
+import re
+import sys
+import json
+import shlex
+import shutil
+import hashlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Written to a step's output directory after it succeeds, with the hash its inputs had
+STEP_KEY_FILE = ".step_key"
+
+# Files that change on every run without affecting the downstream steps
+UNHASHED_FILES = {STEP_KEY_FILE, "timings.json"}
+
+# Reports and warm-start state of the training step. No later step reads them, so they are left out
+# when an upstream output is hashed; they are still hashed when passed in as a pipeline input
+REPORT_FILES = {"metrics.txt", "model_visualization.png", "checkpoint.pt", "model_hash.json"}
+
+OPTIONAL_PATTERN = re.compile(r"\$\[\[(.*?)\]\]")
+INPUT_PATTERN = re.compile(r"\$\{\{inputs\.(\w+)\}\}")
+
+def resolve_command(command, inputs, output_dir):
+    """
+    Substitute the input and output paths into a component command. Optional $[[...]] groups are
+    dropped when an input they use is not given, as Azure ML does.
+    """
+    def optional_group(match):
+        names = INPUT_PATTERN.findall(match.group(1))
+        return match.group(1) if all(inputs.get(name) is not None for name in names) else ""
+
+    command = OPTIONAL_PATTERN.sub(optional_group, command)
+    missing = [name for name in INPUT_PATTERN.findall(command) if inputs.get(name) is None]
+    if missing:
+        raise ValueError(f"Required inputs {missing} are not set for command: {command}")
+    command = INPUT_PATTERN.sub(lambda match: shlex.quote(os.path.abspath(inputs[match.group(1)])), command)
+    argv = shlex.split(command.replace("${{outputs.output_dir}}", shlex.quote(os.path.abspath(output_dir))))
+    # Run the scripts with the interpreter running this script
+    return [sys.executable] + argv[1:] if argv[0] == "python" else argv
+
+def hash_tree(digest, path, skip=UNHASHED_FILES):
+    """Add the relative names and contents of the files at path (a file or a directory), except skip, to digest."""
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = sorted(
+            os.path.join(root, filename)
+            for root, dirs, filenames in os.walk(path)
+            if "__pycache__" not in root
+            for filename in filenames
+            if filename not in skip
+        )
+    for filename in files:
+        digest.update(os.path.relpath(filename, path).encode())
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+
+def step_key(component, argv, inputs, upstream=()):
+    """
+    Hash everything a step's output depends on: its command line, the code of its script and of
+    the shared modules, and the contents of its inputs. Read-write mounts (the build cache) are skipped,
+    and so are the REPORT_FILES of the inputs named in upstream (outputs of earlier steps).
+    """
+    digest = hashlib.sha256()
+    digest.update("\0".join(argv).encode())
+    code = component["code"]
+    scripts = [arg for arg in argv if arg.endswith(".py")]
+    for directory in [os.path.dirname(script) for script in scripts[:1]] + ["common"]:
+        if directory and os.path.isdir(os.path.join(code, directory)):
+            hash_tree(digest, os.path.join(code, directory))
+    for name, path in sorted(inputs.items()):
+        if path is not None and component["inputs"][name].get("mode") != "rw_mount":
+            digest.update(name.encode())
+            hash_tree(digest, path, UNHASHED_FILES | REPORT_FILES if name in upstream else UNHASHED_FILES)
+    return digest.hexdigest()
+
+def run_step(step, component, inputs, output_dir, log_path, force):
+    """Run one step, or reuse its output if nothing changed. Returns "ran" or "reused"."""
+    argv = resolve_command(component["command"], inputs, output_dir)
+    upstream = {name for name, ref in step["inputs"].items() if ref is not None and ref[0] == "step"}
+    key = step_key(component, argv, inputs, upstream)
+    key_path = os.path.join(output_dir, STEP_KEY_FILE)
+    if not force and os.path.exists(key_path):
+        with open(key_path, "r") as f:
+            if f.read() == key:
+                return "reused"
+
+    # Start from an empty output directory so that no stale files are mistaken for outputs
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    with open(log_path, "w") as log:
+        log.write(" ".join(shlex.quote(arg) for arg in argv) + "\n\n")
+        log.flush()
+        result = subprocess.run(argv, cwd=component["code"], stdout=log, stderr=subprocess.STDOUT, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(f"Step {step['name']} failed with exit code {result.returncode}, see {log_path}")
+    with open(key_path, "w") as f:
+        f.write(key)
+    return "ran"
+
+def run_local(components, steps, outputs, pipeline_inputs, work_dir, jobs, force=False):
+    """
+    Run the DAG in work_dir (one <step name>/ output folder and <step name>.log per step), starting
+    every step as soon as the steps it depends on have finished, at most `jobs` at a time.
+    Returns {output name: output folder}. Raises RuntimeError if a step fails.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    output_dirs = {step["name"]: os.path.join(os.path.abspath(work_dir), step["name"]) for step in steps}
+
+    def resolve(reference):
+        if reference is None:
+            return None
+        kind, name = reference
+        return pipeline_inputs.get(name) if kind == "input" else output_dirs[name]
+
+    def dependencies(step):
+        return {ref[1] for ref in step["inputs"].values() if ref is not None and ref[0] == "step"}
+
+    status = {}
+    pending = list(steps)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while pending or running:
+            # Start every step whose dependencies have succeeded; skip those depending on a failure
+            for step in list(pending):
+                deps = dependencies(step)
+                if any(status.get(dep) in ("failed", "skipped") for dep in deps):
+                    status[step["name"]] = "skipped"
+                    pending.remove(step)
+                    print(f"[{step['name']}] skipped, an upstream step failed")
+                elif all(status.get(dep) in ("ran", "reused") for dep in deps):
+                    component = components[step["component"]]
+                    inputs = {name: resolve(ref) for name, ref in step["inputs"].items()}
+                    print(f"[{step['name']}] started ({component['name']})")
+                    future = pool.submit(run_step, step, component, inputs, output_dirs[step["name"]],
+                                         os.path.join(work_dir, f"{step['name']}.log"), force)
+                    running[future] = step
+                    pending.remove(step)
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                try:
+                    status[step["name"]] = future.result()
+                    print(f"[{step['name']}] {'reused previous output' if status[step['name']] == 'reused' else 'done'}")
+                except (RuntimeError, ValueError, OSError) as e:
+                    status[step["name"]] = "failed"
+                    print(f"[{step['name']}] failed: {e}")
+
+    with open(os.path.join(work_dir, "local_run.json"), "w") as f:
+        json.dump({"steps": status, "outputs": {name: output_dirs[step] for name, step in outputs.items()}}, f, indent=2)
+
+    failed = [name for name, state in status.items() if state == "failed"]
+    if failed:
+        raise RuntimeError(f"Local pipeline run failed in steps {failed}, see the .log files in {work_dir}")
+    return {name: output_dirs[step] for name, step in outputs.items()}
@@ -0,0 +1,320 @@
+"""
+Definition of the pipeline DAG, shared by the Azure ML and local backends of setup_pipeline.py.
+Components are described as plain dictionaries with the same fields as azure.ai.ml.command()
+(environment names instead of registered versions), and the DAG lists the steps in dependency
+order, each input referring to a pipeline input or to the output directory of an earlier step.
+"""
+
+def pipeline_input(name):
+    """Reference to an input of the pipeline (None when it is not given)."""
+    return ("input", name)
+
+def step_output(step):
+    """Reference to the output directory of an earlier step."""
+    return ("step", step)
+
+def define_components(args):
+    """Return the component definitions for the command line options, keyed by component name."""
+    components = {}
+    
+    # 1. PyTorch Training Component
+    components["pytorch_train"] = dict(
+        name="pytorch_train",
+        display_name="Train PyTorch Model and Export to ONNX",
+        description="Trains a PyTorch model and exports it to ONNX format",
+        environment="pytorch-onnx-env",
+        compute="cpu-cluster",
+        code="./src",
+        inputs=dict(
+            training_data=dict(type="uri_folder", optional=True, description="Training data, read in chunks"),
+            checkpoint=dict(type="uri_folder", optional=True, description="Output of a previous training run to fine-tune from")
+        ),
+        outputs=dict(
+            output_dir=dict(type="uri_folder", description="Output directory for model and test data")
+        ),
+        command="python pytorch_train/run.py --output_dir ${{outputs.output_dir}} $[[--data ${{inputs.training_data}}]] "
+                "$[[--checkpoint_dir ${{inputs.checkpoint}}]]" +
+                (f" --window {args.window}" if args.window > 1 else "") +
+                (" --quantize" if args.quantize else "") +
+                (f" --prune_sparsity {args.prune_sparsity}" if args.prune_sparsity else "")
+    )
+    
+    # 2. ONNX Graph Optimisation Component - Fuses and folds nodes before conversion
+    components["onnx_optimize"] = dict(
+        name="onnx_optimize",
+        display_name="Optimise ONNX Graph",
+        description="Fuses and folds ONNX nodes and checks the optimised graph against the original with onnxruntime",
+        environment="pytorch-onnx-env",
+        compute="cpu-cluster",
+        code="./src",
+        inputs=dict(
+            model_dir=dict(type="uri_folder", description="Directory containing ONNX model and test data")
+        ),
+        outputs=dict(
+            output_dir=dict(type="uri_folder", description="Output directory for the optimised ONNX models")
+        ),
+        command="python onnx_optimize/run.py --model_dir ${{inputs.model_dir}} --output_dir ${{outputs.output_dir}}"
+    )
+    
+    # 3. ONNX to C Conversion Component - Simplified to only produce core C model files
+    components["onnx2c"] = dict(
+        name="onnx2c",
+        display_name="Convert ONNX to C",
+        description="Converts ONNX model to C code using onnx2c",
+        environment="onnx2c-env",
+        compute="cpu-cluster",
+        code="./src",
+        inputs=dict(
+            model_dir=dict(type="uri_folder", description="Directory containing ONNX model and test data"),
+            build_cache=dict(type="uri_folder", mode="rw_mount", optional=True, description="Build cache directory")
+        ),
+        outputs=dict(
+            output_dir=dict(type="uri_folder", description="Output directory for core C model code")
+        ),
+        command="python onnx2c/run.py --model_dir ${{inputs.model_dir}} --output_dir ${{outputs.output_dir}} "
+                "$[[--cache_dir ${{inputs.build_cache}}]]" +
+                (f" --backend simd --simd_lanes {args.simd_lanes}" if args.backend == "simd" else "") +
+                (" --weights blob" if args.weight_blob else "")
+    )
+    
+    # 4. Model Library Component - Compiles the generated model code once per flag profile
+    components["compile_model"] = dict(
+        name="compile_model",
+        display_name="Compile Model Libraries",
+        description="Compiles the generated C model code into static libraries for each flag profile",
+        environment="gcc-env",
+        compute="cpu-cluster",
+        code="./src",
+        inputs=dict(
+            c_code_dir=dict(type="uri_folder", description="Directory containing core C model code"),
+            build_cache=dict(type="uri_folder", mode="rw_mount", optional=True, description="Build cache directory")
+        ),
+        outputs=dict(
+            output_dir=dict(type="uri_folder", description="Output directory for the model libraries")
+        ),
+        command="python compile_model/run.py --c_code_dir ${{inputs.c_code_dir}} --output_dir ${{outputs.output_dir}} "
+                "$[[--cache_dir ${{inputs.build_cache}}]]"
+    )
+    
+    # 5. C Compilation and Testing Component - Now gets inputs from both training and ONNX2C
+    components["compile_and_test"] = dict(
+        name="compile_and_test",
+        display_name="Compile C Code and Run Tests",
+        description="Compiles C code and runs tests",
+        environment="gcc-env",
+        compute="cpu-cluster",
+        code="./src",
+        inputs=dict(
+            c_code_dir=dict(type="uri_folder", description="Directory containing core C model code"),
+            model_dir=dict(type="uri_folder", description="Directory containing test data from model training"),
+            model_lib_dir=dict(type="uri_folder", description="Directory containing prebuilt model libraries"),
+            benchmark_baseline=dict(type="uri_file", optional=True, description="Baseline benchmark results to compare against"),
+            replay_data=dict(type="uri_folder", optional=True, description="Large input set evaluated in-process"),
+            fixed_point_dir=dict(type="uri_folder", optional=True, description="Directory containing fixed-point C code"),
+            sparse_dir=dict(type="uri_folder", optional=True, description="Directory containing sparse C code"),
+            build_cache=dict(type="uri_folder", mode="rw_mount", optional=True, description="Build cache directory")
+        ),
+        outputs=dict(
+            output_dir=dict(type="uri_folder", description="Output directory for test results")
+        ),
+        command="python compile_test/run.py --c_code_dir ${{inputs.c_code_dir}} --model_dir ${{inputs.model_dir}} "
+                "--model_lib_dir ${{inputs.model_lib_dir}} --output_dir ${{outputs.output_dir}} "
+                "$[[--benchmark_baseline ${{inputs.benchmark_baseline}}]] $[[--cache_dir ${{inputs.build_cache}}]] "
+                "$[[--replay_dir ${{inputs.replay_data}}]] $[[--fixed_point_dir ${{inputs.fixed_point_dir}}]] "
+                "$[[--sparse_dir ${{inputs.sparse_dir}}]]" +
+                (" --profile" if args.profile_ops else "")
+    )
+    
+    # 6. Build Minimal Binary Component - Only depends on core C model code and its library
+    components["build_minimal"] = dict(
+        name="build_minimal",
+        display_name="Build Minimal Binary",
+        description="Creates minimal binary for deployment",
+        environment="gcc-env",
+        compute="cpu-cluster",
+        code="./src",
+        inputs=dict(
+            c_code_dir=dict(type="uri_folder", description="Directory containing core C model code"),
+            model_lib_dir=dict(type="uri_folder", description="Directory containing prebuilt model libraries"),
+            model_dir=dict(type="uri_folder", optional=True, description="Directory containing test data for flag tuning"),
+            fixed_point_dir=dict(type="uri_folder", optional=True, description="Directory containing fixed-point C code"),
+            sparse_dir=dict(type="uri_folder", optional=True, description="Directory containing sparse C code"),
+            build_cache=dict(type="uri_folder", mode="rw_mount", optional=True, description="Build cache directory")
+        ),
+        outputs=dict(
+            output_dir=dict(type="uri_folder", description="Output directory for minimal binary")
+        ),
+        command="python minimal_binary/run.py --c_code_dir ${{inputs.c_code_dir}} --model_lib_dir ${{inputs.model_lib_dir}} "
+                "--output_dir ${{outputs.output_dir}} --memory_report "
+                "$[[--model_dir ${{inputs.model_dir}}]] $[[--cache_dir ${{inputs.build_cache}}]] "
+                "$[[--fixed_point_dir ${{inputs.fixed_point_dir}}]] $[[--sparse_dir ${{inputs.sparse_dir}}]]" +
+                (" --tune --tune_apply" if args.tune_flags else "") +
+                (" --static_arena" if args.static_arena else "") +
+                (f" --ram_limit {args.ram_limit}" if args.ram_limit else "") +
+                (f" --cross_targets {args.cross_targets}" if args.cross_targets else "") +
+                "".join(f" --cross_budget {budget}" for budget in args.cross_budget)
+    )
+    
+    # 7. Fixed-Point Code Generation Component - Integer-only C code for microcontrollers without an FPU
+    components["fixed_point"] = dict(
+        name="fixed_point",
+        display_name="Generate Fixed-Point C Code",
+        description="Generates Q15/Q31 fixed-point C code from the optimised ONNX model, calibrated on the test data",
+        environment="pytorch-onnx-env",
+        compute="cpu-cluster",
+        code="./src",
+        inputs=dict(
+            model_dir=dict(type="uri_folder", description="Directory containing the optimised ONNX models"),
+            data_dir=dict(type="uri_folder", description="Directory containing test data from model training")
+        ),
+        outputs=dict(
+            output_dir=dict(type="uri_folder", description="Output directory for the fixed-point C code")
+        ),
+        command="python fixed_point/run.py --model_dir ${{inputs.model_dir}} --data_dir ${{inputs.data_dir}} "
+                "--output_dir ${{outputs.output_dir}}" + (f" --format {args.fixed_point}" if args.fixed_point else "")
+    )
+    
+    # 8. Sparse Code Generation Component - Stores and multiplies only the nonzero weights of the pruned model
+    components["sparse_codegen"] = dict(
+        name="sparse_codegen",
+        display_name="Generate Sparse C Code",
+        description="Generates CSR or unrolled C code for the nonzero weights of the pruned ONNX model",
+        environment="pytorch-onnx-env",
+        compute="cpu-cluster",
+        code="./src",
+        inputs=dict(
+            model_dir=dict(type="uri_folder", description="Directory containing the optimised ONNX models")
+        ),
+        outputs=dict(
+            output_dir=dict(type="uri_folder", description="Output directory for the sparse C code")
+        ),
+        command="python sparse_codegen/run.py --model_dir ${{inputs.model_dir}} --output_dir ${{outputs.output_dir}}"
+    )
+    
+    # 9. Scoring Server Component - Load tests the multi-threaded batch scoring service
+    components["scoring_server"] = dict(
+        name="scoring_server",
+        display_name="Load Test Scoring Server",
+        description="Builds the batch scoring library and measures the scoring server throughput and latency per worker count",
+        environment="gcc-env",
+        compute="cpu-cluster",
+        code="./src",
+        inputs=dict(
+            c_code_dir=dict(type="uri_folder", description="Directory containing C code"),
+            model_dir=dict(type="uri_folder", description="Directory containing test data from model training")
+        ),
+        outputs=dict(
+            output_dir=dict(type="uri_folder", description="Output directory for the scoring library and load test report")
+        ),
+        command="python scoring_server/run.py --c_code_dir ${{inputs.c_code_dir}} --model_dir ${{inputs.model_dir}} "
+                "--output_dir ${{outputs.output_dir}}"
+    )
+    
+    # 10. Telemetry Component - Ranks the phases of all the steps by wall time
+    step_outputs = (["training_output", "optimized_model", "c_code_output", "model_libraries", "test_results",
+                     "minimal_binary"] + (["fixed_point_code"] if args.fixed_point else []) +
+                    (["sparse_code"] if args.prune_sparsity else []) +
+                    (["scoring_results"] if args.scoring_benchmark else []))
+    components["telemetry_report"] = dict(
+        name="telemetry_report",
+        display_name="Aggregate Step Timings",
+        description="Merges the per-phase timings of every step to show where the pipeline time goes",
+        environment="gcc-env",
+        compute="cpu-cluster",
+        code="./src",
+        inputs={
+            name: dict(type="uri_folder", description=f"Output directory of the {name} step") for name in step_outputs
+        },
+        outputs=dict(
+            output_dir=dict(type="uri_folder", description="Output directory for the aggregated timings")
+        ),
+        command="python telemetry_report/run.py --output_dir ${{outputs.output_dir}}" +
+                "".join(f" --step_dir {name}=${{{{inputs.{name}}}}}" for name in step_outputs)
+    )
+    
+    return components
+
+def define_steps(args):
+    """
+    Return (steps, outputs): the steps of the pipeline in dependency order as
+    {"name", "component", "inputs": {input name: reference}}, and the pipeline outputs as {output name: step}.
+    """
+    steps = [
+        # Train PyTorch model
+        {"name": "train_step", "component": "pytorch_train",
+         "inputs": {"training_data": pipeline_input("training_data"), "checkpoint": pipeline_input("checkpoint")}},
+        # Optimise the exported graph
+        {"name": "optimize_step", "component": "onnx_optimize",
+         "inputs": {"model_dir": step_output("train_step")}},
+        # Convert ONNX to C - gets the optimised graph, plus the original for comparison
+        {"name": "onnx2c_step", "component": "onnx2c",
+         "inputs": {"model_dir": step_output("optimize_step"), "build_cache": pipeline_input("build_cache")}},
+        # Compile the generated model code once into a library per flag profile
+        {"name": "model_lib_step", "component": "compile_model",
+         "inputs": {"c_code_dir": step_output("onnx2c_step"), "build_cache": pipeline_input("build_cache")}}
+    ]
+    
+    # Generate the fixed-point model from the same optimised graph
+    fixed_point_dir = None
+    if args.fixed_point:
+        steps.append({"name": "fixed_point_step", "component": "fixed_point",
+                      "inputs": {"model_dir": step_output("optimize_step"), "data_dir": step_output("train_step")}})
+        fixed_point_dir = step_output("fixed_point_step")
+    
+    # Generate sparse code for the nonzero weights of the pruned graph
+    sparse_dir = None
+    if args.prune_sparsity:
+        steps.append({"name": "sparse_step", "component": "sparse_codegen",
+                      "inputs": {"model_dir": step_output("optimize_step")}})
+        sparse_dir = step_output("sparse_step")
+    
+    steps += [
+        # Compile and test C code - gets inputs from both train_step and onnx2c_step
+        {"name": "compile_step", "component": "compile_and_test",
+         "inputs": {
+             "c_code_dir": step_output("onnx2c_step"),
+             "model_dir": step_output("train_step"),
+             "model_lib_dir": step_output("model_lib_step"),
+             "benchmark_baseline": pipeline_input("benchmark_baseline"),
+             "replay_data": pipeline_input("replay_data"),
+             "fixed_point_dir": fixed_point_dir,
+             "sparse_dir": sparse_dir,
+             "build_cache": pipeline_input("build_cache")
+         }},
+        # Build minimal binary - only depends on core C model code and its library
+        {"name": "binary_step", "component": "build_minimal",
+         "inputs": {
+             "c_code_dir": step_output("onnx2c_step"),
+             "model_lib_dir": step_output("model_lib_step"),
+             "model_dir": step_output("train_step"),
+             "fixed_point_dir": fixed_point_dir,
+             "sparse_dir": sparse_dir,
+             "build_cache": pipeline_input("build_cache")
+         }}
+    ]
+    
+    outputs = {
+        "training_output": "train_step",
+        "optimized_model": "optimize_step",
+        "c_code_output": "onnx2c_step",
+        "model_libraries": "model_lib_step",
+        "test_results": "compile_step",
+        "minimal_binary": "binary_step"
+    }
+    if args.fixed_point:
+        outputs["fixed_point_code"] = "fixed_point_step"
+    if args.prune_sparsity:
+        outputs["sparse_code"] = "sparse_step"
+    
+    # Load test the scoring server on the generated model code
+    if args.scoring_benchmark:
+        steps.append({"name": "scoring_step", "component": "scoring_server",
+                      "inputs": {"c_code_dir": step_output("onnx2c_step"), "model_dir": step_output("train_step")}})
+        outputs["scoring_results"] = "scoring_step"
+    
+    # Aggregate the timings of every step once they have all finished
+    if args.telemetry:
+        steps.append({"name": "telemetry_step", "component": "telemetry_report",
+                      "inputs": {name: step_output(step) for name, step in outputs.items()}})
+        outputs["pipeline_timings"] = "telemetry_step"
+    return steps, outputs
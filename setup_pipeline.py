@@ -5,9 +5,7 @@ Run this from your development environment after setting up the directory struct
 import os
 import shutil
 import argparse
-from azure.ai.ml import MLClient, command, dsl, Input, Output
-from azure.ai.ml.entities import Environment, BuildContext, AmlCompute
-from azure.identity import DefaultAzureCredential
+from pipeline_dag import define_components, define_steps
 
 from dotenv import load_dotenv
 # Load environment variables from .env file
@@ -17,25 +15,72 @@ def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Setup and optionally run an Azure ML pipeline')
     parser.add_argument('--run', action='store_true', help='Run the pipeline after setup')
+    parser.add_argument('--benchmark_baseline', type=str, default=None,
+                        help='Baseline benchmark_results.json to check the C benchmark against')
+    parser.add_argument('--build_cache', type=str, default=None,
+                        help='Datastore folder URI used as a build cache by the onnx2c, compile and minimal binary steps')
+    parser.add_argument('--tune_flags', action='store_true',
+                        help='Autotune the compiler flags of the minimal binary and build it with the winning set')
+    parser.add_argument('--quantize', action='store_true',
+                        help='Also export, convert and compare an int8 quantized model')
+    parser.add_argument('--profile_ops', action='store_true',
+                        help='Profile the time spent in every ONNX node of the generated C code')
+    parser.add_argument('--replay_data', type=str, default=None,
+                        help='Folder URI with a large test_input.bin (and expected_output.bin) set to evaluate in-process')
+    parser.add_argument('--ram_limit', type=int, default=None,
+                        help='Fail the minimal binary step if its peak RAM (static data plus stack) exceeds this many bytes')
+    parser.add_argument('--static_arena', action='store_true',
+                        help='Place the intermediate tensors of the minimal binary in a single lifetime-packed arena')
+    parser.add_argument('--training_data', type=str, default=None,
+                        help='File or folder URI with .npy, .csv or .parquet training data (sample data if not set)')
+    parser.add_argument('--checkpoint', type=str, default=None,
+                        help='Folder URI of a previous training output to fine-tune from, with --training_data holding only the new data')
+    parser.add_argument('--window', type=int, default=1,
+                        help='Train a windowed model on the last N readings, served by the streaming C API')
+    parser.add_argument('--fixed_point', type=str, choices=['q15', 'q31'], default=None,
+                        help='Also generate, test and size a fixed-point build of the model for FPU-less targets')
+    parser.add_argument('--prune_sparsity', type=float, default=0.0,
+                        help='Prune this fraction of the weights after training and compare sparse C code against the dense build')
+    parser.add_argument('--backend', type=str, choices=['onnx2c', 'simd'], default='onnx2c',
+                        help='Generator of the float C kernels, simd is verified and benchmarked against onnx2c by the test step')
+    parser.add_argument('--simd_lanes', type=int, default=4,
+                        help='Vector width in floats of the SIMD backend (8 for AVX builds)')
+    parser.add_argument('--weight_blob', action='store_true',
+                        help='Also generate model code that reads its weights from a separate, checksummed blob, '
+                             'verified by the test step and sized by the minimal binary step')
+    parser.add_argument('--cross_targets', type=str, default=None,
+                        help='Comma separated embedded targets to cross-compile the minimal binary for (e.g. cortex-m0,cortex-m4,riscv32)')
+    parser.add_argument('--cross_budget', type=str, action='append', default=[],
+                        help='ROM/RAM budget of a cross-compilation target as TARGET:ROM_BYTES:RAM_BYTES (repeatable)')
+    parser.add_argument('--scoring_benchmark', action='store_true',
+                        help='Load test the multi-threaded batch scoring server on the compiled model')
+    parser.add_argument('--telemetry', action='store_true',
+                        help='Add a final step that aggregates the timings.json of every step into pipeline_timings.json')
+    parser.add_argument('--local', type=str, default=None, metavar='WORK_DIR',
+                        help='Run the pipeline on this machine, with one output folder per step in WORK_DIR, '
+                             'instead of setting it up in Azure ML (input options then take local paths)')
+    parser.add_argument('--local_jobs', type=int, default=os.cpu_count() or 1,
+                        help='Number of independent steps run concurrently by --local')
+    parser.add_argument('--local_force', action='store_true',
+                        help='Rerun every step with --local, even those whose code and inputs are unchanged')
     args = parser.parse_args()
 
-    # Connect to your AML workspace
-    ml_client = MLClient(
-        DefaultAzureCredential(), 
-        subscription_id=os.environ["subscription_id"],  # Replace with your subscription ID
-        resource_group_name=os.environ["resource_group_name"],  # Replace with your resource group
-        workspace_name=os.environ["workspace_name"]  # Replace with your workspace name
-    )
-    
     # Set up directory structure
     directories = [
         "environments/pytorch",
         "environments/onnx2c",
         "environments/gcc",
         "src/pytorch_train",
+        "src/onnx_optimize",
         "src/onnx2c",
+        "src/compile_model",
         "src/compile_test",
-        "src/minimal_binary"
+        "src/minimal_binary",
+        "src/fixed_point",
+        "src/sparse_codegen",
+        "src/scoring_server",
+        "src/telemetry_report",
+        "src/common"
     ]
     missing_directories = [directory for directory in directories if not os.path.exists(directory)]
     
@@ -47,6 +92,35 @@ def main():
     else:
         print("All required directories are present.")
     
+    # Run the same DAG locally, in the current Python environment
+    if args.local:
+        from local_runner import run_local
+        steps, step_outputs = define_steps(args)
+        pipeline_inputs = {
+            "benchmark_baseline": args.benchmark_baseline,
+            "build_cache": args.build_cache,
+            "replay_data": args.replay_data,
+            "training_data": args.training_data,
+            "checkpoint": args.checkpoint
+        }
+        outputs = run_local(define_components(args), steps, step_outputs, pipeline_inputs, args.local,
+                            args.local_jobs, args.local_force)
+        print("\nLocal pipeline run complete. Outputs:")
+        for name, path in outputs.items():
+            print(f" - {name}: {path}")
+        return
+    
+    from azure.ai.ml import MLClient, command, dsl, Input, Output
+    from azure.ai.ml.entities import Environment, BuildContext, AmlCompute
+    from azure.identity import DefaultAzureCredential
+    
+    # Connect to your AML workspace
+    ml_client = MLClient(
+        DefaultAzureCredential(), 
+        subscription_id=os.environ["subscription_id"],  # Replace with your subscription ID
+        resource_group_name=os.environ["resource_group_name"],  # Replace with your resource group
+        workspace_name=os.environ["workspace_name"]  # Replace with your workspace name
+    )
     
     # Create compute resources
     print("Creating compute cluster...")
@@ -90,72 +164,16 @@ def main():
     
     # Define components
     print("Creating pipeline components...")
-    
-    # 1. PyTorch Training Component
-    train_pytorch_model = command(
-        name="pytorch_train",
-        display_name="Train PyTorch Model and Export to ONNX",
-        description="Trains a PyTorch model and exports it to ONNX format",
-        environment=latest_envs["pytorch-onnx-env"],
-        compute="cpu-cluster",
-        code="./src/pytorch_train",
-        outputs=dict(
-            output_dir=Output(type="uri_folder", description="Output directory for model and test data")
-        ),
-        command="python run.py --output_dir ${{outputs.output_dir}}"
-    )
-    
-    # 2. ONNX to C Conversion Component - Simplified to only produce core C model files
-    convert_onnx_to_c = command(
-        name="onnx2c",
-        display_name="Convert ONNX to C",
-        description="Converts ONNX model to C code using onnx2c",
-        environment=latest_envs["onnx2c-env"],
-        compute="cpu-cluster",
-        code="./src/onnx2c",
-        inputs=dict(
-            model_dir=Input(type="uri_folder", description="Directory containing ONNX model and test data")
-        ),
-        outputs=dict(
-            output_dir=Output(type="uri_folder", description="Output directory for core C model code")
-        ),
-        command="python run.py --model_dir ${{inputs.model_dir}} --output_dir ${{outputs.output_dir}}"
-    )
-    
-    # 3. C Compilation and Testing Component - Now gets inputs from both training and ONNX2C
-    compile_and_test = command(
-        name="compile_and_test",
-        display_name="Compile C Code and Run Tests",
-        description="Compiles C code and runs tests",
-        environment=latest_envs["gcc-env"],
-        compute="cpu-cluster",
-        code="./src/compile_test",
-        inputs=dict(
-            c_code_dir=Input(type="uri_folder", description="Directory containing core C model code"),
-            model_dir=Input(type="uri_folder", description="Directory containing test data from model training")
-        ),
-        outputs=dict(
-            output_dir=Output(type="uri_folder", description="Output directory for test results")
-        ),
-        command="python run.py --c_code_dir ${{inputs.c_code_dir}} --model_dir ${{inputs.model_dir}} --output_dir ${{outputs.output_dir}}"
-    )
-    
-    # 4. Build Minimal Binary Component - Only depends on core C model code
-    build_minimal_binary = command(
-        name="build_minimal",
-        display_name="Build Minimal Binary",
-        description="Creates minimal binary for deployment",
-        environment=latest_envs["gcc-env"],
-        compute="cpu-cluster",
-        code="./src/minimal_binary",
-        inputs=dict(
-            c_code_dir=Input(type="uri_folder", description="Directory containing core C model code")
-        ),
-        outputs=dict(
-            output_dir=Output(type="uri_folder", description="Output directory for minimal binary")
-        ),
-        command="python run.py --c_code_dir ${{inputs.c_code_dir}} --output_dir ${{outputs.output_dir}}"
-    )
+    components = {
+        name: command(**dict(
+            spec,
+            environment=latest_envs[spec["environment"]],
+            inputs={key: Input(**value) for key, value in spec["inputs"].items()},
+            outputs={key: Output(**value) for key, value in spec["outputs"].items()}
+        ))
+        for name, spec in define_components(args).items()
+    }
+    steps, step_outputs = define_steps(args)
     
     # Define the pipeline with optimized connections between components
     @dsl.pipeline(
@@ -163,32 +181,42 @@ def main():
         description="Pipeline for training PyTorch model, converting to ONNX, C, and building minimal binary",
         compute="cpu-cluster"
     )
-    def nn_pipeline():
-        # Train PyTorch model
-        train_step = train_pytorch_model()
-        
-        # Convert ONNX to C - gets input from training step
-        onnx2c_step = convert_onnx_to_c(model_dir=train_step.outputs.output_dir)
-        
-        # Compile and test C code - now gets inputs from both train_step and onnx2c_step
-        compile_step = compile_and_test(
-            c_code_dir=onnx2c_step.outputs.output_dir,
-            model_dir=train_step.outputs.output_dir
-        )
-        
-        # Build minimal binary - only depends on core C model code
-        binary_step = build_minimal_binary(c_code_dir=onnx2c_step.outputs.output_dir)
+    def nn_pipeline(benchmark_baseline=None, build_cache=None, replay_data=None, training_data=None, checkpoint=None):
+        pipeline_inputs = {
+            "benchmark_baseline": benchmark_baseline,
+            "build_cache": build_cache,
+            "replay_data": replay_data,
+            "training_data": training_data,
+            "checkpoint": checkpoint
+        }
+        jobs = {}
+        for step in steps:
+            inputs = {}
+            for name, reference in step["inputs"].items():
+                if reference is None:
+                    inputs[name] = None
+                elif reference[0] == "input":
+                    inputs[name] = pipeline_inputs[reference[1]]
+                else:
+                    inputs[name] = jobs[reference[1]].outputs.output_dir
+            jobs[step["name"]] = components[step["component"]](**inputs)
         
         # Return all outputs
-        return {
-            "training_output": train_step.outputs.output_dir,
-            "c_code_output": onnx2c_step.outputs.output_dir,
-            "test_results": compile_step.outputs.output_dir,
-            "minimal_binary": binary_step.outputs.output_dir
-        }
+        return {name: jobs[step].outputs.output_dir for name, step in step_outputs.items()}
     
     # Create pipeline
-    pipeline = nn_pipeline()
+    pipeline_inputs = {}
+    if args.benchmark_baseline:
+        pipeline_inputs["benchmark_baseline"] = Input(type="uri_file", path=args.benchmark_baseline)
+    if args.training_data:
+        pipeline_inputs["training_data"] = Input(type="uri_folder", path=args.training_data)
+    if args.checkpoint:
+        pipeline_inputs["checkpoint"] = Input(type="uri_folder", path=args.checkpoint)
+    if args.replay_data:
+        pipeline_inputs["replay_data"] = Input(type="uri_folder", path=args.replay_data)
+    if args.build_cache:
+        pipeline_inputs["build_cache"] = Input(type="uri_folder", path=args.build_cache, mode="rw_mount")
+    pipeline = nn_pipeline(**pipeline_inputs)
         
     # Run the pipeline if the --run flag is provided
     if args.run:
@@ -0,0 +1,262 @@
+"""
+Content-addressed cache for build artifacts shared by the onnx2c, compile and minimal binary steps.
+Entries are keyed by a hash of everything that affects the build (input files, tool versions, flags)
+and evicted least-recently-used first once the cache grows past its size limit.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager
+from common.telemetry import timed_run
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+ENTRY_METADATA = "entry.json"
+LOCK_FILE = ".lock"
+TMP_MARKER = ".tmp"
+
+# Temporary directories older than this are left over from a put() that crashed, and are reclaimed
+TMP_GRACE_SECONDS = 3600
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def dir_size(path):
+    """Return the total size in bytes of the files under a directory."""
+    size = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+def tool_version(tool):
+    """Return a string identifying the installed version of a command line tool."""
+    path = shutil.which(tool)
+    if path is None:
+        return f"{tool}:missing"
+
+    # gcc and friends report their version; for tools without --version hash the binary itself
+    result = subprocess.run([tool, "--version"], capture_output=True, text=True)
+    if result.returncode == 0 and result.stdout.strip():
+        return result.stdout.strip().splitlines()[0]
+    return f"{tool}:{hash_file(path)}"
+
+class BuildCache:
+    """
+    Size-bounded LRU cache of build outputs stored as one directory per key.
+    A single instance can be shared by threads compiling in parallel, and several processes can share
+    one cache directory: lookups and eviction hold an exclusive lock on the directory.
+    """
+
+    def __init__(self, cache_dir, max_size_mb=1024):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(files=(), values=()):
+        """Build a cache key from the contents of files and a sequence of string values."""
+        digest = hashlib.sha256()
+        for path in files:
+            digest.update(os.path.basename(path).encode())
+            digest.update(hash_file(path).encode())
+        for value in values:
+            digest.update(str(value).encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    @contextmanager
+    def _dir_lock(self):
+        """Hold an exclusive lock on the cache directory, shared with other processes using it."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.cache_dir, LOCK_FILE), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_metadata(entry_dir):
+        with open(os.path.join(entry_dir, ENTRY_METADATA), "r") as f:
+            metadata = json.load(f)
+        for field in ("files", "size", "last_used"):
+            if field not in metadata:
+                raise ValueError(f"cache entry metadata is missing {field}")
+        return metadata
+
+    @staticmethod
+    def _write_metadata(entry_dir, metadata):
+        # Write next to the real file and swap it in, so readers never see a partial entry.json
+        fd, tmp_path = tempfile.mkstemp(dir=entry_dir, prefix=ENTRY_METADATA + TMP_MARKER)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(metadata, f)
+            os.replace(tmp_path, os.path.join(entry_dir, ENTRY_METADATA))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, key, dest_dir):
+        """Copy a cached entry into dest_dir. Returns the entry metadata, or None on a miss."""
+        entry_dir = self._entry_dir(key)
+        with self._dir_lock():
+            try:
+                metadata = self._read_metadata(entry_dir)
+                os.makedirs(dest_dir, exist_ok=True)
+                for name in metadata["files"]:
+                    shutil.copy2(os.path.join(entry_dir, name), os.path.join(dest_dir, name))
+            except (OSError, ValueError, KeyError, TypeError):
+                # Missing, half-written or damaged entries are all just a miss; the caller rebuilds
+                self.misses += 1
+                return None
+
+            metadata["last_used"] = time.time()
+            try:
+                self._write_metadata(entry_dir, metadata)
+            except OSError:
+                pass  # only the LRU order suffers
+            self.hits += 1
+        return metadata
+
+    def put(self, key, files, extra=None):
+        """Store files (and optional JSON-serialisable extra data) under key, then evict if over the size limit."""
+        entry_dir = self._entry_dir(key)
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=key + TMP_MARKER)
+
+        try:
+            size = 0
+            for path in files:
+                shutil.copy2(path, tmp_dir)
+                size += os.path.getsize(path)
+
+            self._write_metadata(tmp_dir, {
+                "files": [os.path.basename(path) for path in files],
+                "size": size,
+                "last_used": time.time(),
+                "extra": extra or {}
+            })
+        except OSError as e:
+            # A full disk or vanished output should not fail the build, only skip caching it
+            print(f"Build cache: could not store {key}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        with self._dir_lock():
+            # Another run may have stored the same key in the meantime, in which case keep theirs,
+            # unless its metadata is damaged: it would be a miss forever
+            if os.path.isdir(entry_dir):
+                try:
+                    self._read_metadata(entry_dir)
+                except (OSError, ValueError, KeyError, TypeError):
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except OSError:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+            self._evict(keep=key)
+
+    def evict(self, keep=None):
+        """Remove least-recently-used entries until the cache fits in its size limit."""
+        with self._dir_lock():
+            self._evict(keep)
+
+    def _evict(self, keep):
+        entries = []
+        total = 0
+        now = time.time()
+        for key in os.listdir(self.cache_dir):
+            path = self._entry_dir(key)
+            if not os.path.isdir(path):
+                continue
+            if TMP_MARKER in key:
+                # Entries still being written by put() take space but are not ours to remove,
+                # unless they are old enough to have been abandoned by a crashed run
+                try:
+                    abandoned = now - os.path.getmtime(path) > TMP_GRACE_SECONDS
+                except OSError:
+                    continue
+                if abandoned:
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    total += dir_size(path)
+                continue
+            try:
+                metadata = self._read_metadata(path)
+            except (OSError, ValueError, KeyError, TypeError):
+                # Entries only appear by a rename of a complete directory, so this one is damaged
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            entries.append((metadata["last_used"], metadata["size"], key))
+            total += metadata["size"]
+
+        for last_used, size, key in sorted(entries):
+            if total <= self.max_size_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        """Return hit/miss/eviction counts for this run."""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def report(self, output_dir):
+        """Print cache statistics and write them to build_cache_stats.json in output_dir."""
+        stats = self.stats()
+        print(f"Build cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions")
+        with open(os.path.join(output_dir, "build_cache_stats.json"), "w") as f:
+            json.dump(stats, f, indent=2)
+
+def run_cached(cache, cmd, input_files, output_files, tools=()):
+    """
+    Run a build command in the current directory, or restore its outputs from the cache when the
+    command, input files and tool versions are unchanged. Returns a subprocess.CompletedProcess.
+    """
+    if cache is None:
+        return timed_run(cmd, capture_output=True, text=True)
+
+    key = BuildCache.make_key(
+        files=input_files,
+        values=list(cmd) + [tool_version(tool) for tool in tools]
+    )
+    metadata = cache.get(key, ".")
+    if metadata is not None:
+        print(f"Build cache hit, restored {', '.join(metadata['files'])}")
+        extra = metadata["extra"]
+        return subprocess.CompletedProcess(cmd, 0, stdout=extra.get("stdout", ""), stderr=extra.get("stderr", ""))
+
+    result = timed_run(cmd, capture_output=True, text=True)
+    if result.returncode == 0 and all(os.path.exists(path) for path in output_files):
+        cache.put(key, output_files, extra={"stdout": result.stdout, "stderr": result.stderr})
+    return result
@@ -0,0 +1,93 @@
+"""
+Dense layer view of an exported ONNX graph, shared by the code generators that bypass onnx2c.
+The chain of nodes from the graph input to the graph output (Gemm, or MatMul followed by Add, each
+optionally followed by Relu) is read into float64 weight and bias arrays, and the float generators
+format them back into exact float32 literals.
+"""
+import numpy as np
+from onnx import helper, numpy_helper
+
+# Nodes that forward their first input unchanged at inference time
+PASS_THROUGH_OPS = ["Identity", "Dropout"]
+
+def get_attribute(node, name, default=None):
+    """Return the value of a node attribute, or default if the node does not set it."""
+    for attribute in node.attribute:
+        if attribute.name == name:
+            return helper.get_attribute_value(attribute)
+    return default
+
+def extract_layers(model):
+    """
+    Return the model as a list of dense layers {"weight": N x K, "bias": N, "relu": bool}, following
+    the chain of nodes from the graph input to the graph output. Raises ValueError for anything else.
+    """
+    graph = model.graph
+    constants = {init.name: numpy_helper.to_array(init).astype(np.float64) for init in graph.initializer}
+    inputs = [value.name for value in graph.input if value.name not in constants]
+    if len(inputs) != 1 or len(graph.output) != 1:
+        raise ValueError("Code generation supports models with a single input and output")
+
+    layers = []
+    value = inputs[0]
+    while value != graph.output[0].name:
+        users = [node for node in graph.node if value in node.input]
+        if len(users) != 1:
+            raise ValueError(f"Code generation supports a single chain of nodes, {value} has {len(users)} users")
+        node = users[0]
+
+        if node.op_type in PASS_THROUGH_OPS:
+            pass
+        elif node.op_type == "Gemm":
+            if get_attribute(node, "transA", 0) or node.input[1] not in constants:
+                raise ValueError(f"Gemm node {node.name} must have a constant, non-transposed-A weight")
+            weight = constants[node.input[1]]
+            weight = weight if get_attribute(node, "transB", 0) else weight.T
+            bias = constants[node.input[2]] if len(node.input) > 2 and node.input[2] else np.zeros(weight.shape[0])
+            layers.append({
+                "weight": weight * get_attribute(node, "alpha", 1.0),
+                "bias": np.broadcast_to(bias.reshape(-1), (weight.shape[0],)) * get_attribute(node, "beta", 1.0),
+                "relu": False
+            })
+        elif node.op_type == "MatMul":
+            if node.input[1] not in constants or constants[node.input[1]].ndim != 2:
+                raise ValueError(f"MatMul node {node.name} must have a constant 2D weight")
+            weight = constants[node.input[1]].T
+            layers.append({"weight": weight, "bias": np.zeros(weight.shape[0]), "relu": False})
+        elif node.op_type == "Add" and layers and not layers[-1]["relu"]:
+            bias_name = node.input[1] if node.input[0] == value else node.input[0]
+            if bias_name not in constants:
+                raise ValueError(f"Add node {node.name} must add a constant bias")
+            layers[-1]["bias"] = layers[-1]["bias"] + constants[bias_name].reshape(-1)
+        elif node.op_type == "Relu" and layers and not layers[-1]["relu"]:
+            layers[-1]["relu"] = True
+        else:
+            raise ValueError(f"Unsupported node {node.op_type} ({node.name}), code generation "
+                             f"supports Linear (Gemm, MatMul + Add) and ReLU layers")
+        value = node.output[0]
+
+    if not layers:
+        raise ValueError("The model has no dense layers")
+    return layers
+
+def float_forward(layers, inputs):
+    """Run the layers in float64 and return the output of every layer."""
+    outputs = []
+    x = np.asarray(inputs, dtype=np.float64)
+    for layer in layers:
+        x = x @ layer["weight"].T + layer["bias"]
+        if layer["relu"]:
+            x = np.maximum(x, 0)
+        outputs.append(x)
+    return outputs
+
+def c_float(value):
+    """Format a value as a float literal that round-trips to the same float32."""
+    text = f"{float(np.float32(value)):.9g}"
+    if "." not in text and "e" not in text:
+        text += ".0"
+    return f"{text}f"
+
+def c_floats(values):
+    """Format an array as a float initializer."""
+    return "{" + ", ".join(c_float(value) for value in values) + "}"
@@ -0,0 +1,98 @@
+"""
+Fan-out of a pipeline step over a family of models.
+When the onnx2c step converts several models it writes one subdirectory per model. The downstream
+steps detect that layout and re-run themselves once per model in a bounded pool, with every
+directory argument pointing at the model's subdirectory, then merge the per-model reports.
+"""
+import os
+import re
+import sys
+import json
+from concurrent.futures import ThreadPoolExecutor
+from common.telemetry import timed_run
+
+MODEL_SOURCE = "time_series_model.c"
+
+def model_name(onnx_model_path):
+    """Return a C identifier for a model of a family, derived from its file name."""
+    name = re.sub(r"\W", "_", os.path.splitext(os.path.basename(onnx_model_path))[0])
+    return f"m_{name}" if name[0].isdigit() else name
+
+def find_models(c_code_dir):
+    """Return the model names of a multi-model onnx2c output, or an empty list for a single model."""
+    if os.path.exists(os.path.join(c_code_dir, MODEL_SOURCE)):
+        return []
+    return sorted(
+        name for name in os.listdir(c_code_dir)
+        if os.path.exists(os.path.join(c_code_dir, name, MODEL_SOURCE))
+    )
+
+def model_subdir(directory, model):
+    """Return the model's subdirectory if it exists, otherwise the shared directory."""
+    path = os.path.join(directory, model)
+    return path if os.path.isdir(path) else directory
+
+def rewrite_option(argv, option, rewrite):
+    """Return argv with the value of option (as "--opt value" or "--opt=value") passed through rewrite."""
+    result = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == option and i + 1 < len(argv):
+            result += [arg, rewrite(argv[i + 1])]
+            i += 2
+            continue
+        if arg.startswith(option + "="):
+            arg = f"{option}={rewrite(arg.split('=', 1)[1])}"
+        result.append(arg)
+        i += 1
+    return result
+
+def run_model(script, argv, model, input_options, output_dir):
+    """Run script for a single model and return (model, return code)."""
+    model_argv = list(argv)
+    for option in input_options:
+        model_argv = rewrite_option(model_argv, option, lambda value: model_subdir(value, model))
+    model_output_dir = os.path.join(output_dir, model)
+    model_argv = rewrite_option(model_argv, "--output_dir", lambda value: model_output_dir)
+    os.makedirs(model_output_dir, exist_ok=True)
+
+    result = timed_run([sys.executable, script] + model_argv, capture_output=True, text=True)
+    with open(os.path.join(output_dir, f"{model}.log"), "w") as f:
+        f.write(result.stdout)
+        if result.stderr:
+            f.write("\nErrors:\n")
+            f.write(result.stderr)
+    return model, result.returncode
+
+def fan_out(script, argv, models, input_options, output_dir, jobs, report_files):
+    """
+    Run script once per model with at most `jobs` running at a time, then merge the JSON
+    report_files from each model's output directory into models_report.json.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Found {len(models)} models, running {os.path.basename(os.path.dirname(script))} with {jobs} workers...")
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        results = list(pool.map(lambda model: run_model(script, argv, model, input_options, output_dir), models))
+
+    report = {}
+    failed = []
+    for model, returncode in results:
+        entry = {"status": "ok" if returncode == 0 else "failed"}
+        for filename in report_files:
+            path = os.path.join(output_dir, model, filename)
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    entry[os.path.splitext(filename)[0]] = json.load(f)
+        report[model] = entry
+        print(f"  {model}: {entry['status']}")
+        if returncode != 0:
+            failed.append(model)
+
+    with open(os.path.join(output_dir, "models_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    if failed:
+        raise RuntimeError(f"Step failed for models {failed}, see the <model>.log files in {output_dir}")
+    return report
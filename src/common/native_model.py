@@ -0,0 +1,131 @@
+"""
+In-process binding to the compiled model.
+Loads the shared library built by the test step (libtime_series_model.so) with ctypes and runs
+NumPy arrays through time_series_model_run_batch without copying them, so the exact C numerics
+can be evaluated on millions of samples without text files or a process per run.
+Windowed models take time_series_model_window() consecutive values per sample. The fixed-point
+models of the fixed_point step are loaded the same way, converting to and from their Q formats.
+Libraries built from the weight blob sources of the onnx2c step load their weights with load_weights.
+"""
+import os
+import ctypes
+import threading
+import numpy as np
+
+FLOAT_POINTER = ctypes.POINTER(ctypes.c_float)
+
+class NativeModel:
+    """A compiled time series model loaded from a shared library."""
+
+    def __init__(self, library_path):
+        self.library_path = library_path
+        self._lib = ctypes.CDLL(library_path)
+        self._lib.time_series_model_init.argtypes = []
+        self._lib.time_series_model_init.restype = None
+        self._lib.time_series_model_run_batch.argtypes = [FLOAT_POINTER, FLOAT_POINTER, ctypes.c_size_t]
+        self._lib.time_series_model_run_batch.restype = None
+        self._lib.time_series_model_terminate.argtypes = []
+        self._lib.time_series_model_terminate.restype = None
+        self._lib.time_series_model_window.argtypes = []
+        self._lib.time_series_model_window.restype = ctypes.c_size_t
+        self.window = self._lib.time_series_model_window()
+        # onnx2c keeps the intermediate tensors in static buffers, so calls must not overlap
+        self._lock = threading.Lock()
+        self._lib.time_series_model_init()
+
+    def predict(self, inputs, out=None):
+        """
+        Run the model on an array of inputs (window values per sample, flat or one row per sample)
+        and return one output per sample.
+        float32 C-contiguous inputs, including np.memmap views of the binary test data, are passed
+        to C without a copy; out can be a preallocated float32 array to avoid the output allocation.
+        """
+        inputs = np.ascontiguousarray(inputs, dtype=np.float32).reshape(-1)
+        if inputs.size % self.window:
+            raise ValueError(f"Expected a whole number of {self.window}-value windows, got {inputs.size} values")
+        samples = inputs.size // self.window
+        if out is None:
+            out = np.empty(samples, dtype=np.float32)
+        elif out.dtype != np.float32 or not out.flags["C_CONTIGUOUS"] or out.size != samples:
+            raise ValueError(f"out must be a C-contiguous float32 array of {samples} values")
+
+        # ctypes releases the GIL for the duration of the call
+        with self._lock:
+            self._lib.time_series_model_run_batch(
+                inputs.ctypes.data_as(FLOAT_POINTER), out.ctypes.data_as(FLOAT_POINTER), samples
+            )
+        return out
+
+    def load_weights(self, path, symbol="entry_load_weights"):
+        """
+        Map a weight blob file into a library built with time_series_model_weights.c and bind it,
+        returning 0 or the negative TIME_SERIES_MODEL_WEIGHTS_* error code. symbol is the load
+        function named in weights_layout.json. On error the previously bound blob stays in use.
+        """
+        load = getattr(self._lib, symbol)
+        load.argtypes = [ctypes.c_char_p]
+        load.restype = ctypes.c_int
+        with self._lock:
+            return load(os.fsencode(path))
+
+    def predict_chunks(self, inputs, chunk_size=1 << 20):
+        """Yield the outputs for successive chunks of chunk_size samples, reusing a single output buffer."""
+        inputs = inputs.reshape(-1, self.window)
+        buffer = np.empty(min(chunk_size, len(inputs)), dtype=np.float32)
+        for start in range(0, len(inputs), chunk_size):
+            chunk = inputs[start:start + chunk_size]
+            yield self.predict(chunk, out=buffer[:len(chunk)])
+
+    def close(self):
+        """Release the resources held by the model."""
+        self._lib.time_series_model_terminate()
+
+# ctypes element type of each fixed-point width
+FIXED_TYPES = {16: ctypes.c_int16, 32: ctypes.c_int32}
+
+class FixedPointModel:
+    """
+    A fixed-point model generated by the fixed_point step, loaded from a shared library.
+    params is its fixed_point_report.json, which holds the Q formats of the input and output.
+    """
+
+    def __init__(self, library_path, params):
+        self.library_path = library_path
+        self.window = params["window"]
+        self.bits = params["bits"]
+        self.input_frac_bits = params["input_frac_bits"]
+        self.output_frac_bits = params["output_frac_bits"]
+        self._dtype = np.dtype(f"<i{self.bits // 8}")
+        self._lib = ctypes.CDLL(library_path)
+        pointer = ctypes.POINTER(FIXED_TYPES[self.bits])
+        self._lib.time_series_model_fixed_run_batch.argtypes = [pointer, pointer, ctypes.c_size_t]
+        self._lib.time_series_model_fixed_run_batch.restype = None
+        self._pointer = pointer
+        self._lock = threading.Lock()
+
+    def to_fixed(self, inputs):
+        """Convert float inputs to the input Q format, saturating like the generated code."""
+        limit = 2 ** (self.bits - 1)
+        scaled = np.round(np.asarray(inputs, dtype=np.float64) * 2.0 ** self.input_frac_bits)
+        return np.ascontiguousarray(np.clip(scaled, -limit, limit - 1).astype(self._dtype).reshape(-1))
+
+    def predict(self, inputs):
+        """Run the model on float inputs (window values per sample) and return float32 outputs."""
+        fixed_inputs = self.to_fixed(inputs)
+        if fixed_inputs.size % self.window:
+            raise ValueError(f"Expected a whole number of {self.window}-value windows, got {fixed_inputs.size} values")
+        samples = fixed_inputs.size // self.window
+        out = np.empty(samples, dtype=self._dtype)
+        with self._lock:
+            self._lib.time_series_model_fixed_run_batch(
+                fixed_inputs.ctypes.data_as(self._pointer), out.ctypes.data_as(self._pointer), samples
+            )
+        return (out.astype(np.float64) / 2.0 ** self.output_frac_bits).astype(np.float32)
+
+    @property
+    def saturations(self):
+        """Number of saturated layer outputs so far, if the library counts them (otherwise None)."""
+        try:
+            return ctypes.c_uint32.in_dll(self._lib, "time_series_model_fixed_saturations").value
+        except ValueError:
+            return None
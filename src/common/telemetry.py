@@ -0,0 +1,177 @@
+"""
+Per-phase timing and resource telemetry of a pipeline step.
+A step creates one Telemetry and marks the start of each phase. Every phase records its wall and
+CPU time, the CPU time of the subprocesses it waited for, the peak RSS, and the duration of each
+command run through timed_run. The result is written to timings.json in the step's output
+directory when the step exits, including when it fails.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import resource
+import threading
+import subprocess
+
+TIMINGS_FILE = "timings.json"
+
+# ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+RSS_UNIT_BYTES = 1 if sys.platform == "darwin" else 1024
+
+# Telemetry of the running step, which timed_run records into
+_active = None
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Return the peak resident set size of this process (or of its largest waited-for child) in MB."""
+    return resource.getrusage(who).ru_maxrss * RSS_UNIT_BYTES / 2**20
+
+class Telemetry:
+    """
+    Timings of the sequential phases of one pipeline step.
+    Phases are marked with phase(name); each one ends where the next one starts.
+    """
+
+    def __init__(self, step, output_dir):
+        global _active
+        self.step = step
+        self.output_dir = os.path.abspath(output_dir)
+        self.phases = []
+        self.written = False
+        self._phase = None
+        self._lock = threading.Lock()
+        self._start_wall = time.perf_counter()
+        self._start_times = os.times()
+        _active = self
+        atexit.register(self._write_on_exit)
+
+    def phase(self, name):
+        """End the current phase and start a new one."""
+        with self._lock:
+            self._end_phase()
+            self._phase = {
+                "name": name,
+                "wall": time.perf_counter(),
+                "times": os.times(),
+                "subprocesses": {}
+            }
+
+    def _end_phase(self):
+        """Close the current phase and add it to self.phases."""
+        if self._phase is None:
+            return
+        start, end = self._phase["times"], os.times()
+        subprocesses = self._phase["subprocesses"]
+        self.phases.append({
+            "name": self._phase["name"],
+            "wall_seconds": time.perf_counter() - self._phase["wall"],
+            "cpu_seconds": (end.user - start.user) + (end.system - start.system),
+            "children_cpu_seconds": (end.children_user - start.children_user) +
+                                    (end.children_system - start.children_system),
+            "subprocess_seconds": sum(entry["seconds"] for entry in subprocesses.values()),
+            "subprocesses": subprocesses,
+            "peak_rss_mb": peak_rss_mb(),
+            "children_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN)
+        })
+        self._phase = None
+
+    def record_subprocess(self, command, seconds, returncode):
+        """Add the duration of a command to the current phase, grouped by program name."""
+        program = os.path.basename(str(command[0] if isinstance(command, (list, tuple)) else command).split()[0])
+        with self._lock:
+            if self._phase is None:
+                return
+            entry = self._phase["subprocesses"].setdefault(program, {"count": 0, "seconds": 0.0, "failures": 0})
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            entry["failures"] += int(returncode != 0)
+
+    def write(self, status="ok"):
+        """End the current phase and write timings.json to the output directory."""
+        with self._lock:
+            self._end_phase()
+        end = os.times()
+        timings = {
+            "step": self.step,
+            "status": status,
+            "wall_seconds": time.perf_counter() - self._start_wall,
+            "cpu_seconds": (end.user - self._start_times.user) + (end.system - self._start_times.system),
+            "children_cpu_seconds": (end.children_user - self._start_times.children_user) +
+                                    (end.children_system - self._start_times.children_system),
+            "peak_rss_mb": peak_rss_mb(),
+            "children_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+            "phases": self.phases
+        }
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, TIMINGS_FILE), "w") as f:
+            json.dump(timings, f, indent=2)
+        self.written = True
+        return timings
+
+    def _write_on_exit(self):
+        """Write the timings of a step that exited without calling write(), i.e. one that failed."""
+        if not self.written:
+            self.write(status="failed")
+
+def timed_run(cmd, **kwargs):
+    """subprocess.run that records the command's duration in the current phase of the running step."""
+    start = time.perf_counter()
+    returncode = None
+    try:
+        result = subprocess.run(cmd, **kwargs)
+        returncode = result.returncode
+        return result
+    except subprocess.CalledProcessError as e:
+        returncode = e.returncode
+        raise
+    finally:
+        # Commands that could not be started count as failures
+        if _active is not None:
+            _active.record_subprocess(cmd, time.perf_counter() - start, returncode)
+
+def find_timings(directory):
+    """Return {relative directory: timings} for every timings.json under a step output directory."""
+    found = {}
+    for root, _, files in os.walk(directory):
+        if TIMINGS_FILE in files:
+            with open(os.path.join(root, TIMINGS_FILE), "r") as f:
+                found[os.path.relpath(root, directory)] = json.load(f)
+    return found
+
+def aggregate(step_dirs):
+    """
+    Merge the timings of several step output directories ({label: directory}) into one report with
+    the totals per step, every phase sorted by wall time, and the subprocess time per program.
+    """
+    steps = {}
+    phases = []
+    programs = {}
+    for label, directory in step_dirs.items():
+        for relative, timings in sorted(find_timings(directory).items()):
+            name = label if relative == "." else f"{label}/{relative}"
+            steps[name] = {key: value for key, value in timings.items() if key != "phases"}
+            for phase in timings["phases"]:
+                phases.append(dict(phase, step=name))
+                for program, entry in phase["subprocesses"].items():
+                    total = programs.setdefault(program, {"count": 0, "seconds": 0.0, "failures": 0})
+                    for key in total:
+                        total[key] += entry[key]
+    phases.sort(key=lambda phase: phase["wall_seconds"], reverse=True)
+    return {
+        "steps": steps,
+        "phases": phases,
+        "programs": dict(sorted(programs.items(), key=lambda item: item[1]["seconds"], reverse=True))
+    }
+
+def format_report(report):
+    """Format an aggregated report as a text table of the phases, slowest first."""
+    lines = [f"{'Step':<32} {'Phase':<28} {'Wall s':>9} {'CPU s':>9} {'Subproc s':>10} {'Peak RSS MB':>12}"]
+    for phase in report["phases"]:
+        lines.append(f"{phase['step']:<32} {phase['name']:<28} {phase['wall_seconds']:>9.2f} "
+                     f"{phase['cpu_seconds'] + phase['children_cpu_seconds']:>9.2f} "
+                     f"{phase['subprocess_seconds']:>10.2f} {phase['peak_rss_mb']:>12.1f}")
+    lines.append("")
+    lines.append(f"{'Program':<32} {'Runs':>6} {'Seconds':>10} {'Failures':>9}")
+    for program, entry in report["programs"].items():
+        lines.append(f"{program:<32} {entry['count']:>6} {entry['seconds']:>10.2f} {entry['failures']:>9}")
+    return "\n".join(lines) + "\n"
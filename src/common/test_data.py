@@ -0,0 +1,35 @@
+"""
+Raw float32 test data files written by the training step and the C test harness, and read by the
+later steps. A 24-byte little-endian header (magic, format version, rows, columns, reserved) is
+followed by rows * columns float32 values, so the C code can stream them without parsing.
+"""
+import struct
+import numpy as np
+
+BINARY_MAGIC = b"TSDF"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sIQII")
+
+def save_binary(path, values):
+    """Save a 1D or 2D array as little-endian float32 with the header, one row per sample."""
+    values = np.asarray(values, dtype="<f4")
+    values = values.reshape(len(values), -1)
+    with open(path, "wb") as f:
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, values.shape[0], values.shape[1], 0))
+        f.write(np.ascontiguousarray(values).tobytes())
+
+def load_binary(path, mmap=False):
+    """
+    Load a raw float32 file as a (rows, columns) array.
+    With mmap, the values are mapped instead of read, for data sets larger than memory.
+    """
+    with open(path, "rb") as f:
+        magic, version, rows, columns, _ = BINARY_HEADER.unpack(f.read(BINARY_HEADER.size))
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            raise ValueError(f"{path} is not a version {BINARY_VERSION} test data file")
+        if mmap:
+            return np.memmap(path, dtype="<f4", mode="r", offset=BINARY_HEADER.size, shape=(rows, columns))
+        values = np.fromfile(f, dtype="<f4", count=rows * columns)
+    if values.size != rows * columns:
+        raise ValueError(f"{path} is truncated: expected {rows * columns} values, found {values.size}")
+    return values.reshape(rows, columns)
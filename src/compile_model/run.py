@@ -0,0 +1,141 @@
+"""
+Script for compiling the onnx2c generated model code into static libraries.
+This will run inside the AML pipeline.
+
+The generated sources embed every weight as a C literal, which makes them the slowest part of
+the build. They are compiled once per flag profile here, so the test and minimal binary steps
+only need to compile their small drivers and link against the published archives.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.build_cache import BuildCache, run_cached
+from common.fan_out import find_models, fan_out
+from common.telemetry import Telemetry, timed_run
+
+# Compiler flags for each published archive (libtime_series_model_<profile>.a)
+PROFILES = {
+    # Used by the test build, which has always been compiled without optimisation
+    "debug": [],
+    # Used by the benchmark
+    "release": ["-O2"],
+    # Used by the minimal binary, must match the flags in compile_minimal.sh
+    "minimal": ["-Os", "-fdata-sections", "-ffunction-sections"],
+}
+
+# Generated translation units, the batched kernel is optional
+MODEL_SOURCES = ["time_series_model.c", "time_series_model_batch.c"]
+
+def compile_object(cache, source, profile, flags):
+    """Compile one translation unit for one profile and return the object file name and duration."""
+    obj = f"{os.path.splitext(source)[0]}.{profile}.o"
+    start = time.time()
+    result = run_cached(
+        cache,
+        ["gcc", "-c"] + flags + [source, "-o", obj],
+        [source],
+        [obj],
+        tools=["gcc"]
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Compilation of {source} ({profile}) failed with error:\n{result.stderr}")
+    return obj, time.time() - start
+
+def main():
+    # Parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--c_code_dir", type=str, help="Directory containing C code")
+    parser.add_argument("--output_dir", type=str, help="Output directory for the model libraries")
+    parser.add_argument("--profiles", type=str, default=",".join(PROFILES),
+                        help="Comma separated list of flag profiles to build")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(),
+                        help="Number of translation units to compile in parallel")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Build cache directory (disabled if not set)")
+    parser.add_argument("--cache_max_mb", type=float, default=1024, help="Maximum build cache size in MB")
+    parser.add_argument("--model_jobs", type=int, default=1,
+                        help="Number of models of a model family to build in parallel, each using --jobs workers")
+    args = parser.parse_args()
+    telemetry = Telemetry("compile_model", args.output_dir)
+
+    # A model family is built by re-running this script once per model
+    models = find_models(args.c_code_dir)
+    if models:
+        telemetry.phase("fan_out")
+        fan_out(os.path.abspath(__file__), sys.argv[1:], models, ["--c_code_dir"],
+                args.output_dir, args.model_jobs, ["build_info.json"])
+        telemetry.write()
+        return
+
+    # Create output directory
+    telemetry.phase("setup")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    print(f"C code directory: {args.c_code_dir}")
+    print(f"Output directory: {args.output_dir}")
+
+    profiles = [profile.strip() for profile in args.profiles.split(",") if profile.strip()]
+    unknown = [profile for profile in profiles if profile not in PROFILES]
+    if unknown:
+        raise ValueError(f"Unknown profiles {unknown}, available profiles are {list(PROFILES)}")
+
+    sources = [source for source in MODEL_SOURCES if os.path.exists(os.path.join(args.c_code_dir, source))]
+    if "time_series_model.c" not in sources:
+        raise FileNotFoundError(f"Required file time_series_model.c not found in {args.c_code_dir}")
+
+    # Compile in a work directory next to the sources so that object file names are relative
+    work_dir = os.path.join(args.output_dir, "work")
+    os.makedirs(work_dir, exist_ok=True)
+    for source in sources:
+        shutil.copy(os.path.join(args.c_code_dir, source), work_dir)
+        print(f"Copied {source}")
+    os.chdir(work_dir)
+
+    cache = BuildCache(args.cache_dir, args.cache_max_mb) if args.cache_dir else None
+
+    # Compile every (profile, source) pair in a bounded worker pool
+    telemetry.phase("compile")
+    jobs = [(source, profile) for profile in profiles for source in sources]
+    print(f"Compiling {len(jobs)} translation units with {args.jobs} workers...")
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {
+            (source, profile): pool.submit(compile_object, cache, source, profile, PROFILES[profile])
+            for source, profile in jobs
+        }
+        objects = {key: future.result() for key, future in futures.items()}
+
+    telemetry.phase("archive")
+    build_info = {"sources": sources, "profiles": {}}
+    for profile in profiles:
+        archive = f"libtime_series_model_{profile}.a"
+        profile_objects = [objects[(source, profile)][0] for source in sources]
+        if os.path.exists(archive):
+            os.remove(archive)
+        result = timed_run(["ar", "rcs", archive] + profile_objects, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Creating {archive} failed with error:\n{result.stderr}")
+
+        os.replace(archive, os.path.join(args.output_dir, archive))
+        build_info["profiles"][profile] = {
+            "archive": archive,
+            "flags": PROFILES[profile],
+            "compile_seconds": {source: round(objects[(source, profile)][1], 3) for source in sources}
+        }
+        print(f"Created {archive} with flags: {' '.join(PROFILES[profile]) or '(none)'}")
+
+    with open(os.path.join(args.output_dir, "build_info.json"), "w") as f:
+        json.dump(build_info, f, indent=2)
+
+    if cache:
+        cache.report(args.output_dir)
+
+    telemetry.write()
+    print("Model library compilation completed successfully")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Vectorised comparison of the C model outputs against the expected outputs and the onnxruntime
+reference outputs saved by the training step. The expected outputs measure model quality, while
+the reference outputs measure the fidelity of the onnx2c conversion and are checked against tolerances.
+"""
+import os
+import json
+import numpy as np
+from common.test_data import load_binary
+
+# Upper edges of the absolute error histogram buckets
+HISTOGRAM_EDGES = [0.0, 1e-7, 1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, np.inf]
+
+def load_values(directory, name, mmap=False):
+    """Load name.bin if present, otherwise name.csv, as a flat float32 array. Returns None if neither exists."""
+    bin_path = os.path.join(directory, f"{name}.bin")
+    csv_path = os.path.join(directory, f"{name}.csv")
+    if os.path.exists(bin_path):
+        return load_binary(bin_path, mmap).reshape(-1)
+    if os.path.exists(csv_path):
+        return np.loadtxt(csv_path, delimiter=",", dtype=np.float32, ndmin=1).ravel()
+    return None
+
+def ulp_distance(a, b):
+    """Number of representable float32 values between a and b, element-wise."""
+    def ordered(x):
+        bits = np.ascontiguousarray(x, dtype=np.float32).view(np.int32).astype(np.int64)
+        # Map the sign-magnitude encoding onto a monotonic integer line
+        return np.where(bits < 0, np.int64(-2**31) - bits, bits)
+    return np.abs(ordered(a) - ordered(b))
+
+def error_stats(outputs, target):
+    """Compute absolute, relative and ULP error statistics of outputs against target."""
+    abs_error = np.abs(outputs.astype(np.float64) - target.astype(np.float64))
+    rel_error = abs_error / np.maximum(np.abs(target.astype(np.float64)), np.finfo(np.float32).tiny)
+    ulps = ulp_distance(outputs, target)
+    counts, _ = np.histogram(abs_error, bins=HISTOGRAM_EDGES)
+    return {
+        "samples": int(outputs.size),
+        "max_abs_error": float(abs_error.max()),
+        "mean_abs_error": float(abs_error.mean()),
+        "rms_error": float(np.sqrt(np.mean(abs_error ** 2))),
+        "max_rel_error": float(rel_error.max()),
+        "max_ulp": int(ulps.max()),
+        "mean_ulp": float(ulps.mean()),
+        "worst_index": int(abs_error.argmax()),
+        "abs_error_histogram": [
+            {"upper_edge": None if np.isinf(edge) else edge, "count": int(count)}
+            for edge, count in zip(HISTOGRAM_EDGES[1:], counts)
+        ]
+    }
+
+def check_accuracy(outputs, model_dir, output_dir, atol, rtol, max_ulp=None):
+    """
+    Compare the C outputs against the expected and reference outputs and write accuracy_report.json.
+    Returns a list of tolerance breaches against the reference outputs (empty if within tolerance).
+    """
+    report = {"tolerances": {"atol": atol, "rtol": rtol, "max_ulp": max_ulp}}
+    breaches = []
+
+    expected = load_values(model_dir, "expected_output")
+    if expected is not None:
+        if expected.size != outputs.size:
+            raise ValueError(f"C produced {outputs.size} outputs but there are {expected.size} expected outputs")
+        report["vs_expected"] = error_stats(outputs, expected)
+
+    reference = load_values(model_dir, "reference_output")
+    if reference is None:
+        print("Warning: reference_output not found, skipping the conversion fidelity check")
+    else:
+        if reference.size != outputs.size:
+            raise ValueError(f"C produced {outputs.size} outputs but there are {reference.size} reference outputs")
+        stats = error_stats(outputs, reference)
+        out_of_tolerance = ~np.isclose(outputs, reference, atol=atol, rtol=rtol)
+        stats["out_of_tolerance"] = int(out_of_tolerance.sum())
+        report["vs_reference"] = stats
+
+        if stats["out_of_tolerance"]:
+            breaches.append(f"{stats['out_of_tolerance']} outputs differ from the reference by more than "
+                            f"atol={atol} + rtol={rtol} (max abs error {stats['max_abs_error']:.3g} "
+                            f"at index {stats['worst_index']})")
+        if max_ulp is not None and stats["max_ulp"] > max_ulp:
+            breaches.append(f"max ULP distance {stats['max_ulp']} exceeds {max_ulp}")
+
+    report["breaches"] = breaches
+    with open(os.path.join(output_dir, "accuracy_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name in ["vs_expected", "vs_reference"]:
+        if name in report:
+            stats = report[name]
+            print(f"Accuracy {name}: max abs {stats['max_abs_error']:.3g}, mean abs {stats['mean_abs_error']:.3g}, "
+                  f"max rel {stats['max_rel_error']:.3g}, max ULP {stats['max_ulp']}")
+    return breaches
@@ -0,0 +1,149 @@
+"""
+Per-operator profiling of the onnx2c generated code.
+onnx2c emits one static function per ONNX node, preceded by a comment with the operator type and
+the node name, and an entry function that calls them in order. The calls in the entry function
+are wrapped with clock_gettime counters, and the test harness writes the counters at exit.
+"""
+import os
+import re
+import json
+
+# Comment and signature emitted by onnx2c for every node function
+NODE_PATTERN = re.compile(
+    r"/\*\s*\n\s*\*\s*Operand:\s*(?P<op_type>\S+)\s*\n\s*\*\s*Name in ONNX file:\s*(?P<onnx_name>.*?)\s*\n\s*\*/\s*\n"
+    r"static (?:inline )?void (?P<function>node_\w+)\(",
+    re.MULTILINE
+)
+
+# A node call on its own line inside the entry function
+CALL_PATTERN = re.compile(r"^(?P<indent>\s*)(?P<call>(?P<function>node_\w+)\(.*\);)\s*$", re.MULTILINE)
+
+# Entry function, up to the closing brace at the start of a line
+ENTRY_PATTERN = re.compile(r"^void \w*entry\(.*?^}", re.MULTILINE | re.DOTALL)
+
+# Counters and the writer called by test_model.c when built with -DTIME_SERIES_MODEL_PROFILE
+PROFILE_PRELUDE = """/* Per-operator profiling counters added by compile_test/op_profile.py */
+#ifndef _POSIX_C_SOURCE
+#define _POSIX_C_SOURCE 199309L
+#endif
+#include <stdio.h>
+#include <stdint.h>
+#include <time.h>
+
+#define PROFILE_NODE_COUNT {count}
+#define PROFILE_OVERHEAD_SAMPLES 100000
+
+static uint64_t profile_ns[PROFILE_NODE_COUNT];
+static uint64_t profile_calls[PROFILE_NODE_COUNT];
+
+static inline uint64_t profile_now(void) {{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (uint64_t)ts.tv_sec * 1000000000ull + (uint64_t)ts.tv_nsec;
+}}
+
+void time_series_model_profile_write(const char* path) {{
+    /* Cost of an empty start/stop pair, subtracted from every call by the report */
+    uint64_t overhead = 0;
+    for (int i = 0; i < PROFILE_OVERHEAD_SAMPLES; i++) {{
+        uint64_t start = profile_now();
+        overhead += profile_now() - start;
+    }}
+
+    FILE* f = fopen(path, "w");
+    if (!f) {{
+        return;
+    }}
+    fprintf(f, "timer_overhead_ns,%.3f\\n", (double)overhead / PROFILE_OVERHEAD_SAMPLES);
+    for (int i = 0; i < PROFILE_NODE_COUNT; i++) {{
+        fprintf(f, "%d,%llu,%llu\\n", i, (unsigned long long)profile_calls[i], (unsigned long long)profile_ns[i]);
+    }}
+    fclose(f);
+}}
+
+"""
+
+def find_nodes(c_code):
+    """Return the node functions of the generated code as dicts with function, op_type and onnx_name."""
+    return [match.groupdict() for match in NODE_PATTERN.finditer(c_code)]
+
+def instrument_source(c_code):
+    """
+    Wrap every node call in the entry function with timing counters.
+    Returns the instrumented code and the list of profiled nodes in counter order.
+    """
+    nodes = find_nodes(c_code)
+    if not nodes:
+        raise RuntimeError("No onnx2c node functions found in the generated code")
+    index = {node["function"]: i for i, node in enumerate(nodes)}
+
+    def wrap_call(match):
+        function = match.group("function")
+        if function not in index:
+            return match.group(0)
+        i = index[function]
+        return (f"{match.group('indent')}{{ uint64_t profile_start = profile_now(); {match.group('call')} "
+                f"profile_ns[{i}] += profile_now() - profile_start; profile_calls[{i}]++; }}")
+
+    entry = ENTRY_PATTERN.search(c_code)
+    if entry is None:
+        raise RuntimeError("Could not find the entry function in the generated code")
+    instrumented_entry = CALL_PATTERN.sub(wrap_call, entry.group(0))
+    c_code = c_code[:entry.start()] + instrumented_entry + c_code[entry.end():]
+    return PROFILE_PRELUDE.format(count=len(nodes)) + c_code, nodes
+
+def read_counters(path):
+    """Read the counters written by time_series_model_profile_write. Returns (timer overhead, {index: (calls, ns)})."""
+    overhead_ns = 0.0
+    counters = {}
+    with open(path, "r") as f:
+        for line in f:
+            fields = line.strip().split(",")
+            if fields[0] == "timer_overhead_ns":
+                overhead_ns = float(fields[1])
+            elif len(fields) == 3:
+                counters[int(fields[0])] = (int(fields[1]), int(fields[2]))
+    return overhead_ns, counters
+
+def write_profile_report(nodes, counters_path, output_dir):
+    """Write profile_report.json and profile_report.txt with the time per node, slowest first."""
+    overhead_ns, counters = read_counters(counters_path)
+
+    rows = []
+    for i, node in enumerate(nodes):
+        calls, total_ns = counters.get(i, (0, 0))
+        # The timer reads are included in every measurement
+        net_ns = max(0.0, total_ns - calls * overhead_ns)
+        rows.append({
+            "onnx_name": node["onnx_name"],
+            "op_type": node["op_type"],
+            "function": node["function"],
+            "calls": calls,
+            "total_ns": round(net_ns),
+            "ns_per_call": round(net_ns / calls, 3) if calls else 0.0
+        })
+
+    total = sum(row["total_ns"] for row in rows)
+    for row in rows:
+        row["percent"] = round(row["total_ns"] / total * 100, 2) if total else 0.0
+    rows.sort(key=lambda row: row["total_ns"], reverse=True)
+
+    with open(os.path.join(output_dir, "profile_report.json"), "w") as f:
+        json.dump({"timer_overhead_ns": overhead_ns, "total_ns": total, "nodes": rows}, f, indent=2)
+
+    lines = [
+        f"{'ONNX node':<40} | {'Op':<12} | {'Calls':>10} | {'Total ms':>10} | {'ns/call':>9} | {'%':>6}",
+        "-" * 101
+    ]
+    for row in rows:
+        lines.append(
+            f"{row['onnx_name']:<40} | {row['op_type']:<12} | {row['calls']:>10} | "
+            f"{row['total_ns'] / 1e6:>10.3f} | {row['ns_per_call']:>9.2f} | {row['percent']:>6.2f}"
+        )
+    lines.append(f"Timer overhead of {overhead_ns:.1f} ns per call subtracted")
+    table = "\n".join(lines)
+    print(table)
+
+    with open(os.path.join(output_dir, "profile_report.txt"), "w") as f:
+        f.write(table + "\n")
+    return rows
@@ -3,9 +3,57 @@ Script for compiling C code and running tests.
 This will run inside the AML pipeline.
 """
 import os
+import re
+import sys
+import json
+import time
+import zlib
 import argparse
-import subprocess
 import shutil
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.build_cache import BuildCache, run_cached
+from common.fan_out import find_models, fan_out
+from common.native_model import NativeModel, FixedPointModel
+from common.telemetry import Telemetry, timed_run
+from common.test_data import load_binary
+from accuracy import check_accuracy, error_stats, load_values
+from op_profile import instrument_source, write_profile_report
+
+# Raw float32 test data written by the training step alongside the CSV files, and the
+# contiguous readings replayed through the streaming API
+TEST_DATA_BINARIES = ["test_input.bin", "expected_output.bin", "stream_input.bin", "stream_expected.bin"]
+
+# Shared library loaded in-process by common/native_model.py
+SHARED_LIBRARY = "libtime_series_model.so"
+FIXED_POINT_LIBRARY = "libtime_series_model_fixed.so"
+SPARSE_LIBRARY = "libtime_series_model_sparse.so"
+ONNX2C_LIBRARY = "libtime_series_model_onnx2c.so"
+SIMD_LIBRARY = "libtime_series_model_simd.so"
+BLOB_LIBRARY = "libtime_series_model_blob.so"
+
+# onnx2c output kept by the onnx2c step when the SIMD backend generated time_series_model.c
+ONNX2C_SOURCES = {"time_series_model_onnx2c.c": "time_series_model.c",
+                  "time_series_model_batch_onnx2c.c": "time_series_model_batch.c"}
+
+# Weight blob sources written by the onnx2c step with --weights blob
+BLOB_SOURCES = {"time_series_model_blob.c": "time_series_model.c",
+                "time_series_model_batch_blob.c": "time_series_model_batch.c",
+                "time_series_model_weights.c": "time_series_model_weights.c",
+                "time_series_model_weights.h": "time_series_model_weights.h",
+                "time_series_model_weights.bin": "time_series_model_weights.bin"}
+
+# Entry symbol and window size header written by the onnx2c step for model families and windowed models
+ENTRY_HEADER = "time_series_model_entry.h"
+
+# Per-model reports merged into models_report.json when testing a model family
+MODEL_REPORTS = ["benchmark_results.json", "accuracy_report.json", "quantization_report.json", "profile_report.json",
+                 "graph_optimization_report.json", "replay_report.json", "fixed_point_accuracy.json",
+                 "sparse_report.json", "backend_report.json", "weight_blob_report.json"]
+
+# Benchmark metrics checked against the baseline (lower is better for all of them)
+REGRESSION_METRICS = ["ns_per_inference", "p50_ns", "p99_ns"]
 
 def read_template_file(filename):
     """Read a template file from the templates directory."""
@@ -18,15 +66,691 @@ def read_template_file(filename):
     else:
         raise FileNotFoundError(f"Template file {filename} not found in {os.path.join(script_dir, 'templates')}")
 
+def model_sources(model_lib_dir, profile, have_batch):
+    """Return the model inputs for gcc: the prebuilt library for a profile, or the generated sources."""
+    if model_lib_dir:
+        return [f"libtime_series_model_{profile}.a"]
+    return ["time_series_model.c"] + (["time_series_model_batch.c"] if have_batch else [])
+
+def library_flags(model_lib_dir, profile):
+    """Return the compiler flags of a prebuilt library profile from build_info.json, or None if unknown."""
+    path = os.path.join(model_lib_dir, "build_info.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f).get("profiles", {}).get(profile, {}).get("flags")
+
+def compare_to_baseline(results, baseline, threshold):
+    """Compare benchmark results to a baseline and return a list of regressions above threshold percent."""
+    regressions = []
+    comparison = {}
+    for metric in REGRESSION_METRICS:
+        if metric not in results or not baseline.get(metric):
+            continue
+        change = (results[metric] - baseline[metric]) / baseline[metric] * 100
+        comparison[metric] = {
+            "baseline": baseline[metric],
+            "current": results[metric],
+            "change_percent": round(change, 2)
+        }
+        if change > threshold:
+            regressions.append(f"{metric}: {baseline[metric]} -> {results[metric]} (+{change:.1f}%)")
+    return regressions, comparison
+
+def read_average_error(path):
+    """Read the average prediction error written by test_model to test_results.txt."""
+    with open(path, "r") as f:
+        for line in f:
+            if line.startswith("Average prediction error:"):
+                return float(line.split(":", 1)[1])
+    raise ValueError(f"No average prediction error found in {path}")
+
+def test_quantized_model(args, cache, float_benchmark):
+    """
+    Build and run the test and benchmark programs against the int8 model in a separate work
+    directory, and write the accuracy and latency deltas versus the float model.
+    float_benchmark must come from the build of onnx2c_source(), as the int8 model is onnx2c code too.
+    """
+    float_error = read_average_error("test_results.txt")
+    
+    int8_dir = os.path.abspath("int8")
+    os.makedirs(int8_dir, exist_ok=True)
+    shutil.copy(os.path.join(args.c_code_dir, "time_series_model_int8.c"), os.path.join(int8_dir, "time_series_model.c"))
+    for filename in ["model_impl.c", "time_series_model.h", ENTRY_HEADER, "test_model.c", "benchmark_model.c",
+                     "test_input.csv", "expected_output.csv"] + TEST_DATA_BINARIES:
+        if os.path.exists(filename):
+            shutil.copy(filename, int8_dir)
+    
+    previous_dir = os.getcwd()
+    os.chdir(int8_dir)
+    try:
+        print("Compiling int8 model for testing...")
+        for binary, driver, flags in [("test_model", "test_model.c", []),
+                                      ("benchmark_model", "benchmark_model.c", args.benchmark_cflags.split())]:
+            sources = [driver, "model_impl.c", "time_series_model.c"]
+            headers = [header for header in ["time_series_model.h", ENTRY_HEADER] if os.path.exists(header)]
+            result = run_cached(cache, ["gcc"] + flags + sources + ["-o", binary, "-lm"],
+                                sources + headers, [binary], tools=["gcc"])
+            if result.returncode != 0:
+                raise RuntimeError(f"Compilation of the int8 {binary} failed with error:\n{result.stderr}")
+        
+        test_result = timed_run(["./test_model"], capture_output=True, text=True)
+        with open(os.path.join(args.output_dir, "test_output_int8.txt"), "w") as f:
+            f.write(test_result.stdout)
+            if test_result.stderr:
+                f.write("\nErrors:\n")
+                f.write(test_result.stderr)
+        
+        bench_result = timed_run(
+            ["./benchmark_model", str(args.benchmark_iterations), str(args.benchmark_warmup)],
+            capture_output=True,
+            text=True
+        )
+        if test_result.returncode != 0 or bench_result.returncode != 0:
+            raise RuntimeError(f"Int8 model test failed:\n{test_result.stdout}{bench_result.stdout}")
+        
+        int8_error = read_average_error("test_results.txt")
+        with open("benchmark_results.json", "r") as f:
+            int8_benchmark = json.load(f)
+    finally:
+        os.chdir(previous_dir)
+    
+    report = {
+        "float": {"source": onnx2c_source(args), "average_error": float_error,
+                  "ns_per_inference": float_benchmark["ns_per_inference"]},
+        "int8": {"average_error": int8_error, "ns_per_inference": int8_benchmark["ns_per_inference"]},
+        "average_error_delta": int8_error - float_error,
+        "latency_delta_percent": round(
+            (int8_benchmark["ns_per_inference"] - float_benchmark["ns_per_inference"]) /
+            float_benchmark["ns_per_inference"] * 100, 2)
+    }
+    print(f"Int8 average error: {int8_error:.6f} (float {float_error:.6f}, delta {report['average_error_delta']:+.6f})")
+    print(f"Int8 latency: {int8_benchmark['ns_per_inference']:.2f} ns/inference "
+          f"({report['latency_delta_percent']:+.1f}% vs float)")
+    
+    with open(os.path.join(args.output_dir, "quantization_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+def object_sizes(source, flags):
+    """
+    Compile a source file and return the .text (including read-only data), .data and .bss sizes of
+    the object, and the size of its .rodata sections on their own.
+    """
+    obj = f"{os.path.splitext(os.path.basename(source))[0]}.size.o"
+    result = timed_run(["gcc", "-c"] + flags + [source, "-o", obj], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Compilation of {source} failed with error:\n{result.stderr}")
+    result = timed_run(["size", obj], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"size failed with error: {result.stderr}")
+    text, data, bss = (int(value) for value in result.stdout.splitlines()[1].split()[:3])
+    result = timed_run(["size", "-A", "-d", obj], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"size failed with error: {result.stderr}")
+    rodata = sum(int(parts[1]) for parts in (line.split() for line in result.stdout.splitlines())
+                 if len(parts) > 1 and parts[1].isdigit() and parts[0].startswith(".rodata"))
+    return {"text": text, "rodata": rodata, "data": data, "bss": bss}
+
+def onnx2c_source(args):
+    """
+    Return the name in c_code_dir of the onnx2c output with compiled-in weights, the baseline of the
+    unoptimised, sparse and int8 builds, which are all onnx2c code too: the onnx2c output kept next
+    to the SIMD kernels if there is one, else time_series_model.c. The weight blob sources are
+    written under their own names, so the baseline's .rodata always holds the weights.
+    """
+    if os.path.exists(os.path.join(args.c_code_dir, "time_series_model_onnx2c.c")):
+        return "time_series_model_onnx2c.c"
+    return "time_series_model.c"
+
+def compare_unoptimized(args, cache, optimized_benchmark):
+    """
+    Benchmark the C code generated from the graph before ONNX optimisation and write the latency
+    and size deltas of the optimised graph to graph_optimization_report.json. optimized_benchmark
+    must come from the build of onnx2c_source().
+    """
+    unoptimized_dir = os.path.abspath("unoptimized")
+    os.makedirs(unoptimized_dir, exist_ok=True)
+    shutil.copy(os.path.join(args.c_code_dir, "time_series_model_unoptimized.c"),
+                os.path.join(unoptimized_dir, "time_series_model.c"))
+    for filename in ["model_impl.c", "time_series_model.h", ENTRY_HEADER, "benchmark_model.c"]:
+        if os.path.exists(filename):
+            shutil.copy(filename, unoptimized_dir)
+    # The unoptimised graph is only converted by onnx2c, so the SIMD kernels are not compared with it
+    optimized_source = onnx2c_source(args)
+    optimized_sizes = object_sizes(os.path.join(args.c_code_dir, optimized_source), ["-Os"])
+    
+    previous_dir = os.getcwd()
+    os.chdir(unoptimized_dir)
+    try:
+        print("Compiling benchmark for the unoptimised graph...")
+        sources = ["benchmark_model.c", "model_impl.c", "time_series_model.c"]
+        headers = [header for header in ["time_series_model.h", ENTRY_HEADER] if os.path.exists(header)]
+        result = run_cached(cache, ["gcc"] + args.benchmark_cflags.split() + sources + ["-o", "benchmark_model", "-lm"],
+                            sources + headers, ["benchmark_model"], tools=["gcc"])
+        if result.returncode != 0:
+            raise RuntimeError(f"Compilation of the unoptimised benchmark failed with error:\n{result.stderr}")
+        
+        result = timed_run(
+            ["./benchmark_model", str(args.benchmark_iterations), str(args.benchmark_warmup)],
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Unoptimised benchmark failed:\n{result.stdout}{result.stderr}")
+        with open("benchmark_results.json", "r") as f:
+            unoptimized_benchmark = json.load(f)
+        unoptimized_sizes = object_sizes("time_series_model.c", ["-Os"])
+    finally:
+        os.chdir(previous_dir)
+    
+    report = {
+        "unoptimized": {"ns_per_inference": unoptimized_benchmark["ns_per_inference"], "sizes": unoptimized_sizes},
+        "optimized": {"source": optimized_source, "ns_per_inference": optimized_benchmark["ns_per_inference"],
+                      "sizes": optimized_sizes},
+        "latency_delta_percent": round(
+            (optimized_benchmark["ns_per_inference"] - unoptimized_benchmark["ns_per_inference"]) /
+            unoptimized_benchmark["ns_per_inference"] * 100, 2),
+        "size_delta_bytes": {key: optimized_sizes[key] - unoptimized_sizes[key] for key in optimized_sizes}
+    }
+    print(f"Graph optimisation: {report['latency_delta_percent']:+.1f}% latency, "
+          f"{report['size_delta_bytes']['text']:+d} bytes .text, {report['size_delta_bytes']['data']:+d} bytes .data")
+    
+    with open(os.path.join(args.output_dir, "graph_optimization_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+def build_shared_library(cache, headers, defines, have_batch, library=SHARED_LIBRARY, cflags=()):
+    """
+    Build the model as a shared library for in-process evaluation. The prebuilt archives are not
+    position independent, so the model sources are compiled here with the test build's flags.
+    """
+    sources = ["model_impl.c", "time_series_model.c"] + (["time_series_model_batch.c"] if have_batch else [])
+    result = run_cached(
+        cache,
+        ["gcc", "-shared", "-fPIC"] + list(cflags) + sources + defines + ["-o", library, "-lm"],
+        sources + headers,
+        [library],
+        tools=["gcc"]
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Compilation of {library} failed with error:\n{result.stderr}")
+    return NativeModel(os.path.abspath(library))
+
+def test_fixed_point(args, cache, float_outputs):
+    """
+    Run the test inputs through the fixed-point model of the fixed_point step and write its error
+    against the float C model and the expected outputs to fixed_point_accuracy.json.
+    """
+    for filename in ["time_series_model_fixed.c", "time_series_model_fixed.h", "fixed_point_report.json"]:
+        shutil.copy(os.path.join(args.fixed_point_dir, filename), filename)
+    with open("fixed_point_report.json", "r") as f:
+        params = json.load(f)
+    
+    print(f"Building {FIXED_POINT_LIBRARY} ({params['format'].upper()})...")
+    sources = ["time_series_model_fixed.c"]
+    result = run_cached(
+        cache,
+        ["gcc", "-O2", "-fPIC", "-shared", "-DTIME_SERIES_MODEL_FIXED_COUNT_SATURATION"] + sources +
+        ["-o", FIXED_POINT_LIBRARY],
+        sources + ["time_series_model_fixed.h"],
+        [FIXED_POINT_LIBRARY],
+        tools=["gcc"]
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Compilation of {FIXED_POINT_LIBRARY} failed with error:\n{result.stderr}")
+    model = FixedPointModel(os.path.abspath(FIXED_POINT_LIBRARY), params)
+    
+    outputs = model.predict(load_values(args.model_dir, "test_input", mmap=True))
+    report = {
+        "format": params["format"],
+        "input_frac_bits": params["input_frac_bits"],
+        "output_frac_bits": params["output_frac_bits"],
+        "saturations": model.saturations,
+        "vs_float": error_stats(outputs, float_outputs)
+    }
+    expected = load_values(args.model_dir, "expected_output", mmap=True)
+    if expected is not None:
+        report["vs_expected"] = error_stats(outputs, expected)
+        report["float_vs_expected"] = error_stats(float_outputs, expected)
+    print(f"Fixed-point vs float: max abs {report['vs_float']['max_abs_error']:.3g}, "
+          f"mean abs {report['vs_float']['mean_abs_error']:.3g}, {report['saturations']} saturations")
+    if report["saturations"]:
+        print("Warning: fixed-point values saturated, increase --margin of the fixed_point step")
+    
+    with open(os.path.join(args.output_dir, "fixed_point_accuracy.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    
+    if args.fixed_max_abs_error is not None and report["vs_float"]["max_abs_error"] > args.fixed_max_abs_error:
+        raise RuntimeError(f"Fixed-point outputs differ from the float model by up to "
+                           f"{report['vs_float']['max_abs_error']:.3g} (limit {args.fixed_max_abs_error})")
+
+def test_sparse_model(args, cache, float_outputs, dense_benchmark):
+    """
+    Run the test inputs and the benchmark through the sparse model of the sparse_codegen step, and
+    write its error, .rodata and latency against the dense onnx2c model to sparse_report.json.
+    dense_benchmark must come from the build of onnx2c_source().
+    The error of the model before pruning is included if the training step saved its outputs.
+    """
+    with open(os.path.join(args.sparse_dir, "sparse_report.json"), "r") as f:
+        codegen_report = json.load(f)
+    
+    sparse_dir = os.path.abspath("sparse")
+    os.makedirs(sparse_dir, exist_ok=True)
+    shutil.copy(os.path.join(args.sparse_dir, "time_series_model_sparse.c"),
+                os.path.join(sparse_dir, "time_series_model.c"))
+    for filename in ["model_impl.c", "time_series_model.h", ENTRY_HEADER, "benchmark_model.c"]:
+        if os.path.exists(filename):
+            shutil.copy(filename, sparse_dir)
+    dense_source = onnx2c_source(args)
+    dense_sizes = object_sizes(os.path.join(args.c_code_dir, dense_source), ["-Os"])
+    
+    previous_dir = os.getcwd()
+    os.chdir(sparse_dir)
+    try:
+        print(f"Building {SPARSE_LIBRARY}...")
+        headers = [header for header in ["time_series_model.h", ENTRY_HEADER] if os.path.exists(header)]
+        sources = ["model_impl.c", "time_series_model.c"]
+        result = run_cached(cache, ["gcc", "-shared", "-fPIC"] + sources + ["-o", SPARSE_LIBRARY, "-lm"],
+                            sources + headers, [SPARSE_LIBRARY], tools=["gcc"])
+        if result.returncode != 0:
+            raise RuntimeError(f"Compilation of {SPARSE_LIBRARY} failed with error:\n{result.stderr}")
+        model = NativeModel(os.path.abspath(SPARSE_LIBRARY))
+        outputs = model.predict(load_values(args.model_dir, "test_input", mmap=True))
+        model.close()
+        
+        print("Compiling benchmark for the sparse model...")
+        sources = ["benchmark_model.c", "model_impl.c", "time_series_model.c"]
+        result = run_cached(cache, ["gcc"] + args.benchmark_cflags.split() + sources + ["-o", "benchmark_model", "-lm"],
+                            sources + headers, ["benchmark_model"], tools=["gcc"])
+        if result.returncode != 0:
+            raise RuntimeError(f"Compilation of the sparse benchmark failed with error:\n{result.stderr}")
+        result = timed_run(
+            ["./benchmark_model", str(args.benchmark_iterations), str(args.benchmark_warmup)],
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Sparse benchmark failed:\n{result.stdout}{result.stderr}")
+        with open("benchmark_results.json", "r") as f:
+            sparse_benchmark = json.load(f)
+        sparse_sizes = object_sizes("time_series_model.c", ["-Os"])
+    finally:
+        os.chdir(previous_dir)
+    
+    report = {
+        "sparsity": codegen_report["sparsity"],
+        "formats": [layer["format"] for layer in codegen_report["layers"]],
+        "dense": {"source": dense_source, "ns_per_inference": dense_benchmark["ns_per_inference"], "sizes": dense_sizes},
+        "sparse": {"ns_per_inference": sparse_benchmark["ns_per_inference"], "sizes": sparse_sizes},
+        "rodata_delta_bytes": sparse_sizes["rodata"] - dense_sizes["rodata"],
+        "text_delta_bytes": sparse_sizes["text"] - dense_sizes["text"],
+        "latency_delta_percent": round(
+            (sparse_benchmark["ns_per_inference"] - dense_benchmark["ns_per_inference"]) /
+            dense_benchmark["ns_per_inference"] * 100, 2),
+        "vs_dense_c": error_stats(outputs, float_outputs)
+    }
+    expected = load_values(args.model_dir, "expected_output", mmap=True)
+    if expected is not None:
+        report["vs_expected"] = error_stats(outputs, expected)
+        report["dense_c_vs_expected"] = error_stats(float_outputs, expected)
+        # Predictions of the model before pruning, saved by the training step
+        unpruned = load_values(args.model_dir, "dense_reference_output", mmap=True)
+        if unpruned is not None:
+            report["unpruned_vs_expected"] = error_stats(unpruned, expected)
+    print(f"Sparse model: {report['sparsity']:.1%} sparse ({', '.join(report['formats'])}), "
+          f"max abs difference vs dense C {report['vs_dense_c']['max_abs_error']:.3g}, "
+          f"{report['rodata_delta_bytes']:+d} bytes .rodata, {report['text_delta_bytes']:+d} bytes .text, "
+          f"{report['latency_delta_percent']:+.1f}% latency")
+    
+    with open(os.path.join(args.output_dir, "sparse_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    
+    # Both builds multiply the same nonzero weights, only the order of the additions may differ
+    if report["vs_dense_c"]["max_abs_error"] > args.atol + args.rtol * float(np.max(np.abs(float_outputs), initial=0.0)):
+        raise RuntimeError(f"Sparse model outputs differ from the dense C model by up to "
+                           f"{report['vs_dense_c']['max_abs_error']:.3g}")
+
+def batch_throughput(model, inputs, samples, chunk_size=1 << 16):
+    """
+    Return the samples per second of the in-process model over at least samples inputs, best of three
+    runs. The test inputs are repeated up to chunk_size samples per call to amortise the call overhead.
+    """
+    inputs = np.asarray(inputs, dtype=np.float32).reshape(-1, model.window)
+    inputs = np.resize(inputs, (max(len(inputs), min(samples, chunk_size)), model.window))
+    out = np.empty(len(inputs), dtype=np.float32)
+    rounds = max(1, -(-samples // len(inputs)))
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            model.predict(inputs, out=out)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(rounds * len(inputs) / best, 1) if best else None
+
+def test_backend(args, cache, headers, defines, have_batch, simd_benchmark):
+    """
+    Build the onnx2c output kept by the onnx2c step next to the SIMD kernels, and write the output
+    differences, single-sample latency and batch throughput of both backends to backend_report.json.
+    Both libraries are built with the benchmark flags, the batch kernels included if there are any.
+    Returns the single-sample benchmark results of the onnx2c build.
+    """
+    onnx2c_dir = os.path.abspath("onnx2c")
+    os.makedirs(onnx2c_dir, exist_ok=True)
+    for companion, filename in ONNX2C_SOURCES.items():
+        if have_batch or filename == "time_series_model.c":
+            shutil.copy(os.path.join(args.c_code_dir, companion), os.path.join(onnx2c_dir, filename))
+    for filename in ["model_impl.c", "benchmark_model.c"] + headers:
+        shutil.copy(filename, onnx2c_dir)
+    inputs = load_values(args.model_dir, "test_input", mmap=True)
+    
+    print(f"Building {SIMD_LIBRARY} and {ONNX2C_LIBRARY} with flags: {args.benchmark_cflags}")
+    model = build_shared_library(cache, headers, defines, have_batch, SIMD_LIBRARY, args.benchmark_cflags.split())
+    simd_outputs = model.predict(inputs)
+    simd_throughput = batch_throughput(model, inputs, args.benchmark_iterations)
+    model.close()
+    simd_sizes = object_sizes("time_series_model.c", ["-Os"])
+    
+    previous_dir = os.getcwd()
+    os.chdir(onnx2c_dir)
+    try:
+        model = build_shared_library(cache, headers, defines, have_batch, ONNX2C_LIBRARY, args.benchmark_cflags.split())
+        outputs = model.predict(inputs)
+        onnx2c_throughput = batch_throughput(model, inputs, args.benchmark_iterations)
+        model.close()
+        
+        print("Compiling benchmark for the onnx2c model...")
+        sources = ["benchmark_model.c", "model_impl.c", "time_series_model.c"]
+        result = run_cached(cache, ["gcc"] + args.benchmark_cflags.split() + sources + ["-o", "benchmark_model", "-lm"],
+                            sources + headers, ["benchmark_model"], tools=["gcc"])
+        if result.returncode != 0:
+            raise RuntimeError(f"Compilation of the onnx2c benchmark failed with error:\n{result.stderr}")
+        result = timed_run(
+            ["./benchmark_model", str(args.benchmark_iterations), str(args.benchmark_warmup)],
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"onnx2c benchmark failed:\n{result.stdout}{result.stderr}")
+        with open("benchmark_results.json", "r") as f:
+            onnx2c_benchmark = json.load(f)
+        onnx2c_sizes = object_sizes("time_series_model.c", ["-Os"])
+    finally:
+        os.chdir(previous_dir)
+    
+    report = {
+        "batch_kernel": have_batch,
+        "onnx2c": {"ns_per_inference": onnx2c_benchmark["ns_per_inference"], "batch_samples_per_sec": onnx2c_throughput,
+                   "sizes": onnx2c_sizes},
+        "simd": {"ns_per_inference": simd_benchmark["ns_per_inference"], "batch_samples_per_sec": simd_throughput,
+                 "sizes": simd_sizes},
+        "latency_delta_percent": round(
+            (simd_benchmark["ns_per_inference"] - onnx2c_benchmark["ns_per_inference"]) /
+            onnx2c_benchmark["ns_per_inference"] * 100, 2),
+        "batch_speedup": round(simd_throughput / onnx2c_throughput, 3),
+        "vs_onnx2c": error_stats(simd_outputs, outputs)
+    }
+    print(f"SIMD backend: max abs difference vs onnx2c {report['vs_onnx2c']['max_abs_error']:.3g}, "
+          f"{report['latency_delta_percent']:+.1f}% latency, {report['batch_speedup']}x batch throughput "
+          f"({simd_throughput:.0f} vs {onnx2c_throughput:.0f} samples/sec)")
+    
+    with open(os.path.join(args.output_dir, "backend_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    
+    # Both backends accumulate every output in the same order, only floating-point contraction may differ
+    if report["vs_onnx2c"]["max_abs_error"] > args.atol + args.rtol * float(np.max(np.abs(outputs), initial=0.0)):
+        raise RuntimeError(f"SIMD backend outputs differ from the onnx2c model by up to "
+                           f"{report['vs_onnx2c']['max_abs_error']:.3g}")
+    return onnx2c_benchmark
+
+def compile_seconds(source, flags):
+    """Return the best of three wall-clock times of compiling a source file to an object file."""
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        result = timed_run(["gcc", "-c"] + flags + [source, "-o", os.devnull], capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"Compilation of {source} failed with error:\n{result.stderr}")
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 4)
+
+def test_weight_blob(args, cache, headers, defines, have_batch, float_outputs):
+    """
+    Build the model from the weight blob sources of the onnx2c step, map the blob and check that the
+    outputs match the compiled-in weights, that damaged or mismatched blobs are rejected and that a
+    new blob can be swapped in without rebuilding. The compile time and size of both builds, and the
+    blob size, are written to weight_blob_report.json.
+    """
+    with open(os.path.join(args.c_code_dir, "weights_layout.json"), "r") as f:
+        layout = json.load(f)
+    blob_dir = os.path.abspath("blob")
+    os.makedirs(blob_dir, exist_ok=True)
+    for companion, filename in BLOB_SOURCES.items():
+        if have_batch or filename != "time_series_model_batch.c":
+            shutil.copy(os.path.join(args.c_code_dir, companion), os.path.join(blob_dir, filename))
+    for filename in ["model_impl.c"] + headers:
+        shutil.copy(filename, blob_dir)
+    inputs = load_values(args.model_dir, "test_input", mmap=True)
+    compiled_seconds = compile_seconds("time_series_model.c", ["-O2"])
+    compiled_sizes = object_sizes("time_series_model.c", ["-Os"])
+    
+    previous_dir = os.getcwd()
+    os.chdir(blob_dir)
+    try:
+        with open("time_series_model_weights.h", "r") as f:
+            codes = {name: int(value) for name, value in
+                     re.findall(r"#define TIME_SERIES_MODEL_WEIGHTS_(\w+) (-?\d+)\n", f.read())}
+        with open("time_series_model_weights.bin", "rb") as f:
+            blob = f.read()
+        header_bytes = codes["HEADER_BYTES"]
+        
+        # Damaged payload, blob of another layout, truncated blob, and a valid blob of other weights
+        # (all zero) standing in for a retrain
+        damaged = bytearray(blob)
+        damaged[header_bytes] ^= 0x01
+        mismatched = bytearray(blob)
+        mismatched[8:12] = (int.from_bytes(blob[8:12], "little") ^ 1).to_bytes(4, "little")
+        swapped = bytearray(blob)
+        swapped[header_bytes:] = bytes(len(blob) - header_bytes)
+        swapped[16:20] = zlib.crc32(bytes(swapped[header_bytes:])).to_bytes(4, "little")
+        variants = {"damaged": (damaged, "BAD_CHECKSUM"), "mismatched": (mismatched, "BAD_LAYOUT"),
+                    "truncated": (blob[:-1], "BAD_SIZE")}
+        for name, (content, _) in list(variants.items()) + [("swapped", (swapped, "OK"))]:
+            with open(f"{name}_weights.bin", "wb") as f:
+                f.write(content)
+        
+        print(f"Building {BLOB_LIBRARY}...")
+        sources = ["model_impl.c", "time_series_model.c", "time_series_model_weights.c"] + (
+            ["time_series_model_batch.c"] if have_batch else [])
+        result = run_cached(cache, ["gcc", "-shared", "-fPIC"] + sources + defines + ["-o", BLOB_LIBRARY, "-lm"],
+                            sources + headers + ["time_series_model_weights.h"], [BLOB_LIBRARY], tools=["gcc"])
+        if result.returncode != 0:
+            raise RuntimeError(f"Compilation of {BLOB_LIBRARY} failed with error:\n{result.stderr}")
+        model = NativeModel(os.path.abspath(BLOB_LIBRARY))
+        try:
+            code = model.load_weights(os.path.abspath("time_series_model_weights.bin"), layout["load_symbol"])
+            if code != codes["OK"]:
+                raise RuntimeError(f"{layout['load_symbol']} rejected the generated blob with error {code}")
+            outputs = model.predict(inputs)
+            
+            # Every bad blob must be rejected with its error, leaving the bound weights in use
+            rejected = {}
+            for name, (_, expected) in variants.items():
+                code = model.load_weights(os.path.abspath(f"{name}_weights.bin"), layout["load_symbol"])
+                rejected[name] = code
+                if code != codes[expected]:
+                    raise RuntimeError(f"The {name} blob returned {code} instead of "
+                                       f"TIME_SERIES_MODEL_WEIGHTS_{expected} ({codes[expected]})")
+            still_bound = bool(np.array_equal(model.predict(inputs), outputs))
+            
+            swapped_ok = (model.load_weights(os.path.abspath("swapped_weights.bin"), layout["load_symbol"]) == codes["OK"]
+                          and not np.array_equal(model.predict(inputs), outputs))
+        finally:
+            model.close()
+        blob_seconds = compile_seconds("time_series_model.c", ["-O2"])
+        blob_sizes = object_sizes("time_series_model.c", ["-Os"])
+    finally:
+        os.chdir(previous_dir)
+    
+    report = {
+        "layout": layout["layout"],
+        "tensors": len(layout["tensors"]),
+        "payload_bytes": layout["payload_bytes"],
+        "blob_bytes": len(blob),
+        "identical": bool(np.array_equal(outputs, float_outputs)),
+        "vs_compiled": error_stats(outputs, float_outputs),
+        "rejected": rejected,
+        "previous_blob_kept": still_bound,
+        "swapped_without_rebuild": swapped_ok,
+        "compiled": {"compile_seconds": compiled_seconds, "sizes": compiled_sizes},
+        "blob": {"compile_seconds": blob_seconds, "sizes": blob_sizes},
+        "rodata_delta_bytes": blob_sizes["rodata"] - compiled_sizes["rodata"]
+    }
+    print(f"Weight blob: {report['blob_bytes']} bytes, layout {report['layout']}, outputs "
+          f"{'identical to' if report['identical'] else 'different from'} the compiled-in weights, "
+          f"{report['rodata_delta_bytes']:+d} bytes .rodata, compile {blob_seconds:.3f}s vs {compiled_seconds:.3f}s")
+    
+    with open(os.path.join(args.output_dir, "weight_blob_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    
+    # The blob holds the same float values the literals compile to
+    if not report["identical"]:
+        raise RuntimeError(f"Weight blob outputs differ from the compiled-in weights by up to "
+                           f"{report['vs_compiled']['max_abs_error']:.3g}")
+    if not still_bound or not swapped_ok:
+        raise RuntimeError("Weight blob reloading failed: a rejected blob replaced the bound one, "
+                           "or a valid blob of new weights was not applied")
+
+def replay(model, replay_dir, output_dir):
+    """Run a large input set through the in-process model in chunks and write replay_report.json."""
+    inputs = load_values(replay_dir, "test_input", mmap=True)
+    if inputs is None:
+        raise FileNotFoundError(f"No test_input.bin or test_input.csv found in {replay_dir}")
+    expected = load_values(replay_dir, "expected_output", mmap=True)
+    samples = inputs.size // model.window
+    
+    print(f"Replaying {samples} samples through {SHARED_LIBRARY}...")
+    outputs = np.lib.format.open_memmap(os.path.join(output_dir, "replay_output.npy"), mode="w+",
+                                        dtype=np.float32, shape=(samples,))
+    start = time.time()
+    position = 0
+    for chunk in model.predict_chunks(inputs):
+        outputs[position:position + chunk.size] = chunk
+        position += chunk.size
+    elapsed = time.time() - start
+    outputs.flush()
+    
+    report = {"samples": samples, "seconds": round(elapsed, 3),
+              "samples_per_sec": round(samples / elapsed, 1) if elapsed else None}
+    if expected is not None:
+        report["vs_expected"] = error_stats(outputs, expected)
+    print(f"Replayed {samples} samples in {elapsed:.2f} s ({report['samples_per_sec']} samples/sec)")
+    
+    with open(os.path.join(output_dir, "replay_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+def profile_model(args, cache):
+    """
+    Build the test program against a copy of the model code with a timer around every ONNX node
+    and run the test workload to produce the per-operator profile.
+    """
+    # The per-node timers need onnx2c node functions, the SIMD backend is profiled through its onnx2c reference
+    source = "time_series_model.c"
+    if os.path.exists(os.path.join(args.c_code_dir, "time_series_model_onnx2c.c")):
+        source = "time_series_model_onnx2c.c"
+    with open(os.path.join(args.c_code_dir, source), "r") as f:
+        c_code, nodes = instrument_source(f.read())
+    
+    profile_dir = os.path.abspath("profile")
+    os.makedirs(profile_dir, exist_ok=True)
+    with open(os.path.join(profile_dir, "time_series_model.c"), "w") as f:
+        f.write(c_code)
+    for filename in ["model_impl.c", "time_series_model.h", ENTRY_HEADER, "test_model.c",
+                     "test_input.csv", "expected_output.csv"] + TEST_DATA_BINARIES:
+        if os.path.exists(filename):
+            shutil.copy(filename, profile_dir)
+    
+    previous_dir = os.getcwd()
+    os.chdir(profile_dir)
+    try:
+        # The batched kernel is left out so that every sample runs through the instrumented entry
+        print(f"Compiling profiling build with {len(nodes)} instrumented nodes...")
+        sources = ["test_model.c", "model_impl.c", "time_series_model.c"]
+        headers = [header for header in ["time_series_model.h", ENTRY_HEADER] if os.path.exists(header)]
+        result = run_cached(
+            cache,
+            ["gcc"] + args.benchmark_cflags.split() + ["-DTIME_SERIES_MODEL_PROFILE"] + sources +
+            ["-o", "test_model", "-lm"],
+            sources + headers,
+            ["test_model"],
+            tools=["gcc"]
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Compilation of the profiling build failed with error:\n{result.stderr}")
+        
+        result = timed_run(["./test_model"], capture_output=True, text=True)
+        if result.returncode != 0 or not os.path.exists("profile_counters.csv"):
+            raise RuntimeError(f"Profiling run failed:\n{result.stdout}{result.stderr}")
+        
+        print("Per-operator profile:")
+        write_profile_report(nodes, "profile_counters.csv", args.output_dir)
+    finally:
+        os.chdir(previous_dir)
+
 def main():
     # Parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("--c_code_dir", type=str, help="Directory containing C code")
     parser.add_argument("--model_dir", type=str, help="Directory containing ONNX model and test data")
     parser.add_argument("--output_dir", type=str, help="Output directory for test results")
+    parser.add_argument("--benchmark_iterations", type=int, default=1000000, help="Number of timed inferences")
+    parser.add_argument("--benchmark_warmup", type=int, default=10000, help="Number of untimed warm-up inferences")
+    parser.add_argument("--benchmark_cflags", type=str, default="-O2", help="Compiler flags for the benchmark build")
+    parser.add_argument("--benchmark_baseline", type=str, default=None,
+                        help="Baseline benchmark_results.json file (or directory containing it) to compare against")
+    parser.add_argument("--regression_threshold", type=float, default=10.0,
+                        help="Allowed slowdown versus the baseline in percent")
+    parser.add_argument("--fail_on_regression", action="store_true",
+                        help="Fail the step instead of warning when the regression threshold is exceeded")
+    parser.add_argument("--atol", type=float, default=1e-4,
+                        help="Absolute tolerance of the C outputs versus the onnxruntime reference outputs")
+    parser.add_argument("--rtol", type=float, default=1e-4,
+                        help="Relative tolerance of the C outputs versus the onnxruntime reference outputs")
+    parser.add_argument("--max_ulp", type=int, default=None,
+                        help="Maximum ULP distance from the reference outputs (not checked if not set)")
+    parser.add_argument("--model_lib_dir", type=str, default=None,
+                        help="Directory containing prebuilt model libraries (model sources are compiled here if not set)")
+    parser.add_argument("--replay_dir", type=str, default=None,
+                        help="Directory with a large test_input (and optional expected_output) set to evaluate in-process")
+    parser.add_argument("--fixed_point_dir", type=str, default=None,
+                        help="Directory with the fixed-point C code of the fixed_point step, compared against the float model")
+    parser.add_argument("--fixed_max_abs_error", type=float, default=None,
+                        help="Fail if the fixed-point outputs differ from the float model by more than this")
+    parser.add_argument("--sparse_dir", type=str, default=None,
+                        help="Directory with the sparse C code of the sparse_codegen step, compared against the dense model")
+    parser.add_argument("--profile", action="store_true",
+                        help="Run the test workload with a timer around every ONNX node and write profile_report.txt")
+    parser.add_argument("--model_jobs", type=int, default=1,
+                        help="Number of models of a model family to test in parallel "
+                             "(concurrent benchmarks skew the latency measurements)")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Build cache directory (disabled if not set)")
+    parser.add_argument("--cache_max_mb", type=float, default=1024, help="Maximum build cache size in MB")
     args = parser.parse_args()
+    telemetry = Telemetry("compile_test", args.output_dir)
+    
+    # A model family is tested by re-running this script once per model
+    models = find_models(args.c_code_dir)
+    if models:
+        telemetry.phase("fan_out")
+        fan_out(os.path.abspath(__file__), sys.argv[1:], models,
+                ["--c_code_dir", "--model_dir", "--model_lib_dir", "--benchmark_baseline", "--replay_dir",
+                 "--fixed_point_dir", "--sparse_dir"],
+                args.output_dir, args.model_jobs, MODEL_REPORTS)
+        telemetry.write()
+        return
     
     # Create output directory
+    telemetry.phase("setup")
     os.makedirs(args.output_dir, exist_ok=True)
     
     print(f"C code directory: {args.c_code_dir}")
@@ -45,11 +769,37 @@ def main():
     else:
         raise FileNotFoundError(f"Required file time_series_model.c not found in {args.c_code_dir}")
     
+    # Copy the batched kernel if the onnx2c step generated one
+    have_batch = True
+    for batch_file in ["time_series_model_batch.c", "time_series_model_batch.h"]:
+        source_path = os.path.join(args.c_code_dir, batch_file)
+        if os.path.exists(source_path):
+            shutil.copy(source_path, work_dir)
+            print(f"Copied {batch_file}")
+        else:
+            have_batch = False
+    
+    if not have_batch:
+        print("Batched kernel not found, time_series_model_run_batch will use the single-sample kernel")
+    
+    # Copy the entry symbol header of a model family member
+    have_entry_header = os.path.exists(os.path.join(args.c_code_dir, ENTRY_HEADER))
+    if have_entry_header:
+        shutil.copy(os.path.join(args.c_code_dir, ENTRY_HEADER), work_dir)
+        print(f"Copied {ENTRY_HEADER}")
+    
+    # Copy the prebuilt model libraries so that only the drivers need compiling
+    if args.model_lib_dir:
+        for profile in ["debug", "release"]:
+            shutil.copy(os.path.join(args.model_lib_dir, f"libtime_series_model_{profile}.a"), work_dir)
+        print("Copied prebuilt model libraries")
+    
     # Load template files from local templates directory
     try:
         model_impl_content = read_template_file("model_impl.c")
         header_content = read_template_file("time_series_model.h")
         test_model_content = read_template_file("test_model.c")
+        benchmark_content = read_template_file("benchmark_model.c")
         
         # Write template files to work directory
         with open(os.path.join(work_dir, "model_impl.c"), "w") as f:
@@ -60,6 +810,9 @@ def main():
             
         with open(os.path.join(work_dir, "test_model.c"), "w") as f:
             f.write(test_model_content)
+            
+        with open(os.path.join(work_dir, "benchmark_model.c"), "w") as f:
+            f.write(benchmark_content)
     except FileNotFoundError as e:
         print(f"Error loading template files: {e}")
         raise
@@ -73,16 +826,32 @@ def main():
         else:
             print(f"Warning: {csv_file} not found in {args.model_dir}")
     
+    # The binary copies are streamed by test_model instead of parsing the CSV files
+    for bin_file in TEST_DATA_BINARIES:
+        source_path = os.path.join(args.model_dir, bin_file)
+        if os.path.exists(source_path):
+            shutil.copy(source_path, work_dir)
+            print(f"Copied {bin_file}")
+    
     # Change to the work directory
     os.chdir(work_dir)
     
+    cache = BuildCache(args.cache_dir, args.cache_max_mb) if args.cache_dir else None
+    
     # Compile the test code
+    telemetry.phase("compile_tests")
     print("Compiling C code for testing...")
-    result = subprocess.run(
-        ["gcc", "test_model.c", "time_series_model.c", "model_impl.c", "-o", "test_model", "-lm"],
-        capture_output=True,
-        text=True
-    )
+    headers = ["time_series_model.h"] + ([ENTRY_HEADER] if have_entry_header else [])
+    defines = []
+    if have_batch:
+        headers += ["time_series_model_batch.h"]
+        defines += ["-DTIME_SERIES_MODEL_HAVE_BATCH"]
+    
+    sources = ["test_model.c", "model_impl.c"] + model_sources(args.model_lib_dir, "debug", have_batch)
+    # The batch and streaming paths must agree with per-sample inference as closely as the reference
+    compile_cmd = ["gcc"] + sources + defines + [f"-DCONSISTENCY_TOLERANCE={args.atol!r}f", "-o", "test_model", "-lm"]
+    
+    result = run_cached(cache, compile_cmd, sources + headers, ["test_model"], tools=["gcc"])
     
     if result.returncode != 0:
         error_msg = f"Compilation failed with error:\n{result.stderr}"
@@ -94,7 +863,8 @@ def main():
     print("Compilation successful. Running tests...")
     
     # Run the test program
-    test_result = subprocess.run(
+    telemetry.phase("run_tests")
+    test_result = timed_run(
         ["./test_model"],
         capture_output=True,
         text=True
@@ -116,6 +886,145 @@ def main():
         shutil.copy("test_results.txt", os.path.join(args.output_dir, "test_results.txt"))
         print("Test results file created successfully")
     
+    if test_result.returncode != 0 or not os.path.exists("model_output.bin"):
+        raise RuntimeError(f"Test program failed:\n{test_result.stdout}{test_result.stderr}")
+    shutil.copy("model_output.bin", os.path.join(args.output_dir, "model_output.bin"))
+    
+    # Check conversion fidelity over the whole test set, running the C model in-process
+    telemetry.phase("accuracy")
+    print(f"Building {SHARED_LIBRARY} for in-process evaluation...")
+    model = build_shared_library(cache, headers, defines, have_batch)
+    shutil.copy(SHARED_LIBRARY, os.path.join(args.output_dir, SHARED_LIBRARY))
+    
+    outputs = model.predict(load_values(args.model_dir, "test_input", mmap=True))
+    harness_outputs = load_binary("model_output.bin").reshape(-1)
+    if outputs.size != harness_outputs.size or not np.array_equal(outputs, harness_outputs):
+        raise RuntimeError(f"In-process outputs ({outputs.size} values) differ from the test program outputs in "
+                           f"model_output.bin ({harness_outputs.size} values)")
+    
+    breaches = check_accuracy(outputs, args.model_dir, args.output_dir, args.atol, args.rtol, args.max_ulp)
+    if breaches:
+        raise RuntimeError("C outputs are outside the tolerance of the reference outputs:\n  " + "\n  ".join(breaches))
+    
+    # Compare the fixed-point backend against the float C model on the same inputs
+    if args.fixed_point_dir:
+        telemetry.phase("fixed_point")
+        test_fixed_point(args, cache, outputs)
+    
+    # Build and run the benchmark with optimisation enabled
+    telemetry.phase("benchmark")
+    print(f"Compiling benchmark with flags: {args.benchmark_cflags}")
+    # The release library is only reused when it was built with the benchmark flags, else the model
+    # would be measured with flags other than the ones requested
+    model_lib_dir = args.model_lib_dir
+    if model_lib_dir and library_flags(model_lib_dir, "release") != args.benchmark_cflags.split():
+        print("Prebuilt release library flags differ from the benchmark flags, compiling the model sources")
+        model_lib_dir = None
+    bench_sources = ["benchmark_model.c", "model_impl.c"] + model_sources(model_lib_dir, "release", have_batch)
+    result = run_cached(
+        cache,
+        ["gcc"] + args.benchmark_cflags.split() + bench_sources + defines + ["-o", "benchmark_model", "-lm"],
+        bench_sources + headers,
+        ["benchmark_model"],
+        tools=["gcc"]
+    )
+    
+    if result.returncode != 0:
+        error_msg = f"Benchmark compilation failed with error:\n{result.stderr}"
+        print(error_msg)
+        with open(os.path.join(args.output_dir, "compilation_error.txt"), "w") as f:
+            f.write(error_msg)
+        raise RuntimeError("Benchmark compilation failed")
+    
+    print("Running benchmark...")
+    bench_result = timed_run(
+        ["./benchmark_model", str(args.benchmark_iterations), str(args.benchmark_warmup)],
+        capture_output=True,
+        text=True
+    )
+    
+    with open(os.path.join(args.output_dir, "benchmark_output.txt"), "w") as f:
+        f.write(bench_result.stdout)
+        if bench_result.stderr:
+            f.write("\nErrors:\n")
+            f.write(bench_result.stderr)
+    
+    if bench_result.returncode != 0 or not os.path.exists("benchmark_results.json"):
+        raise RuntimeError(f"Benchmark failed:\n{bench_result.stdout}{bench_result.stderr}")
+    
+    with open("benchmark_results.json", "r") as f:
+        benchmark = json.load(f)
+    benchmark["cflags"] = args.benchmark_cflags
+    benchmark["model_library"] = "libtime_series_model_release.a" if model_lib_dir else None
+    print(f"Benchmark: {benchmark['ns_per_inference']:.2f} ns/inference, "
+          f"p99 {benchmark['p99_ns']} ns, {benchmark['samples_per_sec']:.0f} samples/sec")
+    
+    # Compare against the stored baseline, if one was given
+    regressions = []
+    if args.benchmark_baseline:
+        baseline_path = args.benchmark_baseline
+        if os.path.isdir(baseline_path):
+            baseline_path = os.path.join(baseline_path, "benchmark_results.json")
+        
+        if os.path.exists(baseline_path):
+            with open(baseline_path, "r") as f:
+                baseline = json.load(f)
+            regressions, comparison = compare_to_baseline(benchmark, baseline, args.regression_threshold)
+            benchmark["baseline_comparison"] = comparison
+            benchmark["regression_threshold_percent"] = args.regression_threshold
+            benchmark["regressions"] = regressions
+        else:
+            print(f"Warning: benchmark baseline {baseline_path} not found, skipping regression check")
+    
+    with open(os.path.join(args.output_dir, "benchmark_results.json"), "w") as f:
+        json.dump(benchmark, f, indent=2)
+    
+    if regressions:
+        message = (f"Benchmark regressed by more than {args.regression_threshold}% versus baseline:\n  " +
+                   "\n  ".join(regressions))
+        if args.fail_on_regression:
+            raise RuntimeError(message)
+        print(f"Warning: {message}")
+    
+    if args.replay_dir:
+        telemetry.phase("replay")
+        replay(model, args.replay_dir, args.output_dir)
+    
+    if args.profile:
+        telemetry.phase("profile")
+        profile_model(args, cache)
+    
+    # Verify and benchmark the SIMD backend against the onnx2c output it replaced; the onnx2c numbers
+    # are the baseline of the unoptimised, sparse and int8 builds, which are onnx2c code as well
+    onnx2c_benchmark = benchmark
+    if os.path.exists(os.path.join(args.c_code_dir, "time_series_model_onnx2c.c")):
+        telemetry.phase("backend")
+        onnx2c_benchmark = test_backend(args, cache, headers, defines, have_batch, benchmark)
+    
+    # Measure the gain of the ONNX graph optimisation step if it kept the original graph
+    if os.path.exists(os.path.join(args.c_code_dir, "time_series_model_unoptimized.c")):
+        telemetry.phase("graph_optimization")
+        compare_unoptimized(args, cache, onnx2c_benchmark)
+    
+    # Check the weight blob build against the compiled-in weights
+    if os.path.exists(os.path.join(args.c_code_dir, "weights_layout.json")):
+        telemetry.phase("weight_blob")
+        test_weight_blob(args, cache, headers, defines, have_batch, outputs)
+    
+    # Compare the sparse build of the pruned model against the dense onnx2c build
+    if args.sparse_dir:
+        telemetry.phase("sparse")
+        test_sparse_model(args, cache, outputs, onnx2c_benchmark)
+    
+    # Compare the int8 model against the float model if the training step quantized it
+    if os.path.exists(os.path.join(args.c_code_dir, "time_series_model_int8.c")):
+        telemetry.phase("int8")
+        test_quantized_model(args, cache, onnx2c_benchmark)
+    
+    if cache:
+        cache.report(args.output_dir)
+    
+    telemetry.write()
     print("C code compilation and testing completed successfully")
 
 if __name__ == "__main__":
@@ -0,0 +1,124 @@
+#define _POSIX_C_SOURCE 199309L
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+#include <time.h>
+#include "time_series_model.h"
+
+// Defaults, can be overridden on the command line: ./benchmark_model [iterations] [warmup]
+#define DEFAULT_ITERATIONS 1000000
+#define DEFAULT_WARMUP 10000
+
+static uint64_t now_ns(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (uint64_t)ts.tv_sec * 1000000000ull + (uint64_t)ts.tv_nsec;
+}
+
+static int compare_u64(const void* a, const void* b) {
+    uint64_t x = *(const uint64_t*)a;
+    uint64_t y = *(const uint64_t*)b;
+    return (x > y) - (x < y);
+}
+
+static uint64_t percentile(const uint64_t* sorted, long count, double p) {
+    long index = (long)(p * (count - 1) + 0.5);
+    return sorted[index];
+}
+
+// Inputs cycle over the same range as the training data (time steps 0..99).
+// Sample i is the window of TIME_SERIES_MODEL_WINDOW steps starting at series + i % 100.
+#define SERIES_PERIOD 100
+static float series[SERIES_PERIOD + TIME_SERIES_MODEL_WINDOW - 1];
+
+static const float* sample_input(long i) {
+    return series + i % SERIES_PERIOD;
+}
+
+int main(int argc, char** argv) {
+    long iterations = argc > 1 ? atol(argv[1]) : DEFAULT_ITERATIONS;
+    long warmup = argc > 2 ? atol(argv[2]) : DEFAULT_WARMUP;
+
+    if (iterations <= 0 || warmup < 0) {
+        printf("Error: invalid iteration counts\n");
+        return 1;
+    }
+
+    uint64_t* latencies = (uint64_t*)malloc(iterations * sizeof(uint64_t));
+    if (!latencies) {
+        printf("Error: Memory allocation failed\n");
+        return 1;
+    }
+
+    // Accumulate outputs so the compiler cannot drop the inference calls
+    volatile float sink = 0.0f;
+    float output;
+
+    for (int j = 0; j < SERIES_PERIOD + TIME_SERIES_MODEL_WINDOW - 1; j++) {
+        series[j] = (float)(j % SERIES_PERIOD);
+    }
+
+    time_series_model_init();
+
+    printf("Warming up with %ld inferences...\n", warmup);
+    for (long i = 0; i < warmup; i++) {
+        time_series_model_run(sample_input(i), &output);
+        sink += output;
+    }
+
+    // Throughput: one timer around the whole loop
+    printf("Measuring throughput over %ld inferences...\n", iterations);
+    uint64_t start = now_ns();
+    for (long i = 0; i < iterations; i++) {
+        time_series_model_run(sample_input(i), &output);
+        sink += output;
+    }
+    uint64_t total_ns = now_ns() - start;
+
+    // Latency distribution: one timer around each call
+    printf("Measuring latency distribution over %ld inferences...\n", iterations);
+    for (long i = 0; i < iterations; i++) {
+        const float* input = sample_input(i);
+        uint64_t t0 = now_ns();
+        time_series_model_run(input, &output);
+        latencies[i] = now_ns() - t0;
+        sink += output;
+    }
+
+    time_series_model_terminate();
+
+    qsort(latencies, iterations, sizeof(uint64_t), compare_u64);
+
+    double ns_per_inference = (double)total_ns / iterations;
+    double samples_per_sec = iterations / (total_ns * 1e-9);
+
+    printf("--------------------------------------------------\n");
+    printf("ns/inference:   %.2f\n", ns_per_inference);
+    printf("p50 latency:    %llu ns\n", (unsigned long long)percentile(latencies, iterations, 0.50));
+    printf("p99 latency:    %llu ns\n", (unsigned long long)percentile(latencies, iterations, 0.99));
+    printf("p99.9 latency:  %llu ns\n", (unsigned long long)percentile(latencies, iterations, 0.999));
+    printf("max latency:    %llu ns\n", (unsigned long long)latencies[iterations - 1]);
+    printf("Throughput:     %.0f samples/sec\n", samples_per_sec);
+
+    FILE* json_file = fopen("benchmark_results.json", "w");
+    if (!json_file) {
+        printf("Error: Could not write benchmark_results.json\n");
+        free(latencies);
+        return 1;
+    }
+    fprintf(json_file, "{\n");
+    fprintf(json_file, "  \"iterations\": %ld,\n", iterations);
+    fprintf(json_file, "  \"warmup\": %ld,\n", warmup);
+    fprintf(json_file, "  \"ns_per_inference\": %.3f,\n", ns_per_inference);
+    fprintf(json_file, "  \"p50_ns\": %llu,\n", (unsigned long long)percentile(latencies, iterations, 0.50));
+    fprintf(json_file, "  \"p99_ns\": %llu,\n", (unsigned long long)percentile(latencies, iterations, 0.99));
+    fprintf(json_file, "  \"p999_ns\": %llu,\n", (unsigned long long)percentile(latencies, iterations, 0.999));
+    fprintf(json_file, "  \"max_ns\": %llu,\n", (unsigned long long)latencies[iterations - 1]);
+    fprintf(json_file, "  \"samples_per_sec\": %.1f\n", samples_per_sec);
+    fprintf(json_file, "}\n");
+    fclose(json_file);
+
+    free(latencies);
+    printf("\nBenchmark completed (checksum %f)\n", (double)sink);
+    return 0;
+}
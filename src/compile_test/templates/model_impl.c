@@ -1,30 +1,82 @@
 #include "time_series_model.h"
 
+/* Models converted as part of a model family have prefixed entry symbols */
+#ifndef TIME_SERIES_MODEL_ENTRY
+#define TIME_SERIES_MODEL_ENTRY entry
+#endif
+
+#ifdef TIME_SERIES_MODEL_HAVE_BATCH
+#include "time_series_model_batch.h"
+#endif
+
+#define WINDOW TIME_SERIES_MODEL_WINDOW
+
 /* 
  * This is the entry point function generated by onnx2c.
- * It expects input as a 2D array [1][1] and outputs to a 2D array [1][1].
+ * It expects input as a 2D array [1][WINDOW] and outputs to a 2D array [1][1].
+ */
+extern void TIME_SERIES_MODEL_ENTRY(const float input[1][WINDOW], float output[1][1]);
+
+/*
+ * Streaming window: every reading is stored twice, WINDOW floats apart, so the latest
+ * WINDOW readings are always contiguous at window_buffer + window_pos and can be passed
+ * to the entry function directly. A push is two stores, with no shifting of the window.
  */
-extern void entry(const float input[1][1], float output[1][1]);
+static float window_buffer[2 * WINDOW];
+static size_t window_pos;
+static size_t window_count;
 
 void time_series_model_init(void) {
-    /* No initialization needed for this model */
+    time_series_model_reset();
 }
 
 void time_series_model_run(const float* input_data, float* output_data) {
     /* 
-     * The entry function expects 2D arrays, but our API uses simple pointers.
-     * We need to reshape the data accordingly.
+     * The entry function expects 2D arrays, but a contiguous float buffer has
+     * the same layout, so the pointers are passed through without copying.
      */
-    float input_reshaped[1][1] = {{*input_data}};  /* Convert single value to 2D array */
-    float output_reshaped[1][1];
-    
-    /* Call the generated model function */
-    entry(input_reshaped, output_reshaped);
-    
-    /* Copy the result back to the output pointer */
-    *output_data = output_reshaped[0][0];
+    TIME_SERIES_MODEL_ENTRY((const float (*)[WINDOW])input_data, (float (*)[1])output_data);
+}
+
+void time_series_model_run_batch(const float* input_data, float* output_data, size_t n) {
+    size_t i = 0;
+
+#ifdef TIME_SERIES_MODEL_HAVE_BATCH
+    /* Full batches go through the kernel generated with a fixed batch_size */
+    for (; i + TIME_SERIES_MODEL_BATCH_SIZE <= n; i += TIME_SERIES_MODEL_BATCH_SIZE) {
+        TIME_SERIES_MODEL_ENTRY_BATCH((const float (*)[WINDOW])(input_data + i * WINDOW),
+                                      (float (*)[1])(output_data + i));
+    }
+#endif
+
+    /* Remaining samples go through the single-sample kernel */
+    for (; i < n; i++) {
+        TIME_SERIES_MODEL_ENTRY((const float (*)[WINDOW])(input_data + i * WINDOW), (float (*)[1])(output_data + i));
+    }
+}
+
+int time_series_model_push(float sample, float* output_data) {
+    window_buffer[window_pos] = sample;
+    window_buffer[window_pos + WINDOW] = sample;
+    window_pos = window_pos + 1 == WINDOW ? 0 : window_pos + 1;
+    if (window_count < WINDOW && ++window_count < WINDOW) {
+        return 0;
+    }
+
+    /* After the increment, window_pos is the oldest reading of the window */
+    TIME_SERIES_MODEL_ENTRY((const float (*)[WINDOW])(window_buffer + window_pos), (float (*)[1])output_data);
+    return 1;
+}
+
+void time_series_model_reset(void) {
+    window_pos = 0;
+    window_count = 0;
+}
+
+size_t time_series_model_window(void) {
+    return WINDOW;
 }
 
 void time_series_model_terminate(void) {
     /* No cleanup needed for this model */
-}
\ No newline at end of file
+}
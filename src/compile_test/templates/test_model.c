@@ -1,143 +1,453 @@
+#define _POSIX_C_SOURCE 199309L
 #include <stdio.h>
 #include <stdlib.h>
+#include <stdint.h>
+#include <string.h>
 #include <math.h>
+#include <time.h>
 #include "time_series_model.h"
 
-// Function to read CSV file containing float values
-float* read_csv(const char* filename, int* size) {
-    // Add debug message to see what's happening
-    printf("Attempting to open file: %s\n", filename);
+#ifdef TIME_SERIES_MODEL_PROFILE
+// Defined by the instrumented model code of the profiling build
+extern void time_series_model_profile_write(const char* path);
+#endif
+
+// Total number of samples run through each API when measuring throughput
+#define THROUGHPUT_SAMPLES 1000000
+// Number of samples passed to a single time_series_model_run_batch call
+#define BLOCK_SAMPLES 4096
+// Largest allowed difference between the batch, streaming and per-sample outputs (set by compile_test)
+#ifndef CONSISTENCY_TOLERANCE
+#define CONSISTENCY_TOLERANCE 1e-4f
+#endif
+
+#ifdef TIME_SERIES_MODEL_HAVE_BATCH
+#include "time_series_model_batch.h"
+#endif
+
+static double now_seconds(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+// Binary test data layout written by the training step (little-endian):
+//   char magic[4] = "TSDF", uint32 version, uint64 rows, uint32 columns, uint32 reserved,
+//   followed by rows * columns float32 values
+#define BINARY_MAGIC "TSDF"
+#define BINARY_VERSION 1
+#define BINARY_HEADER_SIZE 24
+
+// Number of samples read, run and compared at a time
+#define CHUNK_SAMPLES 4096
+// Values per input sample (one window of readings, oldest first)
+#define WINDOW TIME_SERIES_MODEL_WINDOW
+
+// A test data file read incrementally, either raw float32 binary or CSV
+typedef struct {
+    FILE* file;
+    int binary;
+    unsigned long long remaining;  // Values left in a binary file
+} SampleStream;
+
+// Open the binary file if present (it avoids text parsing), otherwise the CSV file
+static int open_binary(SampleStream* stream, const char* filename, uint32_t expected_columns) {
+    unsigned char header[BINARY_HEADER_SIZE];
+    uint32_t version, columns;
+    uint64_t rows;
     
-    FILE* file = fopen(filename, "r");
+    FILE* file = fopen(filename, "rb");
     if (!file) {
-        printf("Error: Could not open file %s\n", filename);
-        return NULL;
+        return 0;
     }
     
-    printf("Successfully opened file\n");
-    
-    // Count lines first to allocate proper memory
-    int count = 0;
-    char buffer[100];
-    
-    // More reliable way to count lines
-    while (fgets(buffer, sizeof(buffer), file)) {
-        count++;
+    if (fread(header, 1, BINARY_HEADER_SIZE, file) != BINARY_HEADER_SIZE ||
+        memcmp(header, BINARY_MAGIC, 4) != 0) {
+        printf("Error: %s is not a test data binary file\n", filename);
+        fclose(file);
+        return 0;
     }
     
-    printf("Found %d lines in file\n", count);
-    
-    // Reset file position
-    rewind(file);
-    
-    // Allocate memory
-    float* data = (float*)malloc(count * sizeof(float));
-    if (!data) {
-        printf("Error: Memory allocation failed\n");
+    memcpy(&version, header + 4, sizeof(version));
+    memcpy(&rows, header + 8, sizeof(rows));
+    memcpy(&columns, header + 16, sizeof(columns));
+    if (version != BINARY_VERSION || columns != expected_columns) {
+        printf("Error: unsupported test data file %s (version %u, %u columns, expected %u)\n",
+               filename, (unsigned)version, (unsigned)columns, (unsigned)expected_columns);
         fclose(file);
-        return NULL;
+        return 0;
     }
     
-    // Read data
-    int i = 0;
-    while (fgets(buffer, sizeof(buffer), file) && i < count) {
-        // Convert string to float
-        data[i++] = atof(buffer);
+    stream->file = file;
+    stream->binary = 1;
+    stream->remaining = rows * columns;
+    printf("Streaming %llu rows from %s\n", (unsigned long long)rows, filename);
+    return 1;
+}
+
+static int open_stream(SampleStream* stream, const char* name, uint32_t columns) {
+    char filename[256];
+    // Try current directory first, then the parent directory
+    const char* prefixes[] = {"", "../"};
+    
+    for (int i = 0; i < 2; i++) {
+        snprintf(filename, sizeof(filename), "%s%s.bin", prefixes[i], name);
+        if (open_binary(stream, filename, columns)) {
+            return 1;
+        }
+        
+        snprintf(filename, sizeof(filename), "%s%s.csv", prefixes[i], name);
+        printf("Attempting to open file: %s\n", filename);
+        stream->file = fopen(filename, "r");
+        if (stream->file) {
+            stream->binary = 0;
+            stream->remaining = 0;
+            printf("Streaming values from %s\n", filename);
+            return 1;
+        }
     }
     
-    fclose(file);
-    *size = count;
+    printf("Error: Could not open %s.bin or %s.csv\n", name, name);
+    return 0;
+}
+
+// Read up to max_count values into buffer, returns the number of values read.
+// CSV rows may hold several comma-separated values; max_count must be a multiple of the row length.
+static size_t read_stream(SampleStream* stream, float* buffer, size_t max_count) {
+    if (stream->binary) {
+        size_t count = stream->remaining < max_count ? (size_t)stream->remaining : max_count;
+        count = fread(buffer, sizeof(float), count, stream->file);
+        stream->remaining -= count;
+        return count;
+    }
     
-    printf("Successfully loaded %d values\n", count);
-    return data;
+    char line[4096];
+    size_t count = 0;
+    while (count < max_count && fgets(line, sizeof(line), stream->file)) {
+        char* cursor = line;
+        char* end;
+        for (float value = strtof(cursor, &end); end != cursor && count < max_count; value = strtof(cursor, &end)) {
+            buffer[count++] = value;
+            cursor = *end == ',' ? end + 1 : end;
+        }
+    }
+    return count;
 }
 
-int main() {
-    printf("Testing the time series neural network model\n");
+// Write a binary header for a single-column file with the given number of rows
+static int write_binary_header(FILE* file, uint64_t rows) {
+    unsigned char header[BINARY_HEADER_SIZE] = {0};
+    uint32_t version = BINARY_VERSION, columns = 1;
     
-    // Try current directory first (instead of parent directory)
-    int input_size = 0, output_size = 0;
-    float* test_inputs = read_csv("test_input.csv", &input_size);
+    memcpy(header, BINARY_MAGIC, 4);
+    memcpy(header + 4, &version, sizeof(version));
+    memcpy(header + 8, &rows, sizeof(rows));
+    memcpy(header + 16, &columns, sizeof(columns));
+    return fwrite(header, 1, BINARY_HEADER_SIZE, file) == BINARY_HEADER_SIZE;
+}
+
+// Replay the stream_input readings one at a time through time_series_model_push, as a device
+// would consume sensor data. Every streamed output is checked against time_series_model_run on
+// the same window of the readings. The readings are replayed in chunks, each behind the last
+// WINDOW - 1 readings of the previous one, so streams of any length are checked in full.
+// Returns the number of outputs, 0 if there is no stream data and -1 on error.
+static long long replay_stream(float* max_stream_diff, float* stream_error, double* stream_rate) {
+    SampleStream input_stream, expected_stream;
+    if (!open_stream(&input_stream, "stream_input", 1)) {
+        return 0;
+    }
+    int have_expected = open_stream(&expected_stream, "stream_expected", 1);
     
-    // If that fails, try the parent directory
-    if (!test_inputs) {
-        printf("Trying parent directory...\n");
-        test_inputs = read_csv("../test_input.csv", &input_size);
+    long long result = -1, produced = 0, compared = 0;
+    size_t total = 0, carried = 0;
+    double total_error = 0.0, push_seconds = 0.0;
+    float* readings = (float*)malloc((WINDOW - 1 + CHUNK_SAMPLES) * sizeof(float));
+    float* expected = (float*)malloc(CHUNK_SAMPLES * sizeof(float));
+    float* outputs = (float*)malloc(CHUNK_SAMPLES * sizeof(float));
+    if (!readings || !expected || !outputs) {
+        printf("Error: Memory allocation failed\n");
+        goto done;
     }
     
-    float* expected_outputs = NULL;
-    if (test_inputs) {
-        // Use the same directory that worked for inputs
-        if (input_size > 0) {
-            expected_outputs = read_csv("expected_output.csv", &output_size);
-            if (!expected_outputs) {
-                expected_outputs = read_csv("../expected_output.csv", &output_size);
+    *max_stream_diff = 0.0f;
+    time_series_model_reset();
+    for (;;) {
+        size_t count = read_stream(&input_stream, readings + carried, CHUNK_SAMPLES);
+        size_t expected_count = have_expected ? read_stream(&expected_stream, expected, count ? count : 1) : count;
+        if (count != expected_count) {
+            printf("Error: stream_input and stream_expected size mismatch (%zu vs %zu readings)\n",
+                   total + count, total + expected_count);
+            goto done;
+        }
+        if (count == 0) {
+            break;
+        }
+        
+        // Time the pushes on their own, the outputs are checked afterwards
+        double start = now_seconds();
+        for (size_t i = 0; i < count; i++) {
+            produced += time_series_model_push(readings[carried + i], &outputs[i]);
+        }
+        push_seconds += now_seconds() - start;
+        
+        // Output i is the prediction for the window of readings ending at reading i
+        for (size_t i = 0; i < count; i++) {
+            if (total + i < WINDOW - 1) {
+                continue;
+            }
+            float output = 0.0f;
+            time_series_model_run(&readings[carried + i + 1 - WINDOW], &output);
+            float diff = fabs(output - outputs[i]);
+            if (diff > *max_stream_diff) {
+                *max_stream_diff = diff;
+            }
+            if (have_expected) {
+                total_error += fabs(outputs[i] - expected[i]);
+                compared++;
             }
         }
+        
+        // Keep the end of this chunk as the start of the windows of the next one
+        size_t keep = carried + count < WINDOW - 1 ? carried + count : WINDOW - 1;
+        memmove(readings, readings + carried + count - keep, keep * sizeof(float));
+        carried = keep;
+        total += count;
+    }
+    *stream_rate = push_seconds > 0.0 ? total / push_seconds : 0.0;
+    *stream_error = compared ? (float)(total_error / compared) : 0.0f;
+    
+    if (produced != (total >= WINDOW ? (long long)(total - WINDOW + 1) : 0)) {
+        printf("Error: time_series_model_push produced %lld outputs for %zu readings\n", produced, total);
+        goto done;
     }
+    result = produced;
+    
+done:
+    free(readings);
+    free(expected);
+    free(outputs);
+    fclose(input_stream.file);
+    if (have_expected) {
+        fclose(expected_stream.file);
+    }
+    return result;
+}
+
+int main() {
+    printf("Testing the time series neural network model\n");
     
-    if (!test_inputs || !expected_outputs) {
+    SampleStream input_stream, expected_stream;
+    if (!open_stream(&input_stream, "test_input", WINDOW)) {
         printf("Failed to read test data\n");
         return 1;
     }
+    if (!open_stream(&expected_stream, "expected_output", 1)) {
+        printf("Failed to read test data\n");
+        fclose(input_stream.file);
+        return 1;
+    }
     
-    if (input_size != output_size) {
-        printf("Error: Input and output size mismatch (%d vs %d)\n", 
-               input_size, output_size);
-        free(test_inputs);
-        free(expected_outputs);
+    // Only one chunk of each file is held in memory at a time
+    float* chunk_inputs = (float*)malloc(CHUNK_SAMPLES * WINDOW * sizeof(float));
+    float* chunk_expected = (float*)malloc(CHUNK_SAMPLES * sizeof(float));
+    float* chunk_outputs = (float*)malloc(CHUNK_SAMPLES * sizeof(float));
+    // The first chunk of inputs is kept for the throughput measurement
+    float* first_inputs = (float*)malloc(CHUNK_SAMPLES * WINDOW * sizeof(float));
+    if (!chunk_inputs || !chunk_expected || !chunk_outputs || !first_inputs) {
+        printf("Error: Memory allocation failed\n");
         return 1;
     }
     
-    printf("Successfully loaded %d test samples\n", input_size);
+    // Raw predictions for every sample, compared against the reference outputs by run.py.
+    // The row count in the header is filled in once all chunks have been written.
+    FILE* output_file = fopen("model_output.bin", "wb");
+    if (!output_file || !write_binary_header(output_file, 0)) {
+        printf("Error: Could not write model_output.bin\n");
+        return 1;
+    }
     
     // Initialize the model
     time_series_model_init();
     
     // Test model with each input
-    float total_error = 0.0f;
-    int display_count = input_size < 5 ? input_size : 5;
+    double total_error = 0.0;
+    long long input_size = 0;
+    size_t first_count = 0;
+    int display_count = 5;
     
     printf("\nDisplaying first %d results:\n", display_count);
     printf("--------------------------------------------------\n");
     printf("   Input   |   Expected   |   Predicted   | Error  \n");
     printf("--------------------------------------------------\n");
     
-    for (int i = 0; i < input_size; i++) {
-        float input = test_inputs[i];
-        float expected = expected_outputs[i];
-        float output = 0.0f;
+    for (;;) {
+        size_t count = read_stream(&input_stream, chunk_inputs, CHUNK_SAMPLES * WINDOW) / WINDOW;
+        size_t expected_count = read_stream(&expected_stream, chunk_expected, count ? count : 1);
+        
+        if (count != expected_count) {
+            printf("Error: Input and output size mismatch (%lld vs %lld)\n",
+                   input_size + (long long)count, input_size + (long long)expected_count);
+            return 1;
+        }
+        if (count == 0) {
+            break;
+        }
+        
+        if (input_size == 0) {
+            memcpy(first_inputs, chunk_inputs, count * WINDOW * sizeof(float));
+            first_count = count;
+        }
         
-        // Run model inference
-        time_series_model_run(&input, &output);
+        // Run model inference over the chunk
+        time_series_model_run_batch(chunk_inputs, chunk_outputs, count);
         
-        // Calculate error
-        float error = fabs(output - expected);
-        total_error += error;
+        if (fwrite(chunk_outputs, sizeof(float), count, output_file) != count) {
+            printf("Error: Could not write model_output.bin\n");
+            return 1;
+        }
         
-        // Print first few results
-        if (i < display_count) {
-            printf("%10.4f | %12.4f | %13.4f | %6.4f\n", 
-                   input, expected, output, error);
+        for (size_t i = 0; i < count; i++) {
+            // Calculate error
+            float error = fabs(chunk_outputs[i] - chunk_expected[i]);
+            total_error += error;
+            
+            // Print first few results, with the newest reading of each window
+            if (input_size + (long long)i < display_count) {
+                printf("%10.4f | %12.4f | %13.4f | %6.4f\n", 
+                       chunk_inputs[i * WINDOW + WINDOW - 1], chunk_expected[i], chunk_outputs[i], error);
+            }
         }
+        input_size += count;
+    }
+    
+    fclose(input_stream.file);
+    fclose(expected_stream.file);
+    
+    rewind(output_file);
+    write_binary_header(output_file, (uint64_t)input_size);
+    fclose(output_file);
+    free(chunk_expected);
+    free(chunk_outputs);
+    free(chunk_inputs);
+    
+    if (input_size == 0) {
+        printf("Failed to read test data\n");
+        return 1;
     }
     
     // Print summary
-    float avg_error = total_error / input_size;
+    float avg_error = (float)(total_error / input_size);
     printf("--------------------------------------------------\n");
+    printf("Tested %lld samples\n", input_size);
     printf("Average prediction error: %f\n", avg_error);
 
+    // Tile the test inputs into a larger block so that the batched kernel gets full batches,
+    // even when the test set is smaller than a single batch
+    size_t block_samples = BLOCK_SAMPLES;
+#ifdef TIME_SERIES_MODEL_HAVE_BATCH
+    if (block_samples < TIME_SERIES_MODEL_BATCH_SIZE) {
+        block_samples = TIME_SERIES_MODEL_BATCH_SIZE;
+    }
+#endif
+    float* block_inputs = (float*)malloc(block_samples * WINDOW * sizeof(float));
+    float* block_outputs = (float*)malloc(block_samples * sizeof(float));
+    if (!block_inputs || !block_outputs) {
+        printf("Error: Memory allocation failed\n");
+        free(first_inputs);
+        free(block_inputs);
+        free(block_outputs);
+        return 1;
+    }
+    for (size_t i = 0; i < block_samples; i++) {
+        memcpy(&block_inputs[i * WINDOW], &first_inputs[i % first_count * WINDOW], WINDOW * sizeof(float));
+    }
+    
+    // Check that the batch API matches per-sample inference
+    time_series_model_run_batch(block_inputs, block_outputs, block_samples);
+    
+    float max_batch_diff = 0.0f;
+    for (size_t i = 0; i < block_samples; i++) {
+        float output = 0.0f;
+        time_series_model_run(&block_inputs[i * WINDOW], &output);
+        float diff = fabs(output - block_outputs[i]);
+        if (diff > max_batch_diff) {
+            max_batch_diff = diff;
+        }
+    }
+    printf("Max difference between batch and per-sample outputs: %g\n", max_batch_diff);
+    if (!(max_batch_diff <= CONSISTENCY_TOLERANCE)) {
+        printf("Error: Batch outputs differ from per-sample outputs by more than %g\n", (double)CONSISTENCY_TOLERANCE);
+        return 1;
+    }
+    
+    // Compare throughput of the per-sample and batch paths over repeated passes of the block
+    size_t passes = THROUGHPUT_SAMPLES / block_samples + 1;
+    double total_samples = (double)passes * block_samples;
+    
+    double start = now_seconds();
+    for (size_t p = 0; p < passes; p++) {
+        for (size_t i = 0; i < block_samples; i++) {
+            time_series_model_run(&block_inputs[i * WINDOW], &block_outputs[i]);
+        }
+    }
+    double single_rate = total_samples / (now_seconds() - start);
+    
+    start = now_seconds();
+    for (size_t p = 0; p < passes; p++) {
+        time_series_model_run_batch(block_inputs, block_outputs, block_samples);
+    }
+    double batch_rate = total_samples / (now_seconds() - start);
+    
+    printf("Per-sample throughput: %.0f samples/sec\n", single_rate);
+    printf("Batch throughput: %.0f samples/sec\n", batch_rate);
+    printf("Batch speedup: %.2fx\n", batch_rate / single_rate);
+
+    // Replay the readings as a stream through the push API
+    float max_stream_diff = 0.0f, stream_error = 0.0f;
+    double stream_rate = 0.0;
+    long long stream_outputs = replay_stream(&max_stream_diff, &stream_error, &stream_rate);
+    if (stream_outputs < 0) {
+        return 1;
+    }
+    if (stream_outputs > 0) {
+        printf("Streamed %lld outputs (window of %d readings)\n", stream_outputs, WINDOW);
+        printf("Max difference between streaming and windowed outputs: %g\n", max_stream_diff);
+        printf("Streaming average prediction error: %f\n", stream_error);
+        printf("Streaming throughput: %.0f readings/sec\n", stream_rate);
+        if (!(max_stream_diff <= CONSISTENCY_TOLERANCE)) {
+            printf("Error: Streaming outputs differ from windowed outputs by more than %g\n",
+                   (double)CONSISTENCY_TOLERANCE);
+            return 1;
+        }
+    } else {
+        printf("No stream_input data, skipping the streaming replay\n");
+    }
+
     // Write results to output file
     FILE* result_file = fopen("test_results.txt", "w");
     if (result_file) {
         fprintf(result_file, "Average prediction error: %f\n", avg_error);
+        fprintf(result_file, "Max batch vs per-sample difference: %g\n", max_batch_diff);
+        fprintf(result_file, "Per-sample throughput: %.0f samples/sec\n", single_rate);
+        fprintf(result_file, "Batch throughput: %.0f samples/sec\n", batch_rate);
+        fprintf(result_file, "Batch speedup: %.2fx\n", batch_rate / single_rate);
+        if (stream_outputs > 0) {
+            fprintf(result_file, "Max streaming vs windowed difference: %g\n", max_stream_diff);
+            fprintf(result_file, "Streaming average prediction error: %f\n", stream_error);
+            fprintf(result_file, "Streaming throughput: %.0f readings/sec\n", stream_rate);
+        }
         fclose(result_file);
     }
     
+#ifdef TIME_SERIES_MODEL_PROFILE
+    time_series_model_profile_write("profile_counters.csv");
+#endif
+
     // Clean up
     time_series_model_terminate();
-    free(test_inputs);
-    free(expected_outputs);
+    free(first_inputs);
+    free(block_inputs);
+    free(block_outputs);
     
     printf("\nTest completed successfully!\n");
     return 0;
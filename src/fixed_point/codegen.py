@@ -0,0 +1,239 @@
+"""
+Fixed-point code generation for FPU-less targets.
+The dense layers of the exported graph (Gemm, or MatMul followed by Add, each optionally followed
+by Relu) are turned into integer C: Q15 activations and weights with 32-bit accumulators, or Q31
+with 64-bit accumulators. Every tensor gets a power-of-two scale chosen from calibration ranges,
+the accumulators are given enough guard bits that they cannot overflow, and layer outputs
+saturate to the activation range. simulate() is a bit-exact NumPy model of the generated code.
+"""
+import math
+import numpy as np
+from common.dense_layers import float_forward
+
+# Activation/weight bits, accumulator bits and C types of each format
+FORMATS = {
+    "q15": {"bits": 16, "accumulator_bits": 32, "ctype": "int16_t", "accumulator_ctype": "int32_t"},
+    "q31": {"bits": 32, "accumulator_bits": 64, "ctype": "int32_t", "accumulator_ctype": "int64_t"},
+}
+
+def frac_bits(max_abs, bits, margin):
+    """Return the fraction bits of the largest power-of-two scale that holds max_abs * margin below 2^(bits - 1)."""
+    if max_abs <= 0:
+        return bits - 1
+    return bits - 1 - (math.floor(math.log2(max_abs * margin)) + 1)
+
+def choose_formats(layers, inputs, fmt, margin):
+    """
+    Set the fraction bits of the input, weights and output of every layer from calibration inputs.
+    Weights use as many bits as fit both the activation type and the accumulator headroom.
+    Returns the input fraction bits.
+    """
+    bits = FORMATS[fmt]["bits"]
+    accumulator_bits = FORMATS[fmt]["accumulator_bits"]
+    input_frac = frac_bits(float(np.max(np.abs(inputs))) if np.size(inputs) else 0.0, bits, margin)
+
+    x_frac = input_frac
+    for layer, output in zip(layers, float_forward(layers, inputs)):
+        weight_frac = frac_bits(float(np.max(np.abs(layer["weight"]))), bits, 1.0)
+        # Worst case accumulator over the whole input range, with one guard bit for the rounding
+        x_max = 2.0 ** (bits - 1 - x_frac)
+        bound = float(np.max(x_max * np.sum(np.abs(layer["weight"]), axis=1) + np.abs(layer["bias"])))
+        if bound > 0:
+            weight_frac = min(weight_frac, accumulator_bits - 2 - x_frac - (math.floor(math.log2(bound)) + 1))
+
+        layer["input_frac"] = x_frac
+        layer["weight_frac"] = weight_frac
+        layer["output_frac"] = frac_bits(float(np.max(np.abs(output))) if output.size else 0.0, bits, margin)
+        layer["shift"] = x_frac + weight_frac - layer["output_frac"]
+        x_frac = layer["output_frac"]
+    return input_frac
+
+def to_fixed(values, frac, bits):
+    """Round values to fixed point with frac fraction bits, saturating to the signed range of bits."""
+    limit = 2 ** (bits - 1)
+    return np.clip(np.round(np.asarray(values, dtype=np.float64) * 2.0 ** frac), -limit, limit - 1).astype(np.int64)
+
+def quantized_parameters(layer, bits):
+    """Return the integer weight (activation type) and bias (accumulator scale) of a layer."""
+    weight = to_fixed(layer["weight"], layer["weight_frac"], bits)
+    bias = np.round(layer["bias"] * 2.0 ** (layer["input_frac"] + layer["weight_frac"])).astype(np.int64)
+    return weight, bias
+
+def simulate(layers, fixed_inputs, fmt):
+    """Run the generated integer arithmetic in NumPy. Returns (fixed outputs, saturation count)."""
+    bits = FORMATS[fmt]["bits"]
+    limit = 2 ** (bits - 1)
+    x = np.asarray(fixed_inputs, dtype=np.int64)
+    saturations = 0
+    for layer in layers:
+        weight, bias = quantized_parameters(layer, bits)
+        # The headroom in choose_formats keeps q31 accumulators within int64 as well
+        acc = x @ weight.T + bias
+        if layer["relu"]:
+            acc = np.maximum(acc, 0)
+        shift = layer["shift"]
+        if shift > 0:
+            acc = (acc + (1 << (shift - 1))) >> shift
+        elif shift < 0:
+            # Values that would overflow the left shift are pushed just outside the range to saturate
+            high, low = (limit - 1) >> -shift, -limit >> -shift
+            acc = np.where(acc > high, limit, np.where(acc < low, -limit - 1, acc << -shift))
+        saturations += int(np.count_nonzero((acc < -limit) | (acc > limit - 1)))
+        x = np.clip(acc, -limit, limit - 1)
+    return x, saturations
+
+def c_array(values):
+    """Format an integer array as a C initializer."""
+    values = np.asarray(values)
+    if values.ndim == 1:
+        return "{" + ", ".join(str(int(v)) for v in values) + "}"
+    return "{\n    " + ",\n    ".join(c_array(row) for row in values) + "\n}"
+
+def generate_source(layers, fmt, source_name):
+    """Return the C source of the fixed-point model."""
+    spec = FORMATS[fmt]
+    ctype, acc_ctype = "time_series_model_fixed_t", spec["accumulator_ctype"]
+    lines = [
+        f"/* Generated by fixed_point/run.py from {source_name}: {fmt.upper()} activations and weights, */",
+        f"/* {spec['accumulator_bits']}-bit accumulators. No floating point is used. */",
+        "#include <stdint.h>",
+        "#include <stddef.h>",
+        '#include "time_series_model_fixed.h"',
+        "",
+        "#define FIXED_MAX ((" + acc_ctype + f")INT{spec['bits']}_MAX)",
+        "#define FIXED_MIN ((" + acc_ctype + f")INT{spec['bits']}_MIN)",
+        "",
+        "/* Build with TIME_SERIES_MODEL_FIXED_COUNT_SATURATION to count the outputs clipped to the Q range */",
+        "#ifdef TIME_SERIES_MODEL_FIXED_COUNT_SATURATION",
+        "uint32_t time_series_model_fixed_saturations;",
+        "#define SATURATED() (time_series_model_fixed_saturations++)",
+        "#else",
+        "#define SATURATED() ((void)0)",
+        "#endif",
+        "",
+        f"static inline {ctype} saturate({acc_ctype} value) {{",
+        "    if (value > FIXED_MAX) {",
+        "        SATURATED();",
+        "        return (" + ctype + ")FIXED_MAX;",
+        "    }",
+        "    if (value < FIXED_MIN) {",
+        "        SATURATED();",
+        "        return (" + ctype + ")FIXED_MIN;",
+        "    }",
+        f"    return ({ctype})value;",
+        "}",
+        "",
+    ]
+
+    for index, layer in enumerate(layers):
+        weight, bias = quantized_parameters(layer, spec["bits"])
+        rows, columns = weight.shape
+        shift = layer["shift"]
+        lines += [
+            f"/* Layer {index}: {columns} -> {rows}{', ReLU' if layer['relu'] else ''}. "
+            f"Input Q{layer['input_frac']}, weights Q{layer['weight_frac']}, output Q{layer['output_frac']} */",
+            f"static const {spec['ctype']} layer{index}_weight[{rows}][{columns}] = {c_array(weight)};",
+            f"static const {acc_ctype} layer{index}_bias[{rows}] = {c_array(bias)};",
+            "",
+            f"static void layer{index}(const {ctype} x[{columns}], {ctype} y[{rows}]) {{",
+            f"    for (int n = 0; n < {rows}; n++) {{",
+            f"        {acc_ctype} acc = layer{index}_bias[n];",
+            f"        for (int k = 0; k < {columns}; k++) {{",
+            f"            acc += ({acc_ctype})layer{index}_weight[n][k] * x[k];",
+            "        }",
+        ]
+        if layer["relu"]:
+            lines += [
+                "        if (acc < 0) {",
+                "            acc = 0;",
+                "        }",
+            ]
+        if shift > 0:
+            lines.append(f"        acc = (acc + (({acc_ctype})1 << {shift - 1})) >> {shift};")
+        elif shift < 0:
+            lines.append(f"        acc = acc > (FIXED_MAX >> {-shift}) ? FIXED_MAX + 1 : acc < (FIXED_MIN >> {-shift}) ? "
+                         f"FIXED_MIN - 1 : acc * (({acc_ctype})1 << {-shift});")
+        lines += [
+            "        y[n] = saturate(acc);",
+            "    }",
+            "}",
+            "",
+        ]
+
+    window = layers[0]["weight"].shape[1]
+    lines += [
+        f"void time_series_model_fixed_run(const {ctype} input[{window}], {ctype} output[1]) {{",
+    ]
+    previous = "input"
+    for index, layer in enumerate(layers):
+        rows = layer["weight"].shape[0]
+        if index == len(layers) - 1:
+            lines.append(f"    layer{index}({previous}, output);")
+        else:
+            lines += [f"    {ctype} a{index}[{rows}];", f"    layer{index}({previous}, a{index});"]
+            previous = f"a{index}"
+    lines += [
+        "}",
+        "",
+        f"void time_series_model_fixed_run_batch(const {ctype}* input, {ctype}* output, size_t n) {{",
+        "    for (size_t i = 0; i < n; i++) {",
+        f"        time_series_model_fixed_run(input + i * {window}, output + i);",
+        "    }",
+        "}",
+    ]
+    return "\n".join(lines) + "\n"
+
+def generate_header(layers, fmt, input_frac):
+    """Return the header of the fixed-point model, with its Q formats."""
+    spec = FORMATS[fmt]
+    window = layers[0]["weight"].shape[1]
+    outputs = layers[-1]["weight"].shape[0]
+    if outputs != 1:
+        raise ValueError(f"Fixed-point generation supports models with one output value, this one has {outputs}")
+    output_frac = layers[-1]["output_frac"]
+    return f"""#ifndef TIME_SERIES_MODEL_FIXED_H
+#define TIME_SERIES_MODEL_FIXED_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+#ifdef __cplusplus
+extern "C" {{
+#endif
+
+/* {fmt.upper()} values: a real value v is stored as round(v * 2^frac_bits) */
+typedef {spec['ctype']} time_series_model_fixed_t;
+
+#define TIME_SERIES_MODEL_FIXED_BITS {spec['bits']}
+#define TIME_SERIES_MODEL_FIXED_WINDOW {window}
+#define TIME_SERIES_MODEL_FIXED_INPUT_FRAC_BITS {input_frac}
+#define TIME_SERIES_MODEL_FIXED_OUTPUT_FRAC_BITS {output_frac}
+#define TIME_SERIES_MODEL_FIXED_INPUT_SCALE {float(2.0 ** input_frac)!r}
+#define TIME_SERIES_MODEL_FIXED_OUTPUT_SCALE {float(2.0 ** output_frac)!r}
+
+/* Conversions for hosts and constants; they use floating point and do not saturate */
+#define TIME_SERIES_MODEL_FIXED_FROM_FLOAT(x) \\
+    ((time_series_model_fixed_t)((x) * TIME_SERIES_MODEL_FIXED_INPUT_SCALE + ((x) >= 0 ? 0.5 : -0.5)))
+#define TIME_SERIES_MODEL_FIXED_TO_FLOAT(q) ((float)(q) / TIME_SERIES_MODEL_FIXED_OUTPUT_SCALE)
+
+/**
+ * Run inference on one window of TIME_SERIES_MODEL_FIXED_WINDOW inputs, oldest first
+ *
+ * @param input Inputs with TIME_SERIES_MODEL_FIXED_INPUT_FRAC_BITS fraction bits
+ * @param output Prediction with TIME_SERIES_MODEL_FIXED_OUTPUT_FRAC_BITS fraction bits
+ */
+void time_series_model_fixed_run(const time_series_model_fixed_t input[TIME_SERIES_MODEL_FIXED_WINDOW],
+                                 time_series_model_fixed_t output[1]);
+
+/**
+ * Run inference over n contiguous windows
+ */
+void time_series_model_fixed_run_batch(const time_series_model_fixed_t* input, time_series_model_fixed_t* output,
+                                       size_t n);
+
+#ifdef __cplusplus
+}}
+#endif
+
+#endif /* TIME_SERIES_MODEL_FIXED_H */
+"""
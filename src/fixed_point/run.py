@@ -0,0 +1,132 @@
+"""
+Script for generating fixed-point C code from the trained model, as an alternative to onnx2c
+for microcontrollers without an FPU. This will run inside the AML pipeline.
+
+Soft-float emulation costs dozens of cycles per multiply-accumulate on parts such as the
+Cortex-M0, while the generated Q15 code only needs 16 x 16 -> 32 bit integer multiplies.
+The Q formats are calibrated on the test inputs saved by the training step, and the integer
+arithmetic is simulated here to report its error against the float model before any C is built.
+"""
+import os
+import sys
+import glob
+import json
+import argparse
+import numpy as np
+import onnx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.dense_layers import extract_layers, float_forward
+from common.fan_out import model_name
+from common.telemetry import Telemetry
+from common.test_data import load_binary
+from codegen import FORMATS, choose_formats, to_fixed, simulate, generate_source, generate_header
+
+# Range of the calibration inputs when there is no test data (the sample data's time steps 0..99)
+DEFAULT_INPUT_RANGE = (0.0, 100.0)
+
+def load_calibration_inputs(data_dir, window):
+    """Load the test inputs saved by the training step, or evenly spaced values over the default range."""
+    bin_path = os.path.join(data_dir, "test_input.bin") if data_dir else None
+    csv_path = os.path.join(data_dir, "test_input.csv") if data_dir else None
+    if bin_path and os.path.exists(bin_path):
+        return load_binary(bin_path)
+    if csv_path and os.path.exists(csv_path):
+        return np.loadtxt(csv_path, delimiter=",", dtype=np.float32, ndmin=2)
+    print(f"Warning: no test inputs found, calibrating on the range {DEFAULT_INPUT_RANGE}")
+    return np.repeat(np.linspace(*DEFAULT_INPUT_RANGE, 1000).reshape(-1, 1), window, axis=1).astype(np.float32)
+
+def generate(onnx_path, data_dir, output_dir, fmt, margin):
+    """Generate the fixed-point C code of one model and write fixed_point_report.json."""
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Generating {fmt.upper()} code for {os.path.basename(onnx_path)}...")
+    layers = extract_layers(onnx.load(onnx_path))
+    window = layers[0]["weight"].shape[1]
+
+    inputs = load_calibration_inputs(data_dir, window)
+    if inputs.shape[1] != window:
+        raise ValueError(f"The test inputs have {inputs.shape[1]} values per sample, the model takes {window}")
+    input_frac = choose_formats(layers, inputs, fmt, margin)
+
+    with open(os.path.join(output_dir, "time_series_model_fixed.c"), "w") as f:
+        f.write(generate_source(layers, fmt, os.path.basename(onnx_path)))
+    with open(os.path.join(output_dir, "time_series_model_fixed.h"), "w") as f:
+        f.write(generate_header(layers, fmt, input_frac))
+
+    # Error of the integer arithmetic against the float model on the calibration inputs
+    bits = FORMATS[fmt]["bits"]
+    fixed_outputs, saturations = simulate(layers, to_fixed(inputs, input_frac, bits), fmt)
+    outputs = fixed_outputs.astype(np.float64) / 2.0 ** layers[-1]["output_frac"]
+    abs_error = np.abs(outputs - float_forward(layers, inputs)[-1])
+
+    report = {
+        "model": os.path.basename(onnx_path),
+        "format": fmt,
+        "bits": bits,
+        "accumulator_bits": FORMATS[fmt]["accumulator_bits"],
+        "window": int(window),
+        "input_frac_bits": input_frac,
+        "output_frac_bits": layers[-1]["output_frac"],
+        "layers": [
+            {
+                "inputs": int(layer["weight"].shape[1]),
+                "outputs": int(layer["weight"].shape[0]),
+                "relu": layer["relu"],
+                "input_frac_bits": layer["input_frac"],
+                "weight_frac_bits": layer["weight_frac"],
+                "output_frac_bits": layer["output_frac"],
+                "shift": layer["shift"]
+            }
+            for layer in layers
+        ],
+        "calibration_samples": int(len(inputs)),
+        "simulated_vs_float": {
+            "max_abs_error": float(abs_error.max()) if abs_error.size else 0.0,
+            "mean_abs_error": float(abs_error.mean()) if abs_error.size else 0.0,
+            "saturations": saturations
+        }
+    }
+    with open(os.path.join(output_dir, "fixed_point_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{len(layers)} layers, input Q{input_frac}, output Q{layers[-1]['output_frac']}, simulated max abs "
+          f"error vs float {report['simulated_vs_float']['max_abs_error']:.3g}, {saturations} saturations")
+    return report
+
+def main():
+    # Parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir", type=str, help="Directory containing the ONNX models")
+    parser.add_argument("--data_dir", type=str, default=None,
+                        help="Directory containing the test inputs saved by the training step, for calibration")
+    parser.add_argument("--output_dir", type=str, help="Output directory for the fixed-point C code")
+    parser.add_argument("--format", type=str, choices=list(FORMATS), default="q15",
+                        help="q15: 16-bit values and 32-bit accumulators, q31: 32-bit values and 64-bit accumulators")
+    parser.add_argument("--margin", type=float, default=1.25,
+                        help="Headroom over the calibrated ranges before values saturate")
+    args = parser.parse_args()
+    telemetry = Telemetry("fixed_point", args.output_dir)
+
+    # The int8 QDQ models are float graphs around quantize/dequantize nodes and are not supported
+    onnx_files = [path for path in sorted(glob.glob(os.path.join(args.model_dir, "*.onnx")))
+                  if not path.endswith("_int8.onnx")]
+    if not onnx_files:
+        raise FileNotFoundError(f"No ONNX model found in {args.model_dir}")
+
+    telemetry.phase("generate")
+    if len(onnx_files) == 1:
+        generate(onnx_files[0], args.data_dir, args.output_dir, args.format, args.margin)
+    else:
+        # A model family gets one subdirectory per model, matching the onnx2c layout
+        for path in onnx_files:
+            name = model_name(path)
+            data_dir = args.data_dir
+            if data_dir and os.path.isdir(os.path.join(data_dir, name)):
+                data_dir = os.path.join(data_dir, name)
+            generate(path, data_dir, os.path.join(args.output_dir, name), args.format, args.margin)
+
+    telemetry.write()
+    print("Fixed-point code generation completed successfully")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Compiler flag autotuner for the minimal binary.
+Builds the onnx2c output under a matrix of flag sets and, for each variant, checks the predictions
+against an unoptimised reference build, benchmarks the latency and measures the section sizes of
+the deployable minimal example. The result is a Pareto table of latency versus ROM size.
+"""
+import os
+import json
+import itertools
+from common.telemetry import timed_run
+
+# Dead code elimination flags used by every variant, as in compile_minimal.sh
+SECTION_FLAGS = ["-fdata-sections", "-ffunction-sections", "-Wl,--gc-sections"]
+
+# Every optimisation level is combined with every on/off combination of the optional flags
+OPT_LEVELS = ["-O2", "-O3", "-Os"]
+OPTIONAL_FLAGS = [["-ffast-math"], ["-flto"], ["-funroll-loops"]]
+
+# Build the variants are compared against for correctness
+REFERENCE_FLAGS = ["-O0"]
+
+# -march values that tune for the build host; a binary built with them may not run on the target
+HOST_SPECIFIC_MARCH = {"native"}
+
+def flag_matrix(march_variants):
+    """Return the list of flag sets to try."""
+    variants = []
+    for opt_level in OPT_LEVELS:
+        for march in [None] + list(march_variants):
+            for enabled in itertools.product([False, True], repeat=len(OPTIONAL_FLAGS)):
+                flags = [opt_level] + ([f"-march={march}"] if march else [])
+                for on, extra_flags in zip(enabled, OPTIONAL_FLAGS):
+                    if on:
+                        flags += extra_flags
+                variants.append(flags)
+    return variants
+
+def read_values(path):
+    """Read one float per line."""
+    with open(path, "r") as f:
+        return [float(line.split(",")[0]) for line in f if line.strip()]
+
+def section_sizes(binary, size_tool="size"):
+    """Return the .text, .rodata, .data and .bss sizes of a binary in bytes."""
+    result = timed_run([size_tool, "-A", "-d", binary], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"size failed with error: {result.stderr}")
+
+    sizes = {"text": 0, "rodata": 0, "data": 0, "bss": 0}
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if len(parts) < 2 or not parts[1].isdigit():
+            continue
+        for section in sizes:
+            # RISC-V keeps small objects in .srodata, .sdata and .sbss
+            if any(parts[0] == name or parts[0].startswith(f"{name}.") for name in [f".{section}", f".s{section}"]):
+                sizes[section] += int(parts[1])
+    sizes["rom"] = sizes["text"] + sizes["rodata"] + sizes["data"]
+    sizes["ram"] = sizes["data"] + sizes["bss"]
+    return sizes
+
+def build_variant(name, flags):
+    """Build the tuning harness and the minimal example with one flag set. Returns an error message or None."""
+    for binary, driver in [(f"tune_{name}", "tune_model.c"), (f"minimal_{name}", "minimal_example.c")]:
+        result = timed_run(
+            ["gcc"] + flags + SECTION_FLAGS + [driver, "time_series_model.c", "-o", binary, "-lm"],
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            return result.stderr
+    return None
+
+def run_variant(name, inputs_path, iterations):
+    """Run the tuning harness and return (latency in ns, predictions)."""
+    outputs_path = f"outputs_{name}.txt"
+    result = timed_run(
+        [f"./tune_{name}", inputs_path, outputs_path, str(iterations)],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Tuning harness {name} failed:\n{result.stdout}{result.stderr}")
+
+    ns_per_inference = None
+    for line in result.stdout.splitlines():
+        if line.startswith("ns_per_inference:"):
+            ns_per_inference = float(line.split(":", 1)[1])
+    return ns_per_inference, read_values(outputs_path)
+
+def pareto_front(results):
+    """Return the correct variants that no other correct variant beats on both latency and ROM size."""
+    candidates = [r for r in results if r["correct"]]
+    front = []
+    for r in candidates:
+        dominated = any(
+            o["ns_per_inference"] <= r["ns_per_inference"] and o["sizes"]["rom"] <= r["sizes"]["rom"] and
+            (o["ns_per_inference"] < r["ns_per_inference"] or o["sizes"]["rom"] < r["sizes"]["rom"])
+            for o in candidates
+        )
+        if not dominated:
+            front.append(r)
+    return sorted(front, key=lambda r: r["ns_per_inference"])
+
+def format_table(results):
+    """Format results as a fixed-width text table."""
+    lines = [
+        f"{'Flags':<55} | {'ns/inf':>8} | {'.text':>7} | {'.rodata':>7} | {'ROM':>7} | {'max dev':>9} | OK",
+        "-" * 112
+    ]
+    for r in results:
+        lines.append(
+            f"{' '.join(r['flags']):<55} | {r['ns_per_inference']:>8.2f} | {r['sizes']['text']:>7} | "
+            f"{r['sizes']['rodata']:>7} | {r['sizes']['rom']:>7} | {r['max_deviation']:>9.2e} | "
+            f"{'yes' if r['correct'] else 'no'}"
+        )
+    return "\n".join(lines)
+
+def autotune(inputs_path, expected_path, march_variants, iterations, tolerance, objective, output_dir,
+             exclude_host_specific=False):
+    """
+    Run the flag search in the current directory, which must contain the tuning harness, the minimal
+    example and the generated model code. Writes tuning_results.json and tuning_report.txt to
+    output_dir and returns the winning flags for the objective ("speed" or "size"). With
+    exclude_host_specific, variants using a HOST_SPECIFIC_MARCH are measured but cannot win.
+    """
+    print("Building reference variant...")
+    error = build_variant("reference", REFERENCE_FLAGS)
+    if error:
+        raise RuntimeError(f"Reference build failed with error:\n{error}")
+    _, reference = run_variant("reference", inputs_path, 1)
+    expected = read_values(expected_path) if expected_path else None
+
+    results = []
+    variants = flag_matrix(march_variants)
+    for index, flags in enumerate(variants):
+        name = f"v{index}"
+        print(f"[{index + 1}/{len(variants)}] {' '.join(flags)}")
+        error = build_variant(name, flags)
+        if error:
+            print(f"  Build failed, skipping: {error.strip().splitlines()[-1] if error.strip() else ''}")
+            continue
+
+        ns_per_inference, outputs = run_variant(name, inputs_path, iterations)
+        max_deviation = max(abs(o - r) / max(1.0, abs(r)) for o, r in zip(outputs, reference))
+        result = {
+            "flags": flags,
+            "ns_per_inference": ns_per_inference,
+            "sizes": section_sizes(f"minimal_{name}"),
+            "max_deviation": max_deviation,
+            "correct": len(outputs) == len(reference) and max_deviation <= tolerance,
+            "host_specific": any(flag == f"-march={march}" for flag in flags for march in HOST_SPECIFIC_MARCH)
+        }
+        if expected:
+            result["mean_abs_error"] = sum(abs(o - e) for o, e in zip(outputs, expected)) / len(expected)
+        results.append(result)
+
+    front = pareto_front([r for r in results if not (exclude_host_specific and r["host_specific"])])
+    if not front:
+        raise RuntimeError(f"No flag set produced predictions within {tolerance} of the reference build")
+
+    fastest = min(front, key=lambda r: r["ns_per_inference"])
+    smallest = min(front, key=lambda r: r["sizes"]["rom"])
+    winner = fastest if objective == "speed" else smallest
+
+    report = "\n".join([
+        "All variants:",
+        format_table(sorted(results, key=lambda r: r["ns_per_inference"])),
+        "",
+        "Pareto front (latency vs ROM size):",
+        format_table(front),
+        "",
+        f"Fastest flags:  {' '.join(fastest['flags'])}",
+        f"Smallest flags: {' '.join(smallest['flags'])}",
+        f"Winning flags ({objective}): {' '.join(winner['flags'])}"
+    ])
+    print(report)
+
+    with open(os.path.join(output_dir, "tuning_report.txt"), "w") as f:
+        f.write(report + "\n")
+
+    with open(os.path.join(output_dir, "tuning_results.json"), "w") as f:
+        json.dump({
+            "objective": objective,
+            "tolerance": tolerance,
+            "section_flags": SECTION_FLAGS,
+            "host_specific_excluded": exclude_host_specific,
+            "winner": winner["flags"],
+            "fastest": fastest["flags"],
+            "smallest": smallest["flags"],
+            "pareto_front": [r["flags"] for r in front],
+            "variants": results
+        }, f, indent=2)
+
+    return winner["flags"]
@@ -0,0 +1,200 @@
+"""
+Cross-compilation matrix for the minimal binary.
+Builds the minimal example for each embedded target with its own toolchain, measures the sections
+with the target's size tool, optionally times inference under an emulator, and checks the ROM/RAM
+of every build against per-target budgets.
+"""
+import os
+import json
+import time
+import shutil
+import subprocess
+from autotune import SECTION_FLAGS, section_sizes
+from common.telemetry import timed_run
+
+# Built-in targets. "run" is the command prefix used to execute a target binary (None to skip the
+# latency run), "run_link_flags" replace "link_flags" for the binary that is executed.
+TARGETS = {
+    "host": {
+        "compiler": "gcc",
+        "size": "size",
+        "flags": [],
+        "link_flags": [],
+        "libs": ["-lm"],
+        "run": [],
+        "run_link_flags": []
+    },
+    "cortex-m0": {
+        "compiler": "arm-none-eabi-gcc",
+        "size": "arm-none-eabi-size",
+        "flags": ["-mcpu=cortex-m0", "-mthumb", "-mfloat-abi=soft"],
+        "link_flags": ["--specs=nano.specs", "--specs=nosys.specs"],
+        "libs": ["-lm"],
+        # ARMv6-M code runs unchanged on the Cortex-M3 model of qemu-arm
+        "run": ["qemu-arm", "-cpu", "cortex-m3"],
+        "run_link_flags": ["--specs=rdimon.specs"]
+    },
+    "cortex-m4": {
+        "compiler": "arm-none-eabi-gcc",
+        "size": "arm-none-eabi-size",
+        "flags": ["-mcpu=cortex-m4", "-mthumb", "-mfloat-abi=hard", "-mfpu=fpv4-sp-d16"],
+        "link_flags": ["--specs=nano.specs", "--specs=nosys.specs"],
+        "libs": ["-lm"],
+        "run": ["qemu-arm", "-cpu", "cortex-m4"],
+        "run_link_flags": ["--specs=rdimon.specs"]
+    },
+    "cortex-m7": {
+        "compiler": "arm-none-eabi-gcc",
+        "size": "arm-none-eabi-size",
+        "flags": ["-mcpu=cortex-m7", "-mthumb", "-mfloat-abi=hard", "-mfpu=fpv5-d16"],
+        "link_flags": ["--specs=nano.specs", "--specs=nosys.specs"],
+        "libs": ["-lm"],
+        "run": ["qemu-arm", "-cpu", "cortex-m7"],
+        "run_link_flags": ["--specs=rdimon.specs"]
+    },
+    "riscv32": {
+        "compiler": "riscv64-unknown-elf-gcc",
+        "size": "riscv64-unknown-elf-size",
+        "flags": ["-march=rv32imac", "-mabi=ilp32"],
+        # The Ubuntu 20.04 toolchain has no C library for RISC-V, so the binary is linked freestanding
+        "link_flags": ["-nostdlib", "-nostartfiles", "-Wl,-e,main"],
+        "libs": ["-lgcc"],
+        "run": None,
+        "run_link_flags": []
+    }
+}
+
+def load_targets(names, targets_file=None):
+    """Return the configurations of the named targets, with the built-in ones updated from targets_file."""
+    targets = {name: dict(config) for name, config in TARGETS.items()}
+    if targets_file:
+        with open(targets_file, "r") as f:
+            for name, config in json.load(f).items():
+                targets[name] = dict(targets.get(name, {}), **config)
+    unknown = [name for name in names if name not in targets]
+    if unknown:
+        raise ValueError(f"Unknown cross-compilation targets {unknown}, expected some of {sorted(targets)}")
+    return {name: targets[name] for name in names}
+
+def parse_budgets(specs):
+    """Parse TARGET:ROM:RAM budget specifications (either size may be empty) into {target: (rom, ram)}."""
+    budgets = {}
+    for spec in specs or []:
+        parts = spec.split(":")
+        if len(parts) != 3:
+            raise ValueError(f"Expected a budget as TARGET:ROM_BYTES:RAM_BYTES, got {spec}")
+        budgets[parts[0]] = tuple(int(value) if value else None for value in parts[1:])
+    return budgets
+
+def soft_float(flags):
+    """Return whether flags select a target without floating-point instructions (Arm soft-float ABI, RISC-V without F/D)."""
+    for flag in flags:
+        if flag == "-mfloat-abi=soft":
+            return True
+        if flag.startswith("-march=rv"):
+            return not any(extension in flag[len("-march=rv32"):].split("_")[0] for extension in "fdg")
+    return False
+
+def compile_command(config, flags, sources, output, link_flags=None, defines=()):
+    """Return the compiler command line building sources into output for a target."""
+    link_flags = config["link_flags"] if link_flags is None else link_flags
+    return ([config["compiler"]] + config["flags"] + flags + SECTION_FLAGS + list(defines) + link_flags +
+            sources + ["-o", output] + config["libs"])
+
+def time_binary(runner, binary, iterations):
+    """Return the nanoseconds per inference of the latency harness, timing the whole process."""
+    elapsed = []
+    # The difference between two run lengths cancels out the emulator start-up time
+    for count in [iterations, 2 * iterations]:
+        start = time.perf_counter()
+        timed_run(runner + [binary, str(count)], capture_output=True, text=True, check=True)
+        elapsed.append(time.perf_counter() - start)
+    return max(elapsed[1] - elapsed[0], 0.0) * 1e9 / iterations
+
+def build_variant(config, flags, variant, output_dir, iterations):
+    """Build and measure one model variant (float or fixed-point) for a target."""
+    os.makedirs(output_dir, exist_ok=True)
+    binary = os.path.join(output_dir, "minimal_nn")
+    result = timed_run(
+        compile_command(config, flags, [variant["example"], variant["model_source"]], binary, defines=variant["defines"]),
+        cwd=variant["dir"], capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return {"error": result.stderr}
+
+    # The model object on its own, without the example, the C library or the start-up code
+    model_object = os.path.join(output_dir, "model.o")
+    timed_run([config["compiler"]] + config["flags"] + flags + ["-fdata-sections", "-ffunction-sections"] +
+              variant["defines"] + ["-c", variant["model_source"], "-o", model_object],
+              cwd=variant["dir"], capture_output=True, text=True, check=True)
+
+    binary_sizes = section_sizes(binary, config["size"])
+    model_sizes = section_sizes(model_object, config["size"])
+    report = {
+        "rom_bytes": binary_sizes["rom"],
+        "ram_bytes": binary_sizes["ram"],
+        "sections": binary_sizes,
+        "model_sections": model_sizes
+    }
+
+    if config.get("run") is not None:
+        latency_binary = os.path.join(output_dir, "latency_model")
+        result = timed_run(
+            compile_command(config, flags, ["latency_model.c", variant["model_source"]], latency_binary,
+                            config["run_link_flags"], ["-DLATENCY_EXTERNAL_TIMER"] + variant["defines"]),
+            cwd=variant["dir"], capture_output=True, text=True
+        )
+        try:
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr)
+            report["ns_per_inference"] = time_binary(config["run"], latency_binary, iterations)
+            report["runner"] = " ".join(config["run"]) or "native"
+        except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+            report["latency_error"] = str(e)
+    return report
+
+def cross_compile(targets, variants, flags, budgets, iterations, output_dir):
+    """
+    Build every variant for every target and write cross_compile_report.json.
+    Raises RuntimeError if a build fails or exceeds its target's ROM/RAM budget.
+    """
+    report = {}
+    failures = []
+    for name, config in targets.items():
+        rom_budget, ram_budget = budgets.get(name, (config.get("rom_budget_bytes"), config.get("ram_budget_bytes")))
+        target_report = {
+            "compiler": config["compiler"],
+            "flags": config["flags"] + flags,
+            "soft_float": soft_float(config["flags"] + flags),
+            "rom_budget_bytes": rom_budget,
+            "ram_budget_bytes": ram_budget
+        }
+        if shutil.which(config["compiler"]) is None:
+            failures.append(f"{name}: {config['compiler']} not found")
+            target_report["error"] = f"{config['compiler']} not found"
+            report[name] = target_report
+            continue
+
+        print(f"Cross-compiling for {name}...")
+        for variant_name, variant in variants.items():
+            result = build_variant(config, flags, variant, os.path.join(output_dir, "cross", name, variant_name),
+                                   iterations)
+            if "error" in result:
+                failures.append(f"{name} ({variant_name}): build failed")
+            else:
+                result["within_budget"] = ((rom_budget is None or result["rom_bytes"] <= rom_budget) and
+                                           (ram_budget is None or result["ram_bytes"] <= ram_budget))
+                if not result["within_budget"]:
+                    failures.append(f"{name} ({variant_name}): ROM {result['rom_bytes']} / RAM {result['ram_bytes']} "
+                                    f"bytes exceeds the budget of {rom_budget} / {ram_budget} bytes")
+                latency = f", {result['ns_per_inference']:.1f} ns per inference" if "ns_per_inference" in result else ""
+                print(f"  {variant_name}: ROM {result['rom_bytes']} bytes, RAM {result['ram_bytes']} bytes{latency}")
+            target_report[variant_name] = result
+        report[name] = target_report
+
+    with open(os.path.join(output_dir, "cross_compile_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    if failures:
+        raise RuntimeError("Cross-compilation failed:\n" + "\n".join(f"  {failure}" for failure in failures))
+    return report
@@ -0,0 +1,204 @@
+"""
+Static memory analysis of the minimal binary.
+The intermediate tensors of the onnx2c output and their lifetimes are read from the generated code
+(the union declarations and the node calls of the entry function, which follow the ONNX graph order),
+and packed into a single arena by a lifetime-aware planner. The worst-case stack depth is computed
+from gcc's -fstack-usage and -fcallgraph-info output, so that a stack that does not fit the target
+RAM is found at build time instead of in the field.
+"""
+import os
+import re
+import json
+import glob
+from common.telemetry import timed_run
+
+# Size in bytes of the element types onnx2c uses for tensors
+TYPE_SIZES = {
+    "float": 4, "double": 8, "bool": 1,
+    "int8_t": 1, "uint8_t": 1, "int16_t": 2, "uint16_t": 2,
+    "int32_t": 4, "uint32_t": 4, "int64_t": 8, "uint64_t": 8,
+}
+
+# Offsets in the arena are aligned for vector loads
+ARENA_ALIGNMENT = 16
+
+UNION_PATTERN = re.compile(r"^union (?P<union>\w+) \{\n(?P<members>.*?)^\};\n", re.MULTILINE | re.DOTALL)
+UNION_INSTANCE_PATTERN = re.compile(r"^static union (?P<union>\w+) (?P<instance>\w+);\n", re.MULTILINE)
+TENSOR_PATTERN = re.compile(r"^(?P<ctype>\w+) (?P<name>tensor_\w+)(?P<dims>(?:\[\d+\])+);", re.MULTILINE)
+ENTRY_PATTERN = re.compile(r"^void \w*entry\(.*?^}", re.MULTILINE | re.DOTALL)
+
+def parse_intermediates(c_code):
+    """Return the intermediate tensors placed in unions by onnx2c, with their type, dimensions and size."""
+    instances = {m.group("union"): m.group("instance") for m in UNION_INSTANCE_PATTERN.finditer(c_code)}
+    tensors = []
+    for union in UNION_PATTERN.finditer(c_code):
+        for member in TENSOR_PATTERN.finditer(union.group("members")):
+            dims = [int(d) for d in re.findall(r"\[(\d+)\]", member.group("dims"))]
+            if member.group("ctype") not in TYPE_SIZES:
+                raise ValueError(f"Unknown element type {member.group('ctype')} of {member.group('name')}")
+            size = TYPE_SIZES[member.group("ctype")]
+            for d in dims:
+                size *= d
+            tensors.append({
+                "name": member.group("name"),
+                "union": union.group("union"),
+                "instance": instances.get(union.group("union")),
+                "ctype": member.group("ctype"),
+                "dims": dims,
+                "bytes": size
+            })
+    return tensors
+
+def tensor_lifetimes(c_code, tensors):
+    """Set the first and last node call (in execution order) that uses each tensor."""
+    entry = ENTRY_PATTERN.search(c_code)
+    if entry is None:
+        raise RuntimeError("Could not find the entry function in the generated code")
+    calls = [line for line in entry.group(0).splitlines()[1:] if re.match(r"\s*node_\w+\(", line)]
+    for tensor in tensors:
+        used = [i for i, call in enumerate(calls) if re.search(rf"\b{tensor['name']}\b", call)]
+        tensor["first_use"] = used[0] if used else 0
+        tensor["last_use"] = used[-1] if used else 0
+    return calls
+
+def plan_arena(tensors):
+    """
+    Assign arena offsets so that tensors with overlapping lifetimes never share bytes.
+    Largest tensors are placed first, each at the lowest aligned offset that is free for its
+    whole lifetime. Returns the arena size.
+    """
+    placed = []
+    for tensor in sorted(tensors, key=lambda t: t["bytes"], reverse=True):
+        live = sorted(
+            (other for other in placed
+             if other["first_use"] <= tensor["last_use"] and tensor["first_use"] <= other["last_use"]),
+            key=lambda other: other["offset"]
+        )
+        offset = 0
+        for other in live:
+            if offset + tensor["bytes"] <= other["offset"]:
+                break
+            end = other["offset"] + other["bytes"]
+            offset = max(offset, (end + ARENA_ALIGNMENT - 1) // ARENA_ALIGNMENT * ARENA_ALIGNMENT)
+        tensor["offset"] = offset
+        placed.append(tensor)
+    return max((t["offset"] + t["bytes"] for t in tensors), default=0)
+
+def union_bytes(tensors):
+    """Return the memory used by onnx2c's own layout: one union per group, sized to its largest member."""
+    sizes = {}
+    for tensor in tensors:
+        sizes[tensor["union"]] = max(sizes.get(tensor["union"], 0), tensor["bytes"])
+    return sum(sizes.values())
+
+def generate_arena_source(c_code, tensors, arena_bytes):
+    """Return the generated code with the tensor unions replaced by views into a single static arena."""
+    entry = ENTRY_PATTERN.search(c_code)
+    body = entry.group(0)
+    for tensor in tensors:
+        inner_dims = "".join(f"[{d}]" for d in tensor["dims"][1:])
+        view = (f"(({tensor['ctype']} (*){inner_dims})(time_series_model_arena + {tensor['offset']}))"
+                if inner_dims else f"(({tensor['ctype']} *)(time_series_model_arena + {tensor['offset']}))")
+        reference = rf"\b{tensor['instance']}\.{tensor['name']}\b" if tensor["instance"] else rf"\b{tensor['name']}\b"
+        body = re.sub(reference, view, body)
+    c_code = c_code[:entry.start()] + body + c_code[entry.end():]
+
+    arena = (f"/* Intermediate tensors, packed by lifetime by minimal_binary/memory_plan.py */\n"
+             f"static uint8_t time_series_model_arena[{max(arena_bytes, 1)}] "
+             f"__attribute__((aligned({ARENA_ALIGNMENT})));\n")
+    first_union = UNION_PATTERN.search(c_code)
+    c_code = c_code[:first_union.start()] + arena + c_code[first_union.start():]
+    c_code = UNION_INSTANCE_PATTERN.sub("", UNION_PATTERN.sub("", c_code))
+    if "#include <stdint.h>" not in c_code:
+        c_code = "#include <stdint.h>\n" + c_code
+    return c_code
+
+def read_stack_usage(directory):
+    """
+    Return {function: (bytes, qualifier)} from the nodes of the .ci files written by -fcallgraph-info=su.
+    The node titles are the names used by the call graph edges, file:function for static functions,
+    which the .su files would report as plain function names.
+    """
+    frames = {}
+    for path in glob.glob(os.path.join(directory, "*.ci")):
+        with open(path, "r") as f:
+            for match in re.finditer(r'node: \{ title: "([^"]+)" label: "[^"]*?(\d+) bytes \(([^)]+)\)"', f.read()):
+                frames[match.group(1)] = (int(match.group(2)), match.group(3))
+    return frames
+
+def read_call_graph(directory):
+    """Return {caller: set(callees)} from the .ci files written by -fcallgraph-info."""
+    edges = {}
+    for path in glob.glob(os.path.join(directory, "*.ci")):
+        with open(path, "r") as f:
+            for match in re.finditer(r'edge: \{ sourcename: "([^"]+)" targetname: "([^"]+)"', f.read()):
+                edges.setdefault(match.group(1), set()).add(match.group(2))
+    return edges
+
+def worst_stack_path(root, frames, edges, path=()):
+    """Return (bytes, call path) of the deepest stack reachable from root. Recursion is reported as unbounded."""
+    if root in path:
+        raise RuntimeError(f"Recursive call chain {' -> '.join(path + (root,))}, stack usage is unbounded")
+    frame = frames.get(root, (0, "static"))[0]
+    best = (0, ())
+    for callee in sorted(edges.get(root, ())):
+        best = max(best, worst_stack_path(callee, frames, edges, path + (root,)), key=lambda r: r[0])
+    return frame + best[0], (root,) + best[1]
+
+def analyze_stack(sources, flags, stack_limit=None):
+    """
+    Compile sources with stack usage reporting in the current directory. Returns a dict with the
+    per-function frames and the worst-case stack path from main.
+    """
+    cmd = ["gcc", "-c"] + flags + ["-fstack-usage", "-fcallgraph-info=su"]
+    if stack_limit:
+        cmd.append(f"-Wstack-usage={stack_limit}")
+    result = timed_run(cmd + sources, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Stack usage build failed with error:\n{result.stderr}")
+
+    frames = read_stack_usage(".")
+    stack_bytes, path = worst_stack_path("main", frames, read_call_graph("."))
+    dynamic = [function for function, (_, qualifier) in frames.items() if qualifier.startswith("dynamic")]
+    return {
+        "worst_case_bytes": stack_bytes,
+        "worst_case_path": list(path),
+        "frames": {function: {"bytes": size, "qualifier": qualifier} for function, (size, qualifier) in frames.items()},
+        "dynamic_frames": dynamic,
+        "warnings": [line for line in result.stderr.splitlines() if "stack usage" in line]
+    }
+
+def plan_memory(c_code):
+    """Plan the arena for the generated code. Returns (tensors, calls, onnx2c layout bytes, arena bytes)."""
+    tensors = parse_intermediates(c_code)
+    calls = tensor_lifetimes(c_code, tensors)
+    return tensors, calls, union_bytes(tensors), plan_arena(tensors)
+
+def write_memory_report(report, output_dir):
+    """Write memory_report.json and a readable memory_report.txt."""
+    with open(os.path.join(output_dir, "memory_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    lines = [
+        f"{'Tensor':<50} | {'Bytes':>8} | {'Live':>9} | {'Offset':>8}",
+        "-" * 85
+    ]
+    for tensor in report["intermediates"]["tensors"]:
+        lines.append(f"{tensor['name']:<50} | {tensor['bytes']:>8} | "
+                     f"{tensor['first_use']:>4}-{tensor['last_use']:<4} | {tensor['offset']:>8}")
+    lines += [
+        "",
+        f"Intermediates, onnx2c union layout: {report['intermediates']['union_bytes']} bytes",
+        f"Intermediates, lifetime-packed arena: {report['intermediates']['arena_bytes']} bytes",
+        f"Worst-case stack: {report['stack']['worst_case_bytes']} bytes "
+        f"({' -> '.join(report['stack']['worst_case_path'])})",
+        f"Static RAM (.data + .bss): {report['static_ram_bytes']} bytes",
+        f"Peak RAM: {report['peak_ram_bytes']} bytes"
+    ]
+    if report["stack"]["dynamic_frames"]:
+        lines.append(f"Warning: dynamically sized stack frames in {', '.join(report['stack']['dynamic_frames'])}")
+    text = "\n".join(lines)
+    print(text)
+
+    with open(os.path.join(output_dir, "memory_report.txt"), "w") as f:
+        f.write(text + "\n")
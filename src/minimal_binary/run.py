@@ -3,10 +3,46 @@ Script for building a minimal binary from C code.
 This will run inside the AML pipeline.
 """
 import os
+import re
+import sys
+import json
 import argparse
-import subprocess
 import shutil
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.build_cache import BuildCache, run_cached
+from common.fan_out import find_models, fan_out
+from common.telemetry import Telemetry, timed_run
+from autotune import autotune, section_sizes
+from cross_compile import load_targets, parse_budgets, cross_compile
+from memory_plan import plan_memory, generate_arena_source, analyze_stack, write_memory_report
+
+# Entry symbol header written by the onnx2c step for models converted as part of a model family
+ENTRY_HEADER = "time_series_model_entry.h"
+
+# Fixed-point sources written by the fixed_point step
+FIXED_POINT_SOURCE = "time_series_model_fixed.c"
+FIXED_POINT_HEADER = "time_series_model_fixed.h"
+
+# Sparse model source written by the sparse_codegen step, a drop-in replacement for time_series_model.c
+SPARSE_SOURCE = "time_series_model_sparse.c"
+
+# Weight blob sources written by the onnx2c step with --weights blob, the model sources under their build names
+BLOB_SOURCES = {"time_series_model_blob.c": "time_series_model.c",
+                "time_series_model_batch_blob.c": "time_series_model_batch.c",
+                "time_series_model_weights.c": "time_series_model_weights.c",
+                "time_series_model_weights.h": "time_series_model_weights.h",
+                "time_series_model_weights.S": "time_series_model_weights.S",
+                "time_series_model_weights.bin": "time_series_model_weights.bin"}
+
+# Section the weight blob is linked into
+WEIGHTS_SECTION = ".model_weights"
+
+# Per-model reports merged into models_report.json when building a model family
+MODEL_REPORTS = ["memory_usage.json", "memory_report.json", "quantization_size_report.json", "tuning_results.json",
+                 "fixed_point_size_report.json", "sparse_size_report.json", "cross_compile_report.json",
+                 "blob_size_report.json"]
+
 def read_template_file(filename):
     """Read a template file from the templates directory."""
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -18,14 +54,418 @@ def read_template_file(filename):
     else:
         raise FileNotFoundError(f"Template file {filename} not found in {os.path.join(script_dir, 'templates')}")
 
+def read_window(entry_header):
+    """Return the input window size from the onnx2c entry header, 1 if the step did not write one."""
+    if not os.path.exists(entry_header):
+        return 1
+    with open(entry_header, "r") as f:
+        match = re.search(r"#define TIME_SERIES_MODEL_WINDOW (\d+)", f.read())
+    return int(match.group(1)) if match else 1
+
+def parse_memory_usage(build_output):
+    """Parse the ROM/RAM estimates printed by compile_minimal.sh."""
+    usage = {}
+    for key, pattern in [("rom_bytes", r"ROM \(Flash\) usage: ~(\d+) bytes"), ("ram_bytes", r"RAM usage: ~(\d+) bytes")]:
+        match = re.search(pattern, build_output)
+        if match:
+            usage[key] = int(match.group(1))
+    return usage
+
+def check_build(result, description):
+    """Raise if compile_minimal.sh did not produce minimal_nn in the current directory."""
+    if "Compilation failed" in result.stdout or not os.path.exists("minimal_nn"):
+        raise RuntimeError(f"Building the {description} failed:\n{result.stdout}{result.stderr}")
+
+def build_quantized_binary(args, cache, opt_flags, float_output):
+    """Build the minimal binary from the int8 model and write its ROM/RAM deltas versus the float build."""
+    int8_dir = os.path.abspath("int8")
+    os.makedirs(int8_dir, exist_ok=True)
+    shutil.copy(os.path.join(args.c_code_dir, "time_series_model_int8.c"), os.path.join(int8_dir, "time_series_model.c"))
+    wrapper_inputs = [filename for filename in ["nn_wrapper.h", ENTRY_HEADER] if os.path.exists(filename)]
+    for filename in ["compile_minimal.sh", "minimal_example.c", "latency_model.c"] + wrapper_inputs:
+        shutil.copy(filename, int8_dir)
+    
+    previous_dir = os.getcwd()
+    os.chdir(int8_dir)
+    try:
+        print("Building minimal binary from the int8 model...")
+        result = run_cached(
+            cache,
+            ["./compile_minimal.sh"] + opt_flags,
+            ["compile_minimal.sh", "minimal_example.c", "time_series_model.c"] + wrapper_inputs,
+            ["minimal_nn", "minimal_nn_stripped"],
+            tools=["gcc", "strip"]
+        )
+        with open(os.path.join(args.output_dir, "build_output_int8.txt"), "w") as f:
+            f.write(result.stdout)
+            if result.stderr:
+                f.write("\nErrors:\n")
+                f.write(result.stderr)
+        check_build(result, "int8 minimal binary")
+        
+        for binary in ["minimal_nn", "minimal_nn_stripped"]:
+            if os.path.exists(binary):
+                shutil.copy(binary, os.path.join(args.output_dir, binary.replace("minimal_nn", "minimal_nn_int8")))
+    finally:
+        os.chdir(previous_dir)
+    
+    float_usage = parse_memory_usage(float_output)
+    int8_usage = parse_memory_usage(result.stdout)
+    report = {"float": float_usage, "int8": int8_usage}
+    for key in ["rom_bytes", "ram_bytes"]:
+        if key in float_usage and key in int8_usage:
+            report[f"{key}_delta"] = int8_usage[key] - float_usage[key]
+    print(f"Int8 memory usage: {int8_usage} (float {float_usage})")
+    
+    with open(os.path.join(args.output_dir, "quantization_size_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+def compare_quantized_targets(cross_report, output_dir):
+    """
+    Add the float and int8 latency of every cross-compiled target that ran the latency harness to
+    quantization_size_report.json. The int8 model still computes in float (see quantize_model in the
+    training step), so on soft-float targets it pays for the emulated float arithmetic as well.
+    """
+    path = os.path.join(output_dir, "quantization_size_report.json")
+    with open(path, "r") as f:
+        report = json.load(f)
+    
+    targets = {}
+    for name, target in cross_report.items():
+        float_ns = target.get("float", {}).get("ns_per_inference")
+        int8_ns = target.get("int8", {}).get("ns_per_inference")
+        if not float_ns or int8_ns is None:
+            continue
+        targets[name] = {
+            "soft_float": target["soft_float"],
+            "float_ns_per_inference": float_ns,
+            "int8_ns_per_inference": int8_ns,
+            "ns_per_inference_delta_percent": round((int8_ns - float_ns) / float_ns * 100, 2)
+        }
+        print(f"Int8 latency on {name}{' (soft-float)' if target['soft_float'] else ''}: {int8_ns:.1f} ns per inference "
+              f"({targets[name]['ns_per_inference_delta_percent']:+.1f}% vs float)")
+    report["targets"] = targets
+    
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+def measure_latency(sources, flags, iterations, binary):
+    """Build latency_model.c against the given model sources and return its nanoseconds per inference."""
+    build = timed_run(["gcc"] + flags + ["latency_model.c"] + sources + ["-o", binary, "-lm"],
+                      capture_output=True, text=True)
+    if build.returncode != 0:
+        raise RuntimeError(f"Building {binary} failed:\n{build.stderr}")
+    result = timed_run([f"./{binary}", str(iterations)], capture_output=True, text=True, check=True)
+    return float(re.search(r"ns_per_inference: ([\d.]+)", result.stdout).group(1))
+
+def build_fixed_point_binary(args, cache, opt_flags, float_output):
+    """
+    Build the minimal binary from the fixed-point model and write its ROM/RAM and latency deltas
+    versus the float build, and whether the model code compiles without floating-point registers.
+    """
+    fixed_dir = os.path.abspath("fixed")
+    os.makedirs(fixed_dir, exist_ok=True)
+    for filename in [FIXED_POINT_SOURCE, FIXED_POINT_HEADER]:
+        shutil.copy(os.path.join(args.fixed_point_dir, filename), fixed_dir)
+    shutil.copy(os.path.join(args.fixed_point_dir, FIXED_POINT_SOURCE), os.path.join(fixed_dir, "time_series_model.c"))
+    shutil.copy("compile_minimal.sh", fixed_dir)
+    with open(os.path.join(fixed_dir, "minimal_example.c"), "w") as f:
+        f.write(read_template_file("minimal_example_fixed.c"))
+    shutil.copy("latency_model.c", fixed_dir)
+    
+    flags = opt_flags[0].split() if opt_flags else ["-Os"]
+    print("Measuring float model latency...")
+    float_ns = measure_latency(["time_series_model.c"], flags, args.latency_iterations, "latency_float")
+    
+    previous_dir = os.getcwd()
+    os.chdir(fixed_dir)
+    try:
+        print("Building minimal binary from the fixed-point model...")
+        result = run_cached(
+            cache,
+            ["./compile_minimal.sh"] + opt_flags,
+            ["compile_minimal.sh", "minimal_example.c", "time_series_model.c", FIXED_POINT_HEADER],
+            ["minimal_nn", "minimal_nn_stripped"],
+            tools=["gcc", "strip"]
+        )
+        with open(os.path.join(args.output_dir, "build_output_fixed.txt"), "w") as f:
+            f.write(result.stdout)
+            if result.stderr:
+                f.write("\nErrors:\n")
+                f.write(result.stderr)
+        check_build(result, "fixed-point minimal binary")
+        
+        for binary in ["minimal_nn", "minimal_nn_stripped"]:
+            if os.path.exists(binary):
+                shutil.copy(binary, os.path.join(args.output_dir, binary.replace("minimal_nn", "minimal_nn_fixed")))
+        
+        print("Measuring fixed-point model latency...")
+        fixed_ns = measure_latency(["-DTIME_SERIES_MODEL_FIXED", FIXED_POINT_SOURCE], flags,
+                                   args.latency_iterations, "latency_fixed")
+        
+        # Any float or double arithmetic in the model code fails to compile without FP/SIMD registers
+        float_check = timed_run(["gcc", "-c", "-mgeneral-regs-only"] + flags + [FIXED_POINT_SOURCE, "-o", "float_check.o"],
+                                capture_output=True, text=True)
+    finally:
+        os.chdir(previous_dir)
+    
+    float_usage = parse_memory_usage(float_output)
+    fixed_usage = parse_memory_usage(result.stdout)
+    report = {
+        "float": dict(float_usage, ns_per_inference=float_ns),
+        "fixed": dict(fixed_usage, ns_per_inference=fixed_ns),
+        "float_free": float_check.returncode == 0
+    }
+    for key in ["rom_bytes", "ram_bytes"]:
+        if key in float_usage and key in fixed_usage:
+            report[f"{key}_delta"] = fixed_usage[key] - float_usage[key]
+    report["ns_per_inference_delta"] = fixed_ns - float_ns
+    if float_check.returncode != 0:
+        report["float_check_errors"] = float_check.stderr
+        print(f"Warning: the fixed-point model code does not compile with -mgeneral-regs-only:\n{float_check.stderr}")
+    print(f"Fixed-point memory usage: {fixed_usage} (float {float_usage}), "
+          f"{fixed_ns:.1f} ns per inference (float {float_ns:.1f} ns, measured on the build host)")
+    
+    with open(os.path.join(args.output_dir, "fixed_point_size_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+def build_sparse_binary(args, cache, opt_flags, dense_output):
+    """
+    Build the minimal binary from the sparse model of the pruned network and write its ROM/RAM,
+    .rodata and latency deltas versus the dense onnx2c build of the same weights.
+    """
+    sparse_dir = os.path.abspath("sparse")
+    os.makedirs(sparse_dir, exist_ok=True)
+    shutil.copy(os.path.join(args.sparse_dir, SPARSE_SOURCE), os.path.join(sparse_dir, "time_series_model.c"))
+    wrapper_inputs = [filename for filename in ["nn_wrapper.h", ENTRY_HEADER] if os.path.exists(filename)]
+    for filename in ["compile_minimal.sh", "minimal_example.c", "latency_model.c"] + wrapper_inputs:
+        shutil.copy(filename, sparse_dir)
+    
+    flags = opt_flags[0].split() if opt_flags else ["-Os"]
+    print("Measuring dense model latency...")
+    dense_ns = measure_latency(["time_series_model.c"], flags, args.latency_iterations, "latency_dense")
+    dense_sections = section_sizes("minimal_nn")
+    
+    previous_dir = os.getcwd()
+    os.chdir(sparse_dir)
+    try:
+        print("Building minimal binary from the sparse model...")
+        result = run_cached(
+            cache,
+            ["./compile_minimal.sh"] + opt_flags,
+            ["compile_minimal.sh", "minimal_example.c", "time_series_model.c"] + wrapper_inputs,
+            ["minimal_nn", "minimal_nn_stripped"],
+            tools=["gcc", "strip"]
+        )
+        with open(os.path.join(args.output_dir, "build_output_sparse.txt"), "w") as f:
+            f.write(result.stdout)
+            if result.stderr:
+                f.write("\nErrors:\n")
+                f.write(result.stderr)
+        if not os.path.exists("minimal_nn"):
+            raise RuntimeError(f"Building the sparse minimal binary failed:\n{result.stdout}{result.stderr}")
+        
+        for binary in ["minimal_nn", "minimal_nn_stripped"]:
+            shutil.copy(binary, os.path.join(args.output_dir, binary.replace("minimal_nn", "minimal_nn_sparse")))
+        
+        print("Measuring sparse model latency...")
+        sparse_ns = measure_latency(["time_series_model.c"], flags, args.latency_iterations, "latency_sparse")
+        sparse_sections = section_sizes("minimal_nn")
+    finally:
+        os.chdir(previous_dir)
+    
+    dense_usage = parse_memory_usage(dense_output)
+    sparse_usage = parse_memory_usage(result.stdout)
+    report = {
+        "dense": dict(dense_usage, rodata_bytes=dense_sections["rodata"], ns_per_inference=dense_ns),
+        "sparse": dict(sparse_usage, rodata_bytes=sparse_sections["rodata"], ns_per_inference=sparse_ns)
+    }
+    for key in ["rom_bytes", "ram_bytes", "rodata_bytes"]:
+        if key in report["dense"] and key in report["sparse"]:
+            report[f"{key}_delta"] = report["sparse"][key] - report["dense"][key]
+    report["ns_per_inference_delta"] = sparse_ns - dense_ns
+    print(f"Sparse memory usage: {sparse_usage}, {sparse_sections['rodata']} bytes .rodata (dense {dense_usage}, "
+          f"{dense_sections['rodata']} bytes .rodata), {sparse_ns:.1f} ns per inference (dense {dense_ns:.1f} ns)")
+    
+    with open(os.path.join(args.output_dir, "sparse_size_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+def section_size(binary, section):
+    """Return the size in bytes of a section of a binary (0 if it has none)."""
+    result = timed_run(["size", "-A", "-d", binary], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"size failed with error: {result.stderr}")
+    return sum(int(parts[1]) for parts in (line.split() for line in result.stdout.splitlines())
+               if len(parts) > 1 and parts[0] == section and parts[1].isdigit())
+
+def build_blob_binary(args, cache, opt_flags):
+    """
+    Build the minimal binary from the weight blob sources, with the blob linked into its own section,
+    check that it binds the blob, and write the code ROM versus the compiled-in build and the size of
+    a weights-only update to blob_size_report.json.
+    """
+    blob_dir = os.path.abspath("blob")
+    os.makedirs(blob_dir, exist_ok=True)
+    for companion, filename in BLOB_SOURCES.items():
+        if os.path.exists(os.path.join(args.c_code_dir, companion)):
+            shutil.copy(os.path.join(args.c_code_dir, companion), os.path.join(blob_dir, filename))
+    wrapper_inputs = [filename for filename in ["nn_wrapper.h", ENTRY_HEADER] if os.path.exists(filename)]
+    for filename in wrapper_inputs:
+        shutil.copy(filename, blob_dir)
+    with open(os.path.join(blob_dir, "minimal_example.c"), "w") as f:
+        f.write(read_template_file("minimal_example_blob.c"))
+    compiled_sections = section_sizes("minimal_nn")
+    
+    previous_dir = os.getcwd()
+    os.chdir(blob_dir)
+    try:
+        print("Building minimal binary with the weight blob...")
+        sources = ["minimal_example.c", "time_series_model.c", "time_series_model_weights.c",
+                   "time_series_model_weights.S"] + (
+            ["time_series_model_batch.c"] if os.path.exists("time_series_model_batch.c") else [])
+        flags = opt_flags[0].split() if opt_flags else ["-Os"]
+        result = run_cached(
+            cache,
+            ["gcc"] + flags + ["-fdata-sections", "-ffunction-sections", "-Wl,--gc-sections"] + sources +
+            ["-o", "minimal_nn", "-lm"],
+            sources + wrapper_inputs + ["time_series_model_weights.h", "time_series_model_weights.bin"],
+            ["minimal_nn"],
+            tools=["gcc"]
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Building the weight blob minimal binary failed:\n{result.stderr}")
+        
+        # The example exits with an error if the linked blob does not match the compiled layout
+        run = timed_run(["./minimal_nn"], capture_output=True, text=True)
+        if run.returncode != 0:
+            raise RuntimeError(f"The weight blob minimal binary failed to bind its weights (exit code {run.returncode})")
+        shutil.copy("minimal_nn", os.path.join(args.output_dir, "minimal_nn_blob"))
+        shutil.copy("time_series_model_weights.bin", args.output_dir)
+        blob_sections = section_sizes("minimal_nn")
+        weights_bytes = section_size("minimal_nn", WEIGHTS_SECTION)
+        blob_bytes = os.path.getsize("time_series_model_weights.bin")
+    finally:
+        os.chdir(previous_dir)
+    
+    # The weights section is outside the sections counted by section_sizes
+    report = {
+        "compiled": compiled_sections,
+        "blob": dict(blob_sections, weights_section=weights_bytes),
+        "code_rom_delta": blob_sections["rom"] - compiled_sections["rom"],
+        "total_rom_delta": blob_sections["rom"] + weights_bytes - compiled_sections["rom"],
+        "weights_update_bytes": blob_bytes,
+        "full_update_bytes": blob_sections["rom"] + weights_bytes
+    }
+    print(f"Weight blob binary: {blob_sections['rom']} bytes code ROM ({report['code_rom_delta']:+d} vs compiled-in "
+          f"weights) plus {weights_bytes} bytes in {WEIGHTS_SECTION}, weights-only update of {blob_bytes} bytes")
+    
+    with open(os.path.join(args.output_dir, "blob_size_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+def analyze_memory(args, opt_flags, build_output):
+    """
+    Report the peak RAM of the minimal binary: static data (which holds the intermediate tensors)
+    plus the worst-case stack depth from main. Fails if it exceeds --ram_limit.
+    """
+    with open(os.path.join(args.c_code_dir, "time_series_model.c"), "r") as f:
+        tensors, calls, union_size, arena_size = plan_memory(f.read())
+    
+    # Compile the sources the binary was built from with stack usage reporting
+    memory_dir = os.path.abspath("memory")
+    os.makedirs(memory_dir, exist_ok=True)
+    for filename in ["minimal_example.c", "nn_wrapper.h", ENTRY_HEADER, "time_series_model.c"]:
+        if os.path.exists(filename):
+            shutil.copy(filename, memory_dir)
+    
+    previous_dir = os.getcwd()
+    os.chdir(memory_dir)
+    try:
+        flags = opt_flags[0].split() if opt_flags else ["-Os"]
+        stack = analyze_stack(["minimal_example.c", "time_series_model.c"], flags, args.stack_limit)
+    finally:
+        os.chdir(previous_dir)
+    
+    static_ram = parse_memory_usage(build_output).get("ram_bytes", 0)
+    report = {
+        "intermediates": {
+            "node_calls": len(calls),
+            "union_bytes": union_size,
+            "arena_bytes": arena_size,
+            "static_arena_applied": args.static_arena,
+            "tensors": tensors
+        },
+        "stack": stack,
+        "static_ram_bytes": static_ram,
+        "peak_ram_bytes": static_ram + stack["worst_case_bytes"],
+        "ram_limit_bytes": args.ram_limit
+    }
+    write_memory_report(report, args.output_dir)
+    
+    for warning in stack["warnings"]:
+        print(f"Warning: {warning}")
+    if args.ram_limit and report["peak_ram_bytes"] > args.ram_limit:
+        raise RuntimeError(f"Peak RAM of {report['peak_ram_bytes']} bytes exceeds the limit of {args.ram_limit} bytes")
+
 def main():
     # Parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("--c_code_dir", type=str, help="Directory containing C code")
     parser.add_argument("--output_dir", type=str, help="Output directory for minimal binary")
+    parser.add_argument("--model_lib_dir", type=str, default=None,
+                        help="Directory containing prebuilt model libraries (time_series_model.c is compiled if not set)")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Build cache directory (disabled if not set)")
+    parser.add_argument("--cache_max_mb", type=float, default=1024, help="Maximum build cache size in MB")
+    parser.add_argument("--tune", action="store_true", help="Search compiler flags for the fastest and smallest build")
+    parser.add_argument("--tune_apply", action="store_true", help="Build the minimal binary with the winning flags")
+    parser.add_argument("--tune_objective", type=str, choices=["speed", "size"], default="size",
+                        help="Which Pareto-optimal flag set wins")
+    parser.add_argument("--tune_march", type=str, default="",
+                        help="Comma separated -march values to try in addition to the compiler default "
+                             "(native is only reported, never applied with --tune_apply)")
+    parser.add_argument("--tune_iterations", type=int, default=1000000, help="Timed inferences per variant")
+    parser.add_argument("--tune_tolerance", type=float, default=1e-4,
+                        help="Maximum relative deviation from the unoptimised reference build")
+    parser.add_argument("--model_dir", type=str, default=None,
+                        help="Directory containing test_input.csv and expected_output.csv for tuning")
+    parser.add_argument("--memory_report", action="store_true",
+                        help="Report intermediate tensor lifetimes, worst-case stack and peak RAM")
+    parser.add_argument("--static_arena", action="store_true",
+                        help="Place the intermediate tensors in a single static arena sized by the memory planner")
+    parser.add_argument("--stack_limit", type=int, default=None,
+                        help="Warn about functions whose stack frame exceeds this many bytes (-Wstack-usage)")
+    parser.add_argument("--ram_limit", type=int, default=None,
+                        help="Fail if the peak RAM (static data plus worst-case stack) exceeds this many bytes")
+    parser.add_argument("--fixed_point_dir", type=str, default=None,
+                        help="Directory containing the fixed-point C code, to compare its size and latency with the float build")
+    parser.add_argument("--sparse_dir", type=str, default=None,
+                        help="Directory containing the sparse C code of the pruned model, to compare with the dense build")
+    parser.add_argument("--latency_iterations", type=int, default=1000000,
+                        help="Timed inferences per model when comparing the fixed-point, sparse and float builds or "
+                             "running the cross-compiled builds")
+    parser.add_argument("--cross_targets", type=str, default="",
+                        help="Comma separated targets to cross-compile for (host, cortex-m0, cortex-m4, cortex-m7, riscv32)")
+    parser.add_argument("--cross_targets_file", type=str, default=None,
+                        help="JSON file adding targets or overriding the compiler, flags and runner of built-in ones")
+    parser.add_argument("--cross_budget", type=str, action="append", default=[],
+                        help="ROM/RAM budget of a target as TARGET:ROM_BYTES:RAM_BYTES, fails the step when exceeded")
+    parser.add_argument("--model_jobs", type=int, default=1,
+                        help="Number of models of a model family to build in parallel "
+                             "(concurrent latency measurements skew each other)")
     args = parser.parse_args()
+    telemetry = Telemetry("minimal_binary", args.output_dir)
+    
+    # A model family is built by re-running this script once per model
+    models = find_models(args.c_code_dir)
+    if models:
+        telemetry.phase("fan_out")
+        fan_out(os.path.abspath(__file__), sys.argv[1:], models,
+                ["--c_code_dir", "--model_dir", "--model_lib_dir", "--fixed_point_dir", "--sparse_dir"],
+                args.output_dir, args.model_jobs, MODEL_REPORTS)
+        telemetry.write()
+        return
     
     # Create output directory
+    telemetry.phase("setup")
     os.makedirs(args.output_dir, exist_ok=True)
     
     print(f"C code directory: {args.c_code_dir}")
@@ -43,13 +483,44 @@ def main():
     else:
         raise FileNotFoundError(f"Required file time_series_model.c not found in {args.c_code_dir}")
     
+    # Copy the entry symbol header of a model family member, nn_wrapper.h includes it when present
+    wrapper_inputs = ["nn_wrapper.h"]
+    if os.path.exists(os.path.join(args.c_code_dir, ENTRY_HEADER)):
+        shutil.copy(os.path.join(args.c_code_dir, ENTRY_HEADER), work_dir)
+        wrapper_inputs.append(ENTRY_HEADER)
+        print(f"Copied {ENTRY_HEADER}")
+    
+    # Copy the prebuilt model library, compile_minimal.sh links against it when present
+    model_inputs = ["time_series_model.c"]
+    if args.model_lib_dir and not args.tune_apply and not args.static_arena:
+        shutil.copy(os.path.join(args.model_lib_dir, "libtime_series_model_minimal.a"), work_dir)
+        model_inputs = ["libtime_series_model_minimal.a"]
+        print("Copied libtime_series_model_minimal.a")
+    
+    # Replace onnx2c's tensor unions with a single arena packed by tensor lifetime
+    if args.static_arena:
+        with open(os.path.join(work_dir, "time_series_model.c"), "r") as f:
+            c_code = f.read()
+        tensors, _, union_size, arena_size = plan_memory(c_code)
+        if tensors:
+            with open(os.path.join(work_dir, "time_series_model.c"), "w") as f:
+                f.write(generate_arena_source(c_code, tensors, arena_size))
+            print(f"Placed {len(tensors)} intermediate tensors in a {arena_size} byte arena "
+                  f"(onnx2c unions: {union_size} bytes)")
+        else:
+            # The SIMD backend keeps its intermediates on the stack
+            print("No onnx2c tensor unions found, the model code is left unchanged")
+    
     # Load template files from local templates directory
+    telemetry.phase("load_templates")
     try:
         model_impl_content = read_template_file("model_impl.c")
         header_content = read_template_file("time_series_model.h")
         minimal_example_content = read_template_file("minimal_example.c")
         nn_wrapper_content = read_template_file("nn_wrapper.h")
         compile_script_content = read_template_file("compile_minimal.sh")
+        tune_model_content = read_template_file("tune_model.c")
+        latency_model_content = read_template_file("latency_model.c")
         readme_content = read_template_file("README.md")
         
         # Write template files to work directory
@@ -67,6 +538,12 @@ def main():
             
         with open(os.path.join(work_dir, "compile_minimal.sh"), "w") as f:
             f.write(compile_script_content)
+            
+        with open(os.path.join(work_dir, "tune_model.c"), "w") as f:
+            f.write(tune_model_content)
+            
+        with open(os.path.join(work_dir, "latency_model.c"), "w") as f:
+            f.write(latency_model_content)
     except FileNotFoundError as e:
         print(f"Error loading template files: {e}")
         raise
@@ -77,13 +554,50 @@ def main():
     # Change to the work directory
     os.chdir(work_dir)
     
+    # Search the compiler flag matrix for the fastest and smallest correct builds
+    opt_flags = []
+    if args.tune or args.tune_apply:
+        telemetry.phase("tune")
+        inputs_path = os.path.join(args.model_dir, "test_input.csv") if args.model_dir else None
+        expected_path = os.path.join(args.model_dir, "expected_output.csv") if args.model_dir else None
+        if not inputs_path or not os.path.exists(inputs_path):
+            # Without test data, use windows of consecutive time steps in the training data range (0..99)
+            window = read_window(ENTRY_HEADER)
+            inputs_path = "tune_input.csv"
+            expected_path = None
+            with open(inputs_path, "w") as f:
+                f.write("\n".join(",".join(str(float(t + i)) for i in range(window))
+                                  for t in range(max(1, 100 - window + 1))) + "\n")
+        elif not os.path.exists(expected_path):
+            expected_path = None
+        
+        print("Tuning compiler flags...")
+        winner = autotune(
+            inputs_path,
+            expected_path,
+            [march for march in args.tune_march.split(",") if march],
+            args.tune_iterations,
+            args.tune_tolerance,
+            args.tune_objective,
+            args.output_dir,
+            exclude_host_specific=args.tune_apply
+        )
+        if args.tune_apply:
+            opt_flags = [" ".join(winner)]
+            print(f"Building minimal binary with winning flags: {opt_flags[0]}")
+    
     # Run the compile script
+    telemetry.phase("build")
     print("Building minimal binary...")
     
-    result = subprocess.run(
-        ["./compile_minimal.sh"],
-        capture_output=True,
-        text=True
+    # A cache hit restores the binaries and the size report printed by the script
+    cache = BuildCache(args.cache_dir, args.cache_max_mb) if args.cache_dir else None
+    result = run_cached(
+        cache,
+        ["./compile_minimal.sh"] + opt_flags,
+        ["compile_minimal.sh", "minimal_example.c"] + wrapper_inputs + model_inputs,
+        ["minimal_nn", "minimal_nn_stripped"],
+        tools=["gcc", "strip"]
     )
     
     # Save the build output
@@ -93,6 +607,10 @@ def main():
         if result.stderr:
             f.write("\nErrors:\n")
             f.write(result.stderr)
+    check_build(result, "minimal binary")
+    
+    with open(os.path.join(args.output_dir, "memory_usage.json"), "w") as f:
+        json.dump(parse_memory_usage(result.stdout), f, indent=2)
     
     # Copy only the compiled binaries and necessary output files to the output directory
     for binary in ["minimal_nn", "minimal_nn_stripped"]:
@@ -100,13 +618,68 @@ def main():
             shutil.copy(binary, os.path.join(args.output_dir, binary))
             print(f"Copied {binary} to output directory")
     
+    if args.memory_report or args.static_arena or args.ram_limit:
+        telemetry.phase("memory_analysis")
+        analyze_memory(args, opt_flags, result.stdout)
+    
+    # Compare against a build of the int8 model if the training step quantized it
+    if os.path.exists(os.path.join(args.c_code_dir, "time_series_model_int8.c")):
+        telemetry.phase("int8")
+        build_quantized_binary(args, cache, opt_flags, result.stdout)
+    
+    # Compare against a build of the fixed-point model if the fixed_point step generated one
+    if args.fixed_point_dir:
+        telemetry.phase("fixed_point")
+        build_fixed_point_binary(args, cache, opt_flags, result.stdout)
+    
+    # Compare against a build of the sparse model if the sparse_codegen step generated one
+    if args.sparse_dir:
+        telemetry.phase("sparse")
+        build_sparse_binary(args, cache, opt_flags, result.stdout)
+    
+    # Compare against a build with the weights in a separate blob if the onnx2c step generated one
+    if os.path.exists(os.path.join(args.c_code_dir, "weights_layout.json")):
+        telemetry.phase("weight_blob")
+        build_blob_binary(args, cache, opt_flags)
+    
+    # Build the float (and fixed-point, sparse and int8) models for each embedded target and check the size budgets
+    if args.cross_targets:
+        telemetry.phase("cross_compile")
+        variants = {
+            "float": {"dir": os.getcwd(), "example": "minimal_example.c", "model_source": "time_series_model.c", "defines": []}
+        }
+        if args.fixed_point_dir:
+            variants["fixed"] = {"dir": os.path.abspath("fixed"), "example": "minimal_example.c",
+                                 "model_source": FIXED_POINT_SOURCE, "defines": ["-DTIME_SERIES_MODEL_FIXED"]}
+        if args.sparse_dir:
+            variants["sparse"] = {"dir": os.path.abspath("sparse"), "example": "minimal_example.c",
+                                  "model_source": "time_series_model.c", "defines": []}
+        if os.path.exists(os.path.join(args.c_code_dir, "time_series_model_int8.c")):
+            variants["int8"] = {"dir": os.path.abspath("int8"), "example": "minimal_example.c",
+                                "model_source": "time_series_model.c", "defines": []}
+        cross_report = cross_compile(
+            load_targets([target for target in args.cross_targets.split(",") if target], args.cross_targets_file),
+            variants,
+            opt_flags[0].split() if opt_flags else ["-Os"],
+            parse_budgets(args.cross_budget),
+            args.latency_iterations,
+            args.output_dir
+        )
+        if "int8" in variants:
+            compare_quantized_targets(cross_report, args.output_dir)
+    
     # Include minimal_example.c in the output for reference
+    telemetry.phase("copy_outputs")
     shutil.copy("minimal_example.c", os.path.join(args.output_dir, "minimal_example.c"))
     
     # Copy the README.md to the output directory
     with open(os.path.join(args.output_dir, "README.md"), "w") as f:
         f.write(readme_content)
     
+    if cache:
+        cache.report(args.output_dir)
+    
+    telemetry.write()
     print("Minimal binary build completed")
 
 if __name__ == "__main__":
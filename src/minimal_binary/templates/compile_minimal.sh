@@ -2,9 +2,21 @@
 
 echo "Compiling minimal neural network implementation using original onnx2c output..."
 
+# Link against the prebuilt model library if the compile_model step provided one,
+# otherwise compile the generated model code along with the example
+if [ -f libtime_series_model_minimal.a ]; then
+    echo "Using prebuilt libtime_series_model_minimal.a"
+    MODEL_INPUT=libtime_series_model_minimal.a
+else
+    MODEL_INPUT=time_series_model.c
+fi
+
+# Optimization flags can be passed as the first argument (e.g. the autotuner's winning flags)
+OPT_FLAGS="${1:--Os}"
+
 # Compile with size optimization
-gcc -Os -fdata-sections -ffunction-sections -Wl,--gc-sections \
-    minimal_example.c time_series_model.c -o minimal_nn -lm
+gcc $OPT_FLAGS -fdata-sections -ffunction-sections -Wl,--gc-sections \
+    minimal_example.c $MODEL_INPUT -o minimal_nn -lm
 
 # Check if compilation succeeded
 if [ $? -eq 0 ]; then
@@ -0,0 +1,75 @@
+#define _POSIX_C_SOURCE 199309L
+#include <stdio.h>
+#include <stdlib.h>
+#ifndef LATENCY_EXTERNAL_TIMER
+#include <time.h>
+#endif
+
+/**
+ * Latency harness comparing the float and fixed-point builds of the minimal binary.
+ * Usage: ./latency_model <iterations>
+ * Built with -DTIME_SERIES_MODEL_FIXED for the fixed-point model, prints "ns_per_inference: <value>".
+ * Built with -DLATENCY_EXTERNAL_TIMER for targets without a clock (e.g. under an emulator), it only
+ * runs the iterations and the caller times the whole process.
+ */
+
+#ifdef TIME_SERIES_MODEL_FIXED
+#include "time_series_model_fixed.h"
+typedef time_series_model_fixed_t sample_t;
+#define WINDOW TIME_SERIES_MODEL_FIXED_WINDOW
+#define TO_SAMPLE(x) TIME_SERIES_MODEL_FIXED_FROM_FLOAT(x)
+#define RUN(input, output) time_series_model_fixed_run(input, output)
+#else
+#include "nn_wrapper.h"
+typedef float sample_t;
+#define WINDOW TIME_SERIES_MODEL_WINDOW
+#define TO_SAMPLE(x) (x)
+#define RUN(input, output) nn_run_window(input, output)
+#endif
+
+// Inputs cycle over the same range as the training data (time steps 0..99)
+#define SERIES_PERIOD 100
+#define WARMUP_ITERATIONS 10000
+
+#ifndef LATENCY_EXTERNAL_TIMER
+static double now_seconds(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+#endif
+
+int main(int argc, char** argv) {
+    long iterations = argc > 1 ? atol(argv[1]) : 1000000;
+    if (iterations <= 0) {
+        printf("Error: invalid iteration count\n");
+        return 1;
+    }
+
+    static sample_t series[SERIES_PERIOD + WINDOW - 1];
+    for (int i = 0; i < SERIES_PERIOD + WINDOW - 1; i++) {
+        series[i] = TO_SAMPLE((float)(i % SERIES_PERIOD));
+    }
+
+    // Accumulate outputs so the compiler cannot drop the inference calls
+    volatile long sink = 0;
+    sample_t output;
+
+    for (long i = 0; i < WARMUP_ITERATIONS; i++) {
+        RUN(series + i % SERIES_PERIOD, &output);
+        sink += (long)output;
+    }
+
+#ifndef LATENCY_EXTERNAL_TIMER
+    double start = now_seconds();
+#endif
+    for (long i = 0; i < iterations; i++) {
+        RUN(series + i % SERIES_PERIOD, &output);
+        sink += (long)output;
+    }
+#ifndef LATENCY_EXTERNAL_TIMER
+    double elapsed = now_seconds() - start;
+    printf("ns_per_inference: %.3f\n", elapsed * 1e9 / iterations);
+#endif
+    return 0;
+}
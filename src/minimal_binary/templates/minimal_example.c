@@ -5,15 +5,18 @@
  * This represents the code that would run on the microcontroller
  */
 int main(void) {
-    // Example input value (would come from sensors in real deployment)
-    float input_value = 42.0f;
+    // Example readings (would come from sensors in real deployment)
+    static const float readings[] = {40.0f, 41.0f, 42.0f, 43.0f};
+    static nn_stream_t stream;
     float prediction = 0.0f;
     
-    // Run neural network inference
-    nn_run(input_value, &prediction);
-    
-    // On a microcontroller, you would use the prediction here
-    // e.g., control an actuator, make a decision, etc.
+    // Run neural network inference on every new reading once the window is full
+    for (size_t i = 0; i < sizeof(readings) / sizeof(readings[0]); i++) {
+        if (nn_push(&stream, readings[i], &prediction)) {
+            // On a microcontroller, you would use the prediction here
+            // e.g., control an actuator, make a decision, etc.
+        }
+    }
     
     return 0;
-}
\ No newline at end of file
+}
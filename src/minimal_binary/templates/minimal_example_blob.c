@@ -0,0 +1,32 @@
+#include "nn_wrapper.h"
+#include "time_series_model_weights.h"
+
+/**
+ * Minimal example of using the neural network with its weights in a separate blob
+ * The blob is linked into the .model_weights section by time_series_model_weights.S, so that
+ * retrained weights can be flashed on their own as long as the weight layout is unchanged
+ */
+int main(void) {
+    // Example readings (would come from sensors in real deployment)
+    static const float readings[] = {40.0f, 41.0f, 42.0f, 43.0f};
+    static nn_stream_t stream;
+    float prediction = 0.0f;
+    
+    // Check the blob against the layout the code was compiled for before the first inference
+    if (TIME_SERIES_MODEL_BIND_WEIGHTS(TIME_SERIES_MODEL_WEIGHT_BLOB,
+                                       (size_t)(TIME_SERIES_MODEL_WEIGHT_BLOB_END - TIME_SERIES_MODEL_WEIGHT_BLOB))
+        != TIME_SERIES_MODEL_WEIGHTS_OK) {
+        // On a microcontroller, you would report the error and keep the outputs disabled
+        return 1;
+    }
+    
+    // Run neural network inference on every new reading once the window is full
+    for (size_t i = 0; i < sizeof(readings) / sizeof(readings[0]); i++) {
+        if (nn_push(&stream, readings[i], &prediction)) {
+            // On a microcontroller, you would use the prediction here
+            // e.g., control an actuator, make a decision, etc.
+        }
+    }
+    
+    return 0;
+}
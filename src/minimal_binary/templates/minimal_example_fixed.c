@@ -0,0 +1,21 @@
+#include "time_series_model_fixed.h"
+
+/**
+ * Minimal example of using the fixed-point neural network
+ * This represents the code that would run on a microcontroller without an FPU
+ */
+int main(void) {
+    // Example input window (would come from an ADC in real deployment), converted at compile time
+    static const time_series_model_fixed_t input[TIME_SERIES_MODEL_FIXED_WINDOW] = {
+        TIME_SERIES_MODEL_FIXED_FROM_FLOAT(42.0f)
+    };
+    time_series_model_fixed_t prediction = 0;
+    
+    // Run neural network inference with integer arithmetic only
+    time_series_model_fixed_run(input, &prediction);
+    
+    // On a microcontroller, you would use the prediction here
+    // e.g., control an actuator, make a decision, etc.
+    
+    return 0;
+}
@@ -1,13 +1,52 @@
 #ifndef NN_WRAPPER_H
 #define NN_WRAPPER_H
 
+#include <stddef.h>
+
+// Models converted as part of a model family have prefixed entry symbols,
+// windowed models have their window size here too
+#if defined(__has_include)
+#if __has_include("time_series_model_entry.h")
+#include "time_series_model_entry.h"
+#endif
+#endif
+#ifndef TIME_SERIES_MODEL_ENTRY
+#define TIME_SERIES_MODEL_ENTRY entry
+#endif
+#ifndef TIME_SERIES_MODEL_WINDOW
+#define TIME_SERIES_MODEL_WINDOW 1
+#endif
+
 #ifdef __cplusplus
 extern "C" {
 #endif
 
 // Forward declaration of the entry function from onnx2c output
-extern void entry(const float input[1][1], float output[1][1]);
+extern void TIME_SERIES_MODEL_ENTRY(const float input[1][TIME_SERIES_MODEL_WINDOW], float output[1][1]);
+
+/**
+ * Streaming state for nn_push, one per sensor stream. Zero-initialise it to start
+ * (or restart) a stream. Each reading is stored twice, TIME_SERIES_MODEL_WINDOW floats
+ * apart, so the latest window is always contiguous and never shifted.
+ */
+typedef struct {
+    float buffer[2 * TIME_SERIES_MODEL_WINDOW];
+    size_t pos;
+    size_t count;
+} nn_stream_t;
 
+/**
+ * Run the neural network inference on one window
+ * 
+ * @param window_values Pointer to TIME_SERIES_MODEL_WINDOW input values, oldest first
+ * @param output_value Pointer to store the output
+ */
+static inline void nn_run_window(const float* window_values, float* output_value) {
+    // A contiguous buffer has the same layout as a [1][WINDOW] array, so no copies are needed
+    TIME_SERIES_MODEL_ENTRY((const float (*)[TIME_SERIES_MODEL_WINDOW])window_values, (float (*)[1])output_value);
+}
+
+#if TIME_SERIES_MODEL_WINDOW == 1
 /**
  * Run the neural network inference
  * 
@@ -15,18 +54,44 @@ extern void entry(const float input[1][1], float output[1][1]);
  * @param output_value Pointer to store the output
  */
 static inline void nn_run(float input_value, float* output_value) {
-    float input_array[1][1] = {{input_value}};
-    float output_array[1][1];
-    
-    // Call the entry function from the onnx2c generated code
-    entry(input_array, output_array);
-    
-    // Copy output
-    *output_value = output_array[0][0];
+    nn_run_window(&input_value, output_value);
+}
+#endif
+
+/**
+ * Run the neural network inference over a contiguous buffer of samples
+ * 
+ * @param input_values Pointer to n * TIME_SERIES_MODEL_WINDOW input values
+ * @param output_values Pointer to n floats to store the outputs
+ * @param n Number of samples
+ */
+static inline void nn_run_batch(const float* input_values, float* output_values, size_t n) {
+    for (size_t i = 0; i < n; i++) {
+        nn_run_window(input_values + i * TIME_SERIES_MODEL_WINDOW, output_values + i);
+    }
+}
+
+/**
+ * Append a reading to a stream and run inference on its latest window
+ * 
+ * @param stream Streaming state
+ * @param sample The newest reading
+ * @param output_value Pointer to store the output
+ * @return 1 if an output was written, 0 while the window is still filling
+ */
+static inline int nn_push(nn_stream_t* stream, float sample, float* output_value) {
+    stream->buffer[stream->pos] = sample;
+    stream->buffer[stream->pos + TIME_SERIES_MODEL_WINDOW] = sample;
+    stream->pos = stream->pos + 1 == TIME_SERIES_MODEL_WINDOW ? 0 : stream->pos + 1;
+    if (stream->count < TIME_SERIES_MODEL_WINDOW && ++stream->count < TIME_SERIES_MODEL_WINDOW) {
+        return 0;
+    }
+    nn_run_window(stream->buffer + stream->pos, output_value);
+    return 1;
 }
 
 #ifdef __cplusplus
 }
 #endif
 
-#endif /* NN_WRAPPER_H */
\ No newline at end of file
+#endif /* NN_WRAPPER_H */
@@ -1,24 +1,73 @@
 #ifndef TIME_SERIES_MODEL_H
 #define TIME_SERIES_MODEL_H
 
+#include <stddef.h>
+
+/* Written by the conversion step for model families and windowed models */
+#if defined(__has_include)
+#if __has_include("time_series_model_entry.h")
+#include "time_series_model_entry.h"
+#endif
+#endif
+
+/* Number of consecutive readings the model takes as input, oldest first */
+#ifndef TIME_SERIES_MODEL_WINDOW
+#define TIME_SERIES_MODEL_WINDOW 1
+#endif
+
 #ifdef __cplusplus
 extern "C" {
 #endif
 
 /**
- * Initialize the model (if needed)
- * For this simple model, this is a no-op, but included for API completeness
+ * Initialize the model and clear the streaming window
  */
 void time_series_model_init(void);
 
 /**
  * Run inference with the neural network model
  * 
- * @param input_data Pointer to a single float value (the time input)
+ * @param input_data Pointer to TIME_SERIES_MODEL_WINDOW float values, oldest first
+ *                   (a single time input for non-windowed models)
  * @param output_data Pointer to a float where the prediction will be stored
  */
 void time_series_model_run(const float* input_data, float* output_data);
 
+/**
+ * Run inference over a contiguous buffer of samples
+ * 
+ * Full batches are processed by the batched kernel when it was generated
+ * (TIME_SERIES_MODEL_HAVE_BATCH), the remainder one sample at a time.
+ * 
+ * @param input_data Pointer to n * TIME_SERIES_MODEL_WINDOW float values (one window per sample)
+ * @param output_data Pointer to n floats where the predictions will be stored
+ * @param n Number of samples
+ */
+void time_series_model_run_batch(const float* input_data, float* output_data, size_t n);
+
+/**
+ * Append a reading to the streaming window and run inference on the latest window
+ * 
+ * The window is kept in a static ring buffer, so each call costs O(1) besides the
+ * inference itself and the caller does not copy or shift any readings.
+ * 
+ * @param sample The newest reading
+ * @param output_data Pointer to a float where the prediction will be stored
+ * @return 1 if a prediction was written, 0 while fewer than TIME_SERIES_MODEL_WINDOW
+ *         readings have been pushed since the last reset
+ */
+int time_series_model_push(float sample, float* output_data);
+
+/**
+ * Clear the streaming window, e.g. after a gap in the readings
+ */
+void time_series_model_reset(void);
+
+/**
+ * Return TIME_SERIES_MODEL_WINDOW, for callers that load the model dynamically
+ */
+size_t time_series_model_window(void);
+
 /**
  * Clean up any resources used by the model (if needed)
  * For this simple model, this is a no-op, but included for API completeness
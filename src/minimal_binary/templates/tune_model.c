@@ -0,0 +1,103 @@
+#define _POSIX_C_SOURCE 199309L
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+#include "nn_wrapper.h"
+
+/**
+ * Harness used by the flag autotuner.
+ * Usage: ./tune_model <inputs.csv> <outputs.txt> <iterations>
+ * Each input line holds one window of TIME_SERIES_MODEL_WINDOW comma-separated values.
+ * Writes one prediction per input line, then times `iterations` inferences
+ * and prints "ns_per_inference: <value>".
+ */
+
+#define WARMUP_ITERATIONS 10000
+
+static double now_seconds(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+int main(int argc, char** argv) {
+    if (argc != 4) {
+        printf("Usage: %s <inputs.csv> <outputs.txt> <iterations>\n", argv[0]);
+        return 1;
+    }
+
+    FILE* input_file = fopen(argv[1], "r");
+    if (!input_file) {
+        printf("Error: Could not open file %s\n", argv[1]);
+        return 1;
+    }
+
+    // Read inputs in a single pass, growing the buffer as needed
+    size_t count = 0, capacity = 1024;
+    float* inputs = (float*)malloc(capacity * sizeof(float));
+    float value;
+    while (inputs && fscanf(input_file, "%f%*[,]", &value) == 1) {
+        if (count == capacity) {
+            capacity *= 2;
+            inputs = (float*)realloc(inputs, capacity * sizeof(float));
+            if (!inputs) {
+                break;
+            }
+        }
+        inputs[count++] = value;
+    }
+    fclose(input_file);
+
+    if (!inputs || count == 0 || count % TIME_SERIES_MODEL_WINDOW != 0) {
+        printf("Error: Expected a whole number of %d-value windows, loaded %zu values\n",
+               TIME_SERIES_MODEL_WINDOW, count);
+        free(inputs);
+        return 1;
+    }
+    count /= TIME_SERIES_MODEL_WINDOW;
+
+    float* outputs = (float*)malloc(count * sizeof(float));
+    if (!outputs) {
+        printf("Error: Memory allocation failed\n");
+        free(inputs);
+        return 1;
+    }
+
+    // Predictions for the correctness check
+    nn_run_batch(inputs, outputs, count);
+
+    FILE* output_file = fopen(argv[2], "w");
+    if (!output_file) {
+        printf("Error: Could not open file %s\n", argv[2]);
+        free(inputs);
+        free(outputs);
+        return 1;
+    }
+    for (size_t i = 0; i < count; i++) {
+        fprintf(output_file, "%.9g\n", outputs[i]);
+    }
+    fclose(output_file);
+
+    // Latency measurement
+    long iterations = atol(argv[3]);
+    volatile float sink = 0.0f;
+    float prediction;
+
+    for (long i = 0; i < WARMUP_ITERATIONS; i++) {
+        nn_run_window(inputs + (size_t)i % count * TIME_SERIES_MODEL_WINDOW, &prediction);
+        sink += prediction;
+    }
+
+    double start = now_seconds();
+    for (long i = 0; i < iterations; i++) {
+        nn_run_window(inputs + (size_t)i % count * TIME_SERIES_MODEL_WINDOW, &prediction);
+        sink += prediction;
+    }
+    double elapsed = now_seconds() - start;
+
+    printf("ns_per_inference: %.3f\n", elapsed * 1e9 / iterations);
+
+    free(inputs);
+    free(outputs);
+    return 0;
+}
@@ -1,53 +1,288 @@
 """
 Script for converting ONNX model to C code using onnx2c.
 This will run inside the AML pipeline.
+
+With --backend simd, the float kernels are generated by simd_codegen.py instead, with the same entry
+symbols and signatures. The onnx2c output is kept next to them as the reference the test step
+verifies and benchmarks them against.
+
+With --weights blob, time_series_model_blob.c (and the batch counterpart) are written next to the
+sources, with the constant tensors replaced by pointers into time_series_model_weights.bin (see
+weight_blob.py), so that retrained weights of the same architecture can ship without recompiling.
 """
 import os
+import re
+import sys
 import argparse
-import subprocess
 import glob
+from concurrent.futures import ThreadPoolExecutor
+import onnx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.build_cache import BuildCache, tool_version
+from common.dense_layers import extract_layers
+from common.fan_out import model_name
+from common.telemetry import Telemetry, timed_run
+import simd_codegen
+import weight_blob
+
+BACKENDS = ["onnx2c", "simd"]
+WEIGHT_MODES = ["compiled", "blob"]
+
+# Sources of the SIMD backend, part of the build cache key of the code it generates
+SIMD_GENERATOR_FILES = [
+    os.path.abspath(simd_codegen.__file__),
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common", "dense_layers.py")
+]
+
+# Source of the weight blob generator, part of the build cache key when --weights blob is used
+BLOB_GENERATOR_FILES = [os.path.abspath(weight_blob.__file__)]
+
+def run_onnx2c(onnx_model_path, extra_args=None):
+    """Run onnx2c on a model and return the generated C source."""
+    result = timed_run(
+        ["onnx2c"] + (extra_args or []) + [onnx_model_path],
+        capture_output=True,
+        text=True
+    )
+    
+    if result.returncode != 0:
+        raise RuntimeError(f"onnx2c failed with error: {result.stderr}")
+    
+    return result.stdout
+
+def rename_entry(c_code, name):
+    """Rename the entry function, the only global symbol in onnx2c output."""
+    c_code, renamed = re.subn(r"^void entry\(", f"void {name}(", c_code, flags=re.MULTILINE)
+    if renamed != 1:
+        raise RuntimeError("Could not find the entry function in the onnx2c output")
+    return c_code
+
+def input_window(c_code):
+    """Return the number of input values per sample, from the [batch][window] input of the entry function."""
+    match = re.search(r"^void \w*entry\(const float \w+\[\d+\]\[(\d+)\]", c_code, flags=re.MULTILINE)
+    if match is None:
+        raise RuntimeError("Could not find a [batch][window] float input in the entry function of the onnx2c output")
+    return int(match.group(1))
+
+def quantized_companion(onnx_model_path, quantized_files):
+    """Return the int8 model exported next to a float model (<name>_int8.onnx), or None."""
+    path = onnx_model_path[:-len(".onnx")] + "_int8.onnx"
+    return path if path in quantized_files else None
+
+def unoptimized_companion(onnx_model_path):
+    """Return the original graph kept by the ONNX optimisation step (unoptimized/<name>.onnx), or None."""
+    path = os.path.join(os.path.dirname(onnx_model_path), "unoptimized", os.path.basename(onnx_model_path))
+    return path if os.path.exists(path) else None
+
+def write_source(path, c_code):
+    """Write generated C code and return its path."""
+    with open(path, "w") as f:
+        f.write(c_code)
+    return path
+
+def convert(onnx_model_path, quantized_model_path, output_dir, batch_size, prefix="", unoptimized_model_path=None,
+            backend="onnx2c", simd_lanes=4, weights="compiled"):
+    """
+    Convert an ONNX model (and its int8 and unoptimised companions, if any) to C and return the
+    paths of the generated files. A non-empty prefix is prepended to the entry symbols so that several
+    models can be linked into the same binary. Windowed models (more than one input value per sample)
+    get their window size in the entry header. With weights="blob", the float kernels are also written
+    with their weights moved to a separate blob.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    entry_name = f"{prefix}entry"
+    
+    # Output C file path
+    c_output_path = os.path.join(output_dir, "time_series_model.c")
+    
+    # Convert ONNX to C using onnx2c
+    print(f"Converting {os.path.basename(onnx_model_path)} to C code...")
+    
+    c_code = run_onnx2c(onnx_model_path)
+    window = input_window(c_code)
+    if prefix:
+        c_code = rename_entry(c_code, entry_name)
+    
+    generated_files = []
+    layers = None
+    if backend == "simd":
+        generated_files.append(write_source(os.path.join(output_dir, "time_series_model_onnx2c.c"), c_code))
+        print(f"Generating SIMD kernels with {simd_lanes} lanes...")
+        layers = extract_layers(onnx.load(onnx_model_path))
+        c_code = simd_codegen.generate_source(layers, simd_lanes, entry_name, os.path.basename(onnx_model_path))
+    
+    # Save the C code to file - this is the only output needed by the minimal binary step
+    with open(c_output_path, "w") as f:
+        f.write(c_code)
+    
+    print(f"C code saved to {c_output_path}")
+    generated_files.append(c_output_path)
+    blob_units = [{"path": os.path.join(output_dir, "time_series_model_blob.c"), "code": c_code,
+                   "setter": f"{entry_name}_set_weights"}]
+    
+    # The C templates pick up the prefixed entry name and the window size from this header when it exists
+    if prefix or window > 1:
+        entry_header_path = os.path.join(output_dir, "time_series_model_entry.h")
+        with open(entry_header_path, "w") as f:
+            f.write("#ifndef TIME_SERIES_MODEL_ENTRY_H\n")
+            f.write("#define TIME_SERIES_MODEL_ENTRY_H\n\n")
+            f.write(f"#define TIME_SERIES_MODEL_ENTRY {entry_name}\n")
+            f.write(f"#define TIME_SERIES_MODEL_WINDOW {window}\n\n")
+            f.write("#endif /* TIME_SERIES_MODEL_ENTRY_H */\n")
+        generated_files.append(entry_header_path)
+    
+    # Generate a second kernel with the dynamic batch_size axis fixed to a larger value.
+    # Its entry symbol is renamed to entry_batch to let both kernels be linked into the same binary.
+    if batch_size > 1:
+        print(f"Converting {os.path.basename(onnx_model_path)} to C code with batch size {batch_size}...")
+        batch_entry_name = f"{prefix}entry_batch"
+        batch_code = rename_entry(run_onnx2c(onnx_model_path, ["-d", f"batch_size:{batch_size}"]), batch_entry_name)
+        if layers is not None:
+            generated_files.append(write_source(os.path.join(output_dir, "time_series_model_batch_onnx2c.c"), batch_code))
+            batch_code = simd_codegen.generate_batch_source(layers, simd_lanes, batch_size, batch_entry_name,
+                                                            os.path.basename(onnx_model_path))
+        
+        batch_c_path = os.path.join(output_dir, "time_series_model_batch.c")
+        batch_h_path = os.path.join(output_dir, "time_series_model_batch.h")
+        with open(batch_c_path, "w") as f:
+            f.write(batch_code)
+        
+        with open(batch_h_path, "w") as f:
+            f.write("#ifndef TIME_SERIES_MODEL_BATCH_H\n")
+            f.write("#define TIME_SERIES_MODEL_BATCH_H\n\n")
+            f.write(f"#define TIME_SERIES_MODEL_BATCH_SIZE {batch_size}\n")
+            f.write(f"#define TIME_SERIES_MODEL_ENTRY_BATCH {batch_entry_name}\n\n")
+            f.write(f"extern void TIME_SERIES_MODEL_ENTRY_BATCH(const float input[TIME_SERIES_MODEL_BATCH_SIZE][{window}], "
+                    "float output[TIME_SERIES_MODEL_BATCH_SIZE][1]);\n\n")
+            f.write("#endif /* TIME_SERIES_MODEL_BATCH_H */\n")
+        
+        print("Batched C code saved to time_series_model_batch.c")
+        generated_files += [batch_c_path, batch_h_path]
+        blob_units.append({"path": os.path.join(output_dir, "time_series_model_batch_blob.c"), "code": batch_code,
+                           "setter": f"{batch_entry_name}_set_weights"})
+    
+    # Both kernels read their weights from the same blob, bound by a single call
+    if weights == "blob":
+        generated_files += weight_blob.write_blob_files(output_dir, blob_units, entry_name,
+                                                        os.path.basename(onnx_model_path))
+    
+    # The int8 model keeps the float entry interface and the same entry name
+    if quantized_model_path:
+        print(f"Converting {os.path.basename(quantized_model_path)} to C code...")
+        int8_c_path = os.path.join(output_dir, "time_series_model_int8.c")
+        int8_code = run_onnx2c(quantized_model_path)
+        if prefix:
+            int8_code = rename_entry(int8_code, entry_name)
+        with open(int8_c_path, "w") as f:
+            f.write(int8_code)
+        print(f"Quantized C code saved to {int8_c_path}")
+        generated_files.append(int8_c_path)
+    
+    # The graph before optimisation is converted too, so that the test step can measure the gain
+    if unoptimized_model_path:
+        print(f"Converting unoptimised {os.path.basename(unoptimized_model_path)} to C code...")
+        unoptimized_c_path = os.path.join(output_dir, "time_series_model_unoptimized.c")
+        unoptimized_code = run_onnx2c(unoptimized_model_path)
+        if prefix:
+            unoptimized_code = rename_entry(unoptimized_code, entry_name)
+        with open(unoptimized_c_path, "w") as f:
+            f.write(unoptimized_code)
+        generated_files.append(unoptimized_c_path)
+    
+    return generated_files
+
+def convert_cached(cache, onnx_model_path, quantized_model_path, output_dir, batch_size, prefix="",
+                   unoptimized_model_path=None, backend="onnx2c", simd_lanes=4, weights="compiled"):
+    """Convert a model, restoring the generated code from the build cache when the inputs are unchanged."""
+    if cache is None:
+        return convert(onnx_model_path, quantized_model_path, output_dir, batch_size, prefix, unoptimized_model_path,
+                       backend, simd_lanes, weights)
+    
+    # The generated code only depends on the model bytes, the onnx2c build, the batch size, the prefix
+    # the weight storage and, for the SIMD backend and the weight blob, the generator sources and the lane count
+    generators = (SIMD_GENERATOR_FILES if backend == "simd" else []) + (BLOB_GENERATOR_FILES if weights == "blob" else [])
+    cache_key = BuildCache.make_key(
+        files=[onnx_model_path] + [path for path in [quantized_model_path, unoptimized_model_path] if path] + generators,
+        values=["onnx2c", tool_version("onnx2c"), batch_size, prefix, backend, simd_lanes, weights]
+    )
+    metadata = cache.get(cache_key, output_dir)
+    if metadata is not None:
+        print(f"Build cache hit, restored {', '.join(metadata['files'])} without running onnx2c")
+        return [os.path.join(output_dir, name) for name in metadata["files"]]
+    
+    generated_files = convert(onnx_model_path, quantized_model_path, output_dir, batch_size, prefix,
+                              unoptimized_model_path, backend, simd_lanes, weights)
+    cache.put(cache_key, generated_files)
+    return generated_files
 
 def main():
     # Parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("--model_dir", type=str, help="Directory containing ONNX model")
     parser.add_argument("--output_dir", type=str, help="Output directory for C code")
+    parser.add_argument("--batch_size", type=int, default=64,
+                        help="Batch size for the batched kernel (1 disables it)")
+    parser.add_argument("--backend", type=str, choices=BACKENDS, default="onnx2c",
+                        help="Generator of the float kernels: onnx2c, or simd for vectorised dense layer kernels "
+                             "(the onnx2c output is kept as time_series_model_onnx2c.c for comparison)")
+    parser.add_argument("--simd_lanes", type=int, default=4,
+                        help="Vector width in floats of the SIMD backend (4 for SSE/NEON, 8 for AVX)")
+    parser.add_argument("--weights", type=str, choices=WEIGHT_MODES, default="compiled",
+                        help="Weight storage: compiled-in C literals, or blob to also write sources that read "
+                             "their weights from time_series_model_weights.bin")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(),
+                        help="Number of models to convert in parallel")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Build cache directory (disabled if not set)")
+    parser.add_argument("--cache_max_mb", type=float, default=1024, help="Maximum build cache size in MB")
     args = parser.parse_args()
+    telemetry = Telemetry("onnx2c", args.output_dir)
     
     print("Starting ONNX to C conversion process...")
+    telemetry.phase("setup")
     
     # Create output directory
     os.makedirs(args.output_dir, exist_ok=True)
     
-    # Find ONNX model file
-    onnx_files = glob.glob(os.path.join(args.model_dir, "*.onnx"))
+    # Find ONNX model files, each with an optional int8 companion (<name>_int8.onnx)
+    onnx_files = sorted(glob.glob(os.path.join(args.model_dir, "*.onnx")))
+    quantized_files = [path for path in onnx_files if path.endswith("_int8.onnx")]
+    onnx_files = [path for path in onnx_files if path not in quantized_files]
     if not onnx_files:
         raise FileNotFoundError(f"No ONNX model found in {args.model_dir}")
     
-    onnx_model_path = onnx_files[0]
-    print(f"Found ONNX model: {onnx_model_path}")
-    
-    # Output C file path
-    c_output_path = os.path.join(args.output_dir, "time_series_model.c")
+    cache = BuildCache(args.cache_dir, args.cache_max_mb) if args.cache_dir else None
     
-    # Convert ONNX to C using onnx2c
-    print(f"Converting ONNX model to C code...")
+    telemetry.phase("convert")
+    if len(onnx_files) == 1:
+        # A single model keeps the flat output layout and the plain entry symbol
+        onnx_model_path = onnx_files[0]
+        print(f"Found ONNX model: {onnx_model_path}")
+        convert_cached(cache, onnx_model_path, quantized_companion(onnx_model_path, quantized_files), args.output_dir,
+                       args.batch_size, unoptimized_model_path=unoptimized_companion(onnx_model_path),
+                       backend=args.backend, simd_lanes=args.simd_lanes, weights=args.weights)
+    else:
+        # A model family is written to one subdirectory per model, with prefixed entry symbols
+        names = [model_name(path) for path in onnx_files]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Model names are not unique after sanitising: {names}")
+        print(f"Found {len(onnx_files)} ONNX models, converting with {args.jobs} workers: {', '.join(names)}")
+        
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+            futures = [
+                pool.submit(convert_cached, cache, path, quantized_companion(path, quantized_files),
+                            os.path.join(args.output_dir, name), args.batch_size, f"{name}_",
+                            unoptimized_companion(path), args.backend, args.simd_lanes, args.weights)
+                for path, name in zip(onnx_files, names)
+            ]
+            for future in futures:
+                future.result()
     
-    result = subprocess.run(
-        ["onnx2c", onnx_model_path],
-        capture_output=True,
-        text=True
-    )
+    if cache:
+        cache.report(args.output_dir)
     
-    if result.returncode != 0:
-        raise RuntimeError(f"onnx2c failed with error: {result.stderr}")
-    
-    # Save the C code to file - this is the only actual output of this step
-    with open(c_output_path, "w") as f:
-        f.write(result.stdout)
-    
-    print(f"C code saved to {c_output_path}")
+    telemetry.write()
     print("ONNX to C conversion completed successfully")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
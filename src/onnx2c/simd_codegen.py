@@ -0,0 +1,228 @@
+"""
+SIMD code generation for dense models, as an alternative backend to the onnx2c output.
+The Gemm/Relu chain read by common/dense_layers.py is emitted as blocked kernels written with the
+GCC vector extensions, which GCC (and clang) lower to SSE/AVX on x86, NEON or MVE on Arm, and to
+plain scalar code on cores without a vector unit. Compilers without the extensions, or builds that
+define TIME_SERIES_MODEL_SCALAR, get the same blocks as portable scalar loops, unrolled over the
+block like the CMSIS-DSP kernels.
+
+The single-sample kernel is vectorised over the output neurons of a layer (with the weights
+transposed and the outputs padded to a multiple of the lane count), the batch kernel over LANES
+samples at a time. Both accumulate every output in input order and add the bias last, like the
+scalar loops, so their results match the onnx2c ones up to floating-point contraction.
+"""
+import numpy as np
+from common.dense_layers import c_floats
+
+def padded(size, lanes):
+    """Round size up to a multiple of lanes."""
+    return -(-size // lanes) * lanes
+
+def c_matrix(matrix):
+    """Format a 2D array as a nested float initializer."""
+    return "{\n    " + ",\n    ".join(c_floats(row) for row in matrix) + "\n}"
+
+def model_shape(layers):
+    """Return (window, hidden sizes) of the layers, checking the single output of the onnx2c entry."""
+    outputs = layers[-1]["weight"].shape[0]
+    if outputs != 1:
+        raise ValueError(f"SIMD generation supports models with one output value, this one has {outputs}")
+    return layers[0]["weight"].shape[1], [layer["weight"].shape[0] for layer in layers]
+
+def vector_types(lanes):
+    """Return the C lines defining the lane count and, with the GCC vector extensions, the vector types."""
+    return [
+        "#include <stdint.h>",
+        "#include <string.h>",
+        "",
+        f"#define LANES {lanes}",
+        "",
+        "#if defined(__GNUC__) && !defined(TIME_SERIES_MODEL_SCALAR)",
+        "#define TIME_SERIES_MODEL_VECTOR 1",
+        "typedef float vfloat __attribute__((vector_size(LANES * sizeof(float))));",
+        "typedef int32_t vint __attribute__((vector_size(LANES * sizeof(float))));",
+        "#endif",
+        "",
+    ]
+
+# Dense layer over blocks of LANES outputs, weights stored as [inputs][padded outputs]
+SINGLE_KERNEL = """\
+#ifdef TIME_SERIES_MODEL_VECTOR
+static inline void dense(const float* weight, const float* bias, const float* x, float* y,
+                         int inputs, int outputs, int relu) {
+    const vfloat zero = {0};
+    for (int n = 0; n < outputs; n += LANES) {
+        vfloat acc = zero, w, b;
+        for (int k = 0; k < inputs; k++) {
+            memcpy(&w, weight + k * outputs + n, sizeof(w));
+            acc += w * x[k];
+        }
+        memcpy(&b, bias + n, sizeof(b));
+        acc += b;
+        if (relu) {
+            acc = (vfloat)((vint)acc & (acc > zero));
+        }
+        memcpy(y + n, &acc, sizeof(acc));
+    }
+}
+#else
+static inline void dense(const float* weight, const float* bias, const float* x, float* y,
+                         int inputs, int outputs, int relu) {
+    for (int n = 0; n < outputs; n += LANES) {
+        float acc[LANES] = {0};
+        for (int k = 0; k < inputs; k++) {
+            for (int l = 0; l < LANES; l++) {
+                acc[l] += weight[k * outputs + n + l] * x[k];
+            }
+        }
+        for (int l = 0; l < LANES; l++) {
+            acc[l] += bias[n + l];
+            y[n + l] = relu && !(acc[l] > 0.0f) ? 0.0f : acc[l];
+        }
+    }
+}
+#endif
+"""
+
+# Dense layer of one sample and of LANES samples at a time, weights stored as [outputs][inputs]
+BATCH_KERNELS = """\
+static inline void dense(const float* weight, const float* bias, const float* x, float* y,
+                         int inputs, int outputs, int relu) {
+    for (int n = 0; n < outputs; n++) {
+        float acc = 0.0f;
+        for (int k = 0; k < inputs; k++) {
+            acc += weight[n * inputs + k] * x[k];
+        }
+        acc += bias[n];
+        y[n] = relu && !(acc > 0.0f) ? 0.0f : acc;
+    }
+}
+
+#ifdef TIME_SERIES_MODEL_VECTOR
+static inline void dense_lanes(const float* weight, const float* bias, const vfloat* x, vfloat* y,
+                               int inputs, int outputs, int relu) {
+    const vfloat zero = {0};
+    for (int n = 0; n < outputs; n++) {
+        vfloat acc = zero;
+        for (int k = 0; k < inputs; k++) {
+            acc += weight[n * inputs + k] * x[k];
+        }
+        acc += bias[n];
+        if (relu) {
+            acc = (vfloat)((vint)acc & (acc > zero));
+        }
+        y[n] = acc;
+    }
+}
+#endif
+"""
+
+def layer_comment(index, layer):
+    """Return the comment line describing a layer."""
+    outputs, inputs = layer["weight"].shape
+    return f"/* Layer {index}: {inputs} -> {outputs}{', ReLU' if layer['relu'] else ''} */"
+
+def generate_source(layers, lanes, entry_name, source_name):
+    """Return the C source of the single-sample kernel, with the onnx2c entry signature."""
+    window, sizes = model_shape(layers)
+    lines = [
+        f"/* Generated by onnx2c/simd_codegen.py from {source_name}: dense layers vectorised over the outputs */",
+    ] + vector_types(lanes)
+
+    for index, layer in enumerate(layers):
+        outputs, inputs = layer["weight"].shape
+        width = padded(outputs, lanes)
+        weight = np.zeros((inputs, width), dtype=np.float32)
+        weight[:, :outputs] = layer["weight"].T
+        bias = np.zeros(width, dtype=np.float32)
+        bias[:outputs] = layer["bias"]
+        lines += [
+            layer_comment(index, layer),
+            f"static const float layer{index}_weight[{inputs}][{width}] = {c_matrix(weight)};",
+            f"static const float layer{index}_bias[{width}] = {c_floats(bias)};",
+            "",
+        ]
+
+    lines.append(SINGLE_KERNEL)
+    lines.append(f"void {entry_name}(const float tensor_input[1][{window}], float tensor_output[1][1]) {{")
+    previous = "tensor_input[0]"
+    for index, (layer, size) in enumerate(zip(layers, sizes)):
+        width = padded(size, lanes)
+        lines += [
+            f"    float a{index}[{width}];",
+            f"    dense(&layer{index}_weight[0][0], layer{index}_bias, {previous}, a{index}, "
+            f"{layer['weight'].shape[1]}, {width}, {int(layer['relu'])});",
+        ]
+        previous = f"a{index}"
+    lines += [f"    tensor_output[0][0] = {previous}[0];", "}"]
+    return "\n".join(lines) + "\n"
+
+def generate_batch_source(layers, lanes, batch_size, entry_name, source_name):
+    """Return the C source of the batch kernel, with the signature of the onnx2c batch entry."""
+    window, sizes = model_shape(layers)
+    lines = [
+        f"/* Generated by onnx2c/simd_codegen.py from {source_name}: dense layers vectorised over {lanes} samples */",
+    ] + vector_types(lanes)
+
+    for index, layer in enumerate(layers):
+        outputs, inputs = layer["weight"].shape
+        lines += [
+            layer_comment(index, layer),
+            f"static const float layer{index}_weight[{outputs}][{inputs}] = "
+            f"{c_matrix(layer['weight'].astype(np.float32))};",
+            f"static const float layer{index}_bias[{outputs}] = {c_floats(layer['bias'].astype(np.float32))};",
+            "",
+        ]
+    lines.append(BATCH_KERNELS)
+
+    # Remaining samples, and every sample without the vector extensions
+    lines.append(f"static void sample(const float x[{window}], float y[1]) {{")
+    previous = "x"
+    for index, (layer, size) in enumerate(zip(layers, sizes)):
+        target = "y" if index == len(layers) - 1 else f"a{index}"
+        if target != "y":
+            lines.append(f"    float a{index}[{size}];")
+        lines.append(f"    dense(&layer{index}_weight[0][0], layer{index}_bias, {previous}, {target}, "
+                     f"{layer['weight'].shape[1]}, {size}, {int(layer['relu'])});")
+        previous = target
+    lines += ["}", ""]
+
+    # LANES samples at a time, one sample per lane: the inputs are transposed into one vector per window position
+    lines += [
+        "#ifdef TIME_SERIES_MODEL_VECTOR",
+        f"static void block(const float input[LANES][{window}], float output[LANES][1]) {{",
+        f"    vfloat x[{window}];",
+        f"    for (int k = 0; k < {window}; k++) {{",
+        "        for (int l = 0; l < LANES; l++) {",
+        "            x[k][l] = input[l][k];",
+        "        }",
+        "    }",
+    ]
+    previous = "x"
+    for index, (layer, size) in enumerate(zip(layers, sizes)):
+        lines += [
+            f"    vfloat a{index}[{size}];",
+            f"    dense_lanes(&layer{index}_weight[0][0], layer{index}_bias, {previous}, a{index}, "
+            f"{layer['weight'].shape[1]}, {size}, {int(layer['relu'])});",
+        ]
+        previous = f"a{index}"
+    lines += [
+        "    for (int l = 0; l < LANES; l++) {",
+        f"        output[l][0] = {previous}[0][l];",
+        "    }",
+        "}",
+        "#endif",
+        "",
+        f"void {entry_name}(const float tensor_input[{batch_size}][{window}], float tensor_output[{batch_size}][1]) {{",
+        "    int i = 0;",
+        "#ifdef TIME_SERIES_MODEL_VECTOR",
+        f"    for (; i + LANES <= {batch_size}; i += LANES) {{",
+        "        block(tensor_input + i, tensor_output + i);",
+        "    }",
+        "#endif",
+        f"    for (; i < {batch_size}; i++) {{",
+        "        sample(tensor_input[i], tensor_output[i]);",
+        "    }",
+        "}",
+    ]
+    return "\n".join(lines) + "\n"
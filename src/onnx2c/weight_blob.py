@@ -0,0 +1,335 @@
+"""
+Weight blob generation: moves the constant tensors of the generated C code into a binary file.
+Every static const array of the model sources (the onnx2c weights or the SIMD backend layers) is
+replaced by a pointer of the same element type, so the code only depends on the weight layout:
+a retrain that keeps the architecture produces the same sources, and only the blob changes.
+
+The blob is a 32 byte little-endian header (magic, format version, header size, layout hash,
+payload size, CRC-32 of the payload) followed by the tensors, each aligned to 16 bytes. The
+generated loader checks the header against the layout the code was compiled with before pointing
+the tensors into the payload. On POSIX systems the blob is mapped read-only from a file; on
+microcontrollers time_series_model_weights.S links it into a .model_weights flash section.
+"""
+import os
+import re
+import json
+import zlib
+import struct
+import numpy as np
+
+MAGIC = b"TSMW"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIII12x")
+ALIGNMENT = 16
+
+BLOB_FILE = "time_series_model_weights.bin"
+HEADER_FILE = "time_series_model_weights.h"
+LOADER_FILE = "time_series_model_weights.c"
+SECTION_FILE = "time_series_model_weights.S"
+LAYOUT_FILE = "weights_layout.json"
+
+# NumPy types of the C element types that can be moved to the blob
+CTYPES = {
+    "float": "<f4", "double": "<f8",
+    "int8_t": "i1", "uint8_t": "u1", "int16_t": "<i2", "uint16_t": "<u2",
+    "int32_t": "<i4", "uint32_t": "<u4", "int64_t": "<i8", "uint64_t": "<u8",
+}
+
+CONSTANT_PATTERN = re.compile(
+    r"^static const (?P<ctype>\w+) (?P<name>\w+)(?P<dims>(?:\[\d+\])+) =\s*(?P<values>\{.*?\});\n",
+    re.MULTILINE | re.DOTALL
+)
+
+# Results of the generated bind function
+RESULTS = ["OK", "IO_ERROR", "BAD_MAGIC", "BAD_VERSION", "BAD_LAYOUT", "BAD_SIZE", "BAD_ALIGNMENT", "BAD_CHECKSUM"]
+
+def parse_values(text, ctype, count):
+    """Return the values of a C initializer as a flat array of the element type."""
+    tokens = [token for token in re.split(r"[\s{},]+", text) if token]
+    try:
+        if CTYPES[ctype].startswith("<f"):
+            values = [float(token.rstrip("fF")) for token in tokens]
+        else:
+            values = [int(token.rstrip("uUlL"), 0) for token in tokens]
+    except ValueError as e:
+        raise ValueError(f"Unsupported literal in a {ctype} initializer: {e}")
+    if len(values) != count:
+        raise ValueError(f"Expected {count} values in a {ctype} initializer, found {len(values)}")
+    return np.array(values, dtype=np.float64 if CTYPES[ctype].startswith("<f") else np.int64).astype(CTYPES[ctype])
+
+def extract_constants(c_code):
+    """Return the constant tensors of generated code: name, element type, dimensions, values and source span."""
+    constants = []
+    for match in CONSTANT_PATTERN.finditer(c_code):
+        if match.group("ctype") not in CTYPES:
+            continue
+        dims = [int(d) for d in re.findall(r"\[(\d+)\]", match.group("dims"))]
+        constants.append({
+            "name": match.group("name"),
+            "ctype": match.group("ctype"),
+            "dims": dims,
+            "values": parse_values(match.group("values"), match.group("ctype"), int(np.prod(dims))),
+            "span": match.span()
+        })
+    return constants
+
+def pointer_type(ctype, dims):
+    """Return the pointer type an array of dims decays to, and the declarator format for a name."""
+    inner = "".join(f"[{d}]" for d in dims[1:])
+    if inner:
+        return f"const {ctype} (*){inner}", f"const {ctype} (*{{name}}){inner}"
+    return f"const {ctype} *", f"const {ctype} *{{name}}"
+
+def externalize(c_code, constants, setter):
+    """Replace the constant tensors with pointers and append the function that points them into a payload."""
+    for constant in reversed(constants):
+        start, end = constant["span"]
+        declarator = pointer_type(constant["ctype"], constant["dims"])[1].format(name=constant["name"])
+        c_code = c_code[:start] + f"static {declarator};\n" + c_code[end:]
+    lines = [
+        "",
+        f"/* Points the weights at a payload checked by {LOADER_FILE} */",
+        f"void {setter}(const uint8_t* payload) {{",
+    ]
+    for constant in constants:
+        cast = pointer_type(constant["ctype"], constant["dims"])[0]
+        lines.append(f"    {constant['name']} = ({cast})(payload + {constant['offset']});")
+    lines.append("}")
+    if "#include <stdint.h>" not in c_code:
+        c_code = "#include <stdint.h>\n" + c_code
+    return c_code + "\n".join(lines) + "\n"
+
+def layout_blob(units):
+    """
+    Assign aligned payload offsets to the constants of every unit ({"setter", "constants"}) in order.
+    Returns the payload bytes and the layout, whose hash identifies the code a blob fits.
+    """
+    payload = bytearray()
+    layout = []
+    for unit in units:
+        for constant in unit["constants"]:
+            payload += bytes(-len(payload) % ALIGNMENT)
+            constant["offset"] = len(payload)
+            payload += constant["values"].tobytes()
+            layout.append({"setter": unit["setter"], "name": constant["name"], "ctype": constant["ctype"],
+                           "dims": constant["dims"], "offset": constant["offset"]})
+    payload += bytes(-len(payload) % ALIGNMENT)
+    return bytes(payload), layout
+
+def layout_hash(layout):
+    """Return the CRC-32 of the canonical layout description."""
+    return zlib.crc32(json.dumps(layout, sort_keys=True).encode())
+
+def pack_blob(payload, layout):
+    """Return the blob: header followed by the payload."""
+    return HEADER.pack(MAGIC, VERSION, HEADER.size, layout_hash(layout), len(payload), zlib.crc32(payload)) + payload
+
+def header_source(entry_name, layout, payload_bytes):
+    """Return the header declaring the loader of the blob and the layout it was compiled against."""
+    lines = [
+        "#ifndef TIME_SERIES_MODEL_WEIGHTS_H",
+        "#define TIME_SERIES_MODEL_WEIGHTS_H",
+        "",
+        "/* Generated by onnx2c/weight_blob.py: the weight blob layout the model code is compiled against */",
+        "#include <stddef.h>",
+        "#include <stdint.h>",
+        "",
+        f"#define TIME_SERIES_MODEL_WEIGHTS_MAGIC \"{MAGIC.decode()}\"",
+        f"#define TIME_SERIES_MODEL_WEIGHTS_VERSION {VERSION}",
+        f"#define TIME_SERIES_MODEL_WEIGHTS_HEADER_BYTES {HEADER.size}",
+        f"#define TIME_SERIES_MODEL_WEIGHTS_ALIGNMENT {ALIGNMENT}",
+        f"#define TIME_SERIES_MODEL_WEIGHTS_LAYOUT 0x{layout_hash(layout):08x}u",
+        f"#define TIME_SERIES_MODEL_WEIGHTS_PAYLOAD_BYTES {payload_bytes}",
+        "",
+        "/* Results of binding a blob */",
+    ]
+    lines += [f"#define TIME_SERIES_MODEL_WEIGHTS_{result} {-i}" for i, result in enumerate(RESULTS)]
+    lines += [
+        "",
+        f"#define TIME_SERIES_MODEL_BIND_WEIGHTS {entry_name}_bind_weights",
+        f"#define TIME_SERIES_MODEL_LOAD_WEIGHTS {entry_name}_load_weights",
+        f"#define TIME_SERIES_MODEL_WEIGHT_BLOB {entry_name}_weight_blob",
+        f"#define TIME_SERIES_MODEL_WEIGHT_BLOB_END {entry_name}_weight_blob_end",
+        "",
+        "#ifdef __cplusplus",
+        "extern \"C\" {",
+        "#endif",
+        "",
+        "/**",
+        " * Check a blob (header, layout, size, alignment and CRC-32) and point the model at its weights.",
+        " * The blob must stay in memory, unchanged, while the model runs.",
+        " */",
+        "int TIME_SERIES_MODEL_BIND_WEIGHTS(const void* blob, size_t size);",
+        "",
+        "/**",
+        " * Map a blob file read-only and bind it, releasing the previously loaded blob (POSIX systems only).",
+        " * Must not be called while an inference is running.",
+        " */",
+        "int TIME_SERIES_MODEL_LOAD_WEIGHTS(const char* path);",
+        "",
+        f"/* Start and end of the blob linked into the .model_weights section by {SECTION_FILE} */",
+        "extern const uint8_t TIME_SERIES_MODEL_WEIGHT_BLOB[];",
+        "extern const uint8_t TIME_SERIES_MODEL_WEIGHT_BLOB_END[];",
+        "",
+        "#ifdef __cplusplus",
+        "}",
+        "#endif",
+        "",
+        "#endif /* TIME_SERIES_MODEL_WEIGHTS_H */",
+    ]
+    return "\n".join(lines) + "\n"
+
+LOADER_TEMPLATE = """\
+/* Generated by onnx2c/weight_blob.py: checks the weight blob and points the model code at it */
+#include <stdint.h>
+#include <stddef.h>
+#include <string.h>
+#include "time_series_model_weights.h"
+
+{setters}
+
+static uint32_t read_u16(const uint8_t* p) {{
+    return (uint32_t)p[0] | (uint32_t)p[1] << 8;
+}}
+
+static uint32_t read_u32(const uint8_t* p) {{
+    return (uint32_t)p[0] | (uint32_t)p[1] << 8 | (uint32_t)p[2] << 16 | (uint32_t)p[3] << 24;
+}}
+
+/* Bitwise CRC-32 (IEEE), run once per bind, so no table is kept in flash */
+static uint32_t crc32(const uint8_t* data, size_t size) {{
+    uint32_t crc = 0xFFFFFFFFu;
+    for (size_t i = 0; i < size; i++) {{
+        crc ^= data[i];
+        for (int bit = 0; bit < 8; bit++) {{
+            crc = (crc >> 1) ^ (0xEDB88320u & (0u - (crc & 1u)));
+        }}
+    }}
+    return ~crc;
+}}
+
+int TIME_SERIES_MODEL_BIND_WEIGHTS(const void* blob, size_t size) {{
+    const uint8_t* bytes = (const uint8_t*)blob;
+    const uint8_t* payload = bytes + TIME_SERIES_MODEL_WEIGHTS_HEADER_BYTES;
+    if (size < TIME_SERIES_MODEL_WEIGHTS_HEADER_BYTES || memcmp(bytes, TIME_SERIES_MODEL_WEIGHTS_MAGIC, 4) != 0) {{
+        return TIME_SERIES_MODEL_WEIGHTS_BAD_MAGIC;
+    }}
+    if (read_u16(bytes + 4) != TIME_SERIES_MODEL_WEIGHTS_VERSION ||
+        read_u16(bytes + 6) != TIME_SERIES_MODEL_WEIGHTS_HEADER_BYTES) {{
+        return TIME_SERIES_MODEL_WEIGHTS_BAD_VERSION;
+    }}
+    if (read_u32(bytes + 8) != TIME_SERIES_MODEL_WEIGHTS_LAYOUT) {{
+        return TIME_SERIES_MODEL_WEIGHTS_BAD_LAYOUT;
+    }}
+    if (read_u32(bytes + 12) != TIME_SERIES_MODEL_WEIGHTS_PAYLOAD_BYTES ||
+        size - TIME_SERIES_MODEL_WEIGHTS_HEADER_BYTES < TIME_SERIES_MODEL_WEIGHTS_PAYLOAD_BYTES) {{
+        return TIME_SERIES_MODEL_WEIGHTS_BAD_SIZE;
+    }}
+    if ((uintptr_t)payload % TIME_SERIES_MODEL_WEIGHTS_ALIGNMENT != 0) {{
+        return TIME_SERIES_MODEL_WEIGHTS_BAD_ALIGNMENT;
+    }}
+    if (crc32(payload, TIME_SERIES_MODEL_WEIGHTS_PAYLOAD_BYTES) != read_u32(bytes + 16)) {{
+        return TIME_SERIES_MODEL_WEIGHTS_BAD_CHECKSUM;
+    }}
+{calls}
+    return TIME_SERIES_MODEL_WEIGHTS_OK;
+}}
+
+#if defined(__unix__) || defined(__APPLE__)
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+/* The mapping in use, released when another blob is loaded */
+static void* mapped_blob;
+static size_t mapped_size;
+
+int TIME_SERIES_MODEL_LOAD_WEIGHTS(const char* path) {{
+    int fd = open(path, O_RDONLY);
+    if (fd < 0) {{
+        return TIME_SERIES_MODEL_WEIGHTS_IO_ERROR;
+    }}
+    struct stat st;
+    if (fstat(fd, &st) != 0 || st.st_size <= 0) {{
+        close(fd);
+        return TIME_SERIES_MODEL_WEIGHTS_IO_ERROR;
+    }}
+    size_t size = (size_t)st.st_size;
+    void* blob = mmap(NULL, size, PROT_READ, MAP_PRIVATE, fd, 0);
+    close(fd);
+    if (blob == MAP_FAILED) {{
+        return TIME_SERIES_MODEL_WEIGHTS_IO_ERROR;
+    }}
+
+    int result = TIME_SERIES_MODEL_BIND_WEIGHTS(blob, size);
+    if (result != TIME_SERIES_MODEL_WEIGHTS_OK) {{
+        munmap(blob, size);
+        return result;
+    }}
+    if (mapped_blob) {{
+        munmap(mapped_blob, mapped_size);
+    }}
+    mapped_blob = blob;
+    mapped_size = size;
+    return TIME_SERIES_MODEL_WEIGHTS_OK;
+}}
+#endif
+"""
+
+SECTION_TEMPLATE = """\
+/* Generated by onnx2c/weight_blob.py: links {blob} into the .model_weights section (ELF toolchains) */
+    .section .model_weights,"a"
+    .balign {alignment}
+    .global {entry}_weight_blob
+    .global {entry}_weight_blob_end
+{entry}_weight_blob:
+    .incbin "{blob}"
+{entry}_weight_blob_end:
+"""
+
+def write_blob_files(output_dir, units, entry_name, source_name):
+    """
+    Move the constant tensors of the model sources of units ({"path", "code", "setter"}) to the weight
+    blob, and write the pointer-based sources, the blob, its loader, header, section and layout files.
+    Returns the paths of the written files.
+    """
+    for unit in units:
+        unit["constants"] = extract_constants(unit["code"])
+        if not unit["constants"]:
+            raise ValueError(f"No constant tensors found in {os.path.basename(unit['path'])}")
+    payload, layout = layout_blob(units)
+
+    written = []
+    for unit in units:
+        with open(unit["path"], "w") as f:
+            f.write(externalize(unit["code"], unit["constants"], unit["setter"]))
+        written.append(unit["path"])
+
+    setters = "\n".join(f"extern void {unit['setter']}(const uint8_t* payload);" for unit in units)
+    calls = "\n".join(f"    {unit['setter']}(payload);" for unit in units)
+    contents = {
+        BLOB_FILE: pack_blob(payload, layout),
+        HEADER_FILE: header_source(entry_name, layout, len(payload)),
+        LOADER_FILE: LOADER_TEMPLATE.format(setters=setters, calls=calls),
+        SECTION_FILE: SECTION_TEMPLATE.format(blob=BLOB_FILE, alignment=ALIGNMENT, entry=entry_name),
+        LAYOUT_FILE: json.dumps({
+            "model": source_name,
+            "version": VERSION,
+            "layout": f"0x{layout_hash(layout):08x}",
+            "payload_bytes": len(payload),
+            "payload_crc32": f"0x{zlib.crc32(payload):08x}",
+            "bind_symbol": f"{entry_name}_bind_weights",
+            "load_symbol": f"{entry_name}_load_weights",
+            "tensors": layout
+        }, indent=2)
+    }
+    for filename, content in contents.items():
+        path = os.path.join(output_dir, filename)
+        with open(path, "wb" if isinstance(content, bytes) else "w") as f:
+            f.write(content)
+        written.append(path)
+
+    print(f"Moved {len(layout)} constant tensors ({len(payload)} bytes) to {BLOB_FILE}, "
+          f"layout 0x{layout_hash(layout):08x}")
+    return written
@@ -0,0 +1,302 @@
+"""
+Graph rewrites applied to the exported ONNX model before it is converted by onnx2c.
+Every pass only produces standard ONNX operators that onnx2c supports, and returns the number
+of rewrites it made so that optimize() can run the passes until none of them applies.
+"""
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper, shape_inference
+
+# Nodes that forward their first input unchanged at inference time
+IDENTITY_OPS = ["Identity", "Dropout"]
+
+# Shape-only nodes that are no-ops when the inferred input and output shapes are the same
+SHAPE_OPS = ["Reshape", "Flatten", "Squeeze", "Unsqueeze"]
+
+def get_attribute(node, name, default=None):
+    """Return the value of a node attribute, or default if the node does not set it."""
+    for attribute in node.attribute:
+        if attribute.name == name:
+            return helper.get_attribute_value(attribute)
+    return default
+
+def initializers(graph):
+    """Return the initializers of the graph by name, as numpy arrays."""
+    return {init.name: numpy_helper.to_array(init) for init in graph.initializer}
+
+def add_initializer(graph, name, array):
+    """Add an initializer with a name that is not used yet and return that name."""
+    existing = {init.name for init in graph.initializer}
+    unique_name = name
+    suffix = 1
+    while unique_name in existing:
+        unique_name = f"{name}_{suffix}"
+        suffix += 1
+    graph.initializer.append(numpy_helper.from_array(np.asarray(array, dtype=np.float32), unique_name))
+    return unique_name
+
+def consumers(graph, name):
+    """Return the nodes that read a value."""
+    return [node for node in graph.node if name in node.input]
+
+def producer(graph, name):
+    """Return the node that writes a value, or None for graph inputs and initializers."""
+    for node in graph.node:
+        if name in node.output:
+            return node
+    return None
+
+def is_graph_output(graph, name):
+    """Return True if a value is an output of the graph."""
+    return any(output.name == name for output in graph.output)
+
+def bypass_node(graph, node):
+    """
+    Remove a node that forwards its first input, connecting its consumers to that input.
+    Returns False if the node cannot be removed (it links a graph input directly to a graph output).
+    """
+    source, target = node.input[0], node.output[0]
+    if is_graph_output(graph, target):
+        # Keep the graph output name by renaming the value at its producer instead
+        source_producer = producer(graph, source)
+        if source_producer is None or is_graph_output(graph, source):
+            return False
+        source_producer.output[list(source_producer.output).index(source)] = target
+        for other in graph.node:
+            if other is not node:
+                for i, name in enumerate(other.input):
+                    if name == source:
+                        other.input[i] = target
+    else:
+        for other in consumers(graph, target):
+            for i, name in enumerate(other.input):
+                if name == target:
+                    other.input[i] = source
+    graph.node.remove(node)
+    return True
+
+def eliminate_identities(model):
+    """Remove Identity nodes and Dropout nodes whose mask output is unused."""
+    graph = model.graph
+    removed = 0
+    for node in list(graph.node):
+        if node.op_type not in IDENTITY_OPS:
+            continue
+        if len(node.output) > 1 and node.output[1] and (consumers(graph, node.output[1]) or
+                                                         is_graph_output(graph, node.output[1])):
+            continue
+        if bypass_node(graph, node):
+            removed += 1
+    return removed
+
+def inferred_shapes(model):
+    """Return the inferred shape of every value as a tuple of dim values or dim params (None if unknown)."""
+    inferred = shape_inference.infer_shapes(model)
+    shapes = {}
+    for value in list(inferred.graph.value_info) + list(inferred.graph.input) + list(inferred.graph.output):
+        tensor_type = value.type.tensor_type
+        if tensor_type.HasField("shape"):
+            shapes[value.name] = tuple(
+                dim.dim_value if dim.HasField("dim_value") else (dim.dim_param or None)
+                for dim in tensor_type.shape.dim
+            )
+    for init in model.graph.initializer:
+        shapes[init.name] = tuple(init.dims)
+    return shapes
+
+def eliminate_noop_reshapes(model):
+    """Remove shape-only nodes whose output shape equals their input shape."""
+    graph = model.graph
+    shapes = inferred_shapes(model)
+    removed = 0
+    for node in list(graph.node):
+        if node.op_type not in SHAPE_OPS:
+            continue
+        input_shape = shapes.get(node.input[0])
+        output_shape = shapes.get(node.output[0])
+        if input_shape is None or input_shape != output_shape or None in input_shape:
+            continue
+        if bypass_node(graph, node):
+            removed += 1
+    return removed
+
+def fold_constants(model):
+    """Replace nodes whose inputs are all constant with initializers holding their outputs."""
+    from onnx.reference import ReferenceEvaluator
+
+    graph = model.graph
+    folded = 0
+    for node in list(graph.node):
+        if node.op_type == "Constant":
+            # Only tensor constants, the scalar and sparse forms are left to onnx2c
+            value = get_attribute(node, "value")
+            if value is None:
+                continue
+            graph.initializer.append(numpy_helper.from_array(numpy_helper.to_array(value), node.output[0]))
+            graph.node.remove(node)
+            folded += 1
+            continue
+
+        constants = initializers(graph)
+        if not node.input or not all(name in constants for name in node.input if name):
+            continue
+        outputs = ReferenceEvaluator(node).run(None, {name: constants[name] for name in node.input if name})
+        for name, value in zip(node.output, outputs):
+            graph.initializer.append(numpy_helper.from_array(np.asarray(value), name))
+        graph.node.remove(node)
+        folded += 1
+    return folded
+
+def gemm_parameters(node, constants):
+    """
+    Return (weight, bias) of a Gemm node as K x N and N arrays with alpha, beta and transB applied,
+    or None if the node is not a plain dense layer with constant parameters.
+    """
+    if get_attribute(node, "transA", 0) or node.input[1] not in constants:
+        return None
+    weight = constants[node.input[1]].astype(np.float64)
+    if get_attribute(node, "transB", 0):
+        weight = weight.T
+    weight = weight * get_attribute(node, "alpha", 1.0)
+
+    columns = weight.shape[1]
+    if len(node.input) > 2 and node.input[2]:
+        if node.input[2] not in constants:
+            return None
+        bias = constants[node.input[2]].astype(np.float64)
+        if bias.size not in (1, columns):
+            return None
+        bias = np.broadcast_to(bias.reshape(-1), (columns,)) * get_attribute(node, "beta", 1.0)
+    else:
+        bias = np.zeros(columns)
+    return weight, bias
+
+def replace_gemm(graph, node, weight, bias, input_name, output_name):
+    """Insert a Gemm with the given K x N weight and bias in place of node."""
+    gemm = helper.make_node(
+        "Gemm",
+        [input_name, add_initializer(graph, f"{node.name or 'gemm'}_weight", weight.T),
+         add_initializer(graph, f"{node.name or 'gemm'}_bias", bias)],
+        [output_name],
+        name=node.name,
+        transB=1
+    )
+    graph.node.insert(list(graph.node).index(node), gemm)
+    graph.node.remove(node)
+
+def fold_batchnorm(model):
+    """Fold BatchNormalization nodes into the weights and bias of the Gemm that feeds them."""
+    graph = model.graph
+    folded = 0
+    for node in list(graph.node):
+        if node.op_type != "BatchNormalization" or len([name for name in node.output if name]) != 1:
+            continue
+        gemm = producer(graph, node.input[0])
+        if gemm is None or gemm.op_type != "Gemm" or len(consumers(graph, gemm.output[0])) != 1 or \
+                is_graph_output(graph, gemm.output[0]):
+            continue
+        constants = initializers(graph)
+        if not all(name in constants for name in node.input[1:5]):
+            continue
+        parameters = gemm_parameters(gemm, constants)
+        if parameters is None:
+            continue
+
+        gamma, beta, mean, var = (constants[name].astype(np.float64) for name in node.input[1:5])
+        scale = gamma / np.sqrt(var + get_attribute(node, "epsilon", 1e-5))
+        weight, bias = parameters
+        replace_gemm(graph, gemm, weight * scale, (bias - mean) * scale + beta, gemm.input[0], node.output[0])
+        graph.node.remove(node)
+        folded += 1
+    return folded
+
+def fuse_matmul_add(model):
+    """Fuse MatMul with a constant 2D weight followed by an Add of a constant bias into a Gemm."""
+    graph = model.graph
+    shapes = inferred_shapes(model)
+    fused = 0
+    for node in list(graph.node):
+        if node.op_type != "MatMul" or len(shapes.get(node.input[0], ())) != 2:
+            continue
+        constants = initializers(graph)
+        if node.input[1] not in constants or constants[node.input[1]].ndim != 2:
+            continue
+        users = consumers(graph, node.output[0])
+        if len(users) != 1 or users[0].op_type != "Add" or is_graph_output(graph, node.output[0]):
+            continue
+        add = users[0]
+        bias_name = add.input[1] if add.input[0] == node.output[0] else add.input[0]
+        weight = constants[node.input[1]].astype(np.float64)
+        if bias_name not in constants or constants[bias_name].size not in (1, weight.shape[1]):
+            continue
+
+        bias = np.broadcast_to(constants[bias_name].astype(np.float64).reshape(-1), (weight.shape[1],))
+        replace_gemm(graph, node, weight, bias, node.input[0], add.output[0])
+        graph.node.remove(add)
+        fused += 1
+    return fused
+
+def fuse_gemm_chains(model):
+    """Merge two consecutive Gemm nodes with no activation between them into one."""
+    graph = model.graph
+    fused = 0
+    for node in list(graph.node):
+        if node.op_type != "Gemm" or node not in graph.node:
+            continue
+        users = consumers(graph, node.output[0])
+        if len(users) != 1 or users[0].op_type != "Gemm" or users[0].input[0] != node.output[0] or \
+                is_graph_output(graph, node.output[0]):
+            continue
+        constants = initializers(graph)
+        first = gemm_parameters(node, constants)
+        second = gemm_parameters(users[0], constants)
+        if first is None or second is None:
+            continue
+
+        # (x W1 + b1) W2 + b2 = x (W1 W2) + (b1 W2 + b2)
+        (w1, b1), (w2, b2) = first, second
+        replace_gemm(graph, users[0], w1 @ w2, b1 @ w2 + b2, node.input[0], users[0].output[0])
+        graph.node.remove(node)
+        fused += 1
+    return fused
+
+def remove_unused_initializers(model):
+    """Drop initializers that no node reads any more."""
+    graph = model.graph
+    used = {name for node in graph.node for name in node.input}
+    for init in list(graph.initializer):
+        if init.name not in used:
+            graph.initializer.remove(init)
+
+# Passes in the order they are tried in every round
+PASSES = [
+    ("constant_folding", fold_constants),
+    ("identity_elimination", eliminate_identities),
+    ("reshape_elimination", eliminate_noop_reshapes),
+    ("batchnorm_folding", fold_batchnorm),
+    ("matmul_add_fusion", fuse_matmul_add),
+    ("gemm_chain_fusion", fuse_gemm_chains),
+]
+
+def optimize(model, max_rounds=10):
+    """Apply the passes until none of them changes the graph. Returns the model and the rewrite counts."""
+    model = onnx.ModelProto.FromString(model.SerializeToString())
+    counts = {name: 0 for name, _ in PASSES}
+    for _ in range(max_rounds):
+        changed = 0
+        for name, rewrite in PASSES:
+            applied = rewrite(model)
+            counts[name] += applied
+            changed += applied
+        if not changed:
+            break
+    remove_unused_initializers(model)
+    onnx.checker.check_model(model)
+    return model, counts
+
+def node_counts(model):
+    """Return the number of nodes of each operator type."""
+    counts = {}
+    for node in model.graph.node:
+        counts[node.op_type] = counts.get(node.op_type, 0) + 1
+    return dict(sorted(counts.items()))
@@ -0,0 +1,126 @@
+"""
+Script for optimising the exported ONNX graph before it is converted to C code.
+This will run inside the AML pipeline.
+
+Each rewrite removes a node, and so a generated C function and an intermediate buffer, from the
+onnx2c output. The optimised graph is checked against the original with onnxruntime, and the
+original is kept in unoptimized/ so that the later steps can measure the latency and size deltas.
+"""
+import os
+import sys
+import glob
+import json
+import argparse
+import shutil
+import numpy as np
+import onnx
+import onnxruntime as ort
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.telemetry import Telemetry
+from common.test_data import load_binary
+from passes import optimize, node_counts
+
+# Number of samples used for the equivalence check when there is no test data
+RANDOM_SAMPLES = 1000
+
+def load_test_inputs(model_dir):
+    """Load the test inputs saved by the training step as a float32 column, or None if there are none."""
+    bin_path = os.path.join(model_dir, "test_input.bin")
+    csv_path = os.path.join(model_dir, "test_input.csv")
+    if os.path.exists(bin_path):
+        return load_binary(bin_path)
+    if os.path.exists(csv_path):
+        return np.loadtxt(csv_path, delimiter=",", dtype=np.float32, ndmin=2)
+    return None
+
+def equivalence_inputs(session, test_inputs):
+    """Return inputs for the equivalence check: the test inputs if they fit the model, random values otherwise."""
+    shape = session.get_inputs()[0].shape
+    if test_inputs is not None and list(shape[1:]) == list(test_inputs.shape[1:]):
+        return test_inputs
+    rng = np.random.default_rng(0)
+    concrete = [d if isinstance(d, int) else RANDOM_SAMPLES for d in shape]
+    return rng.uniform(0, 100, size=concrete).astype(np.float32)
+
+def run_model(session, inputs):
+    """Run an onnxruntime session on a single input and return its first output."""
+    return session.run(None, {session.get_inputs()[0].name: inputs})[0]
+
+def main():
+    # Parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir", type=str, help="Directory containing the exported ONNX models and test data")
+    parser.add_argument("--output_dir", type=str, help="Output directory for the optimised ONNX models")
+    parser.add_argument("--atol", type=float, default=1e-5,
+                        help="Absolute tolerance of the optimised model outputs versus the original model")
+    parser.add_argument("--rtol", type=float, default=1e-5,
+                        help="Relative tolerance of the optimised model outputs versus the original model")
+    args = parser.parse_args()
+    telemetry = Telemetry("onnx_optimize", args.output_dir)
+
+    # Create output directories
+    telemetry.phase("setup")
+    unoptimized_dir = os.path.join(args.output_dir, "unoptimized")
+    os.makedirs(unoptimized_dir, exist_ok=True)
+
+    onnx_files = sorted(glob.glob(os.path.join(args.model_dir, "*.onnx")))
+    if not onnx_files:
+        raise FileNotFoundError(f"No ONNX model found in {args.model_dir}")
+    test_inputs = load_test_inputs(args.model_dir)
+
+    report = {}
+    for onnx_path in onnx_files:
+        filename = os.path.basename(onnx_path)
+
+        # The int8 QDQ models are calibrated against the exported graph and are converted as they are
+        if filename.endswith("_int8.onnx"):
+            shutil.copy(onnx_path, args.output_dir)
+            print(f"Copied {filename} without optimisation")
+            continue
+
+        print(f"Optimising {filename}...")
+        telemetry.phase(f"optimize:{filename}")
+        model = onnx.load(onnx_path)
+        optimized, rewrites = optimize(model)
+
+        optimized_path = os.path.join(args.output_dir, filename)
+        onnx.save(optimized, optimized_path)
+        shutil.copy(onnx_path, unoptimized_dir)
+
+        # Check that the rewrites did not change the outputs
+        telemetry.phase(f"check:{filename}")
+        original_session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+        optimized_session = ort.InferenceSession(optimized_path, providers=["CPUExecutionProvider"])
+        inputs = equivalence_inputs(original_session, test_inputs)
+        expected = run_model(original_session, inputs)
+        actual = run_model(optimized_session, inputs)
+        max_abs_diff = float(np.max(np.abs(expected.astype(np.float64) - actual.astype(np.float64))))
+        if not np.allclose(actual, expected, atol=args.atol, rtol=args.rtol):
+            raise RuntimeError(f"Optimised {filename} differs from the original by up to {max_abs_diff:.3g} "
+                               f"(atol={args.atol}, rtol={args.rtol})")
+
+        before, after = node_counts(model), node_counts(optimized)
+        report[filename] = {
+            "nodes_before": sum(before.values()),
+            "nodes_after": sum(after.values()),
+            "op_counts_before": before,
+            "op_counts_after": after,
+            "rewrites": rewrites,
+            "equivalence_samples": int(inputs.shape[0]),
+            "max_abs_diff": max_abs_diff
+        }
+        print(f"{filename}: {sum(before.values())} -> {sum(after.values())} nodes, "
+              f"max abs difference {max_abs_diff:.3g} over {inputs.shape[0]} samples")
+        for name, count in rewrites.items():
+            if count:
+                print(f"  {name}: {count}")
+
+    with open(os.path.join(args.output_dir, "optimization_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    telemetry.write()
+    print("ONNX graph optimisation completed successfully")
+
+if __name__ == "__main__":
+    main()
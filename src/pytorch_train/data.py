@@ -0,0 +1,184 @@
+"""
+Training data ingestion.
+Datasets are read in chunks (memory-mapped .npy, chunked CSV or Parquet row batches) and every
+row is assigned to the train, validation or test split by a hash of its row index, so the splits
+are reproducible without shuffling or materialising the whole dataset.
+"""
+import os
+import glob
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+
+# Split ids returned by assign_splits
+TRAIN, VAL, TEST = 0, 1, 2
+
+SUPPORTED_EXTENSIONS = [".npy", ".csv", ".parquet"]
+
+def data_files(path):
+    """Return the dataset files at path: the file itself, or the supported files in a directory."""
+    if os.path.isdir(path):
+        files = sorted(f for f in glob.glob(os.path.join(path, "*")) if os.path.splitext(f)[1] in SUPPORTED_EXTENSIONS)
+    else:
+        files = [path]
+    unsupported = [f for f in files if os.path.splitext(f)[1] not in SUPPORTED_EXTENSIONS]
+    if not files or unsupported:
+        raise ValueError(f"Expected {', '.join(SUPPORTED_EXTENSIONS)} files at {path}, found {unsupported or 'none'}")
+    return files
+
+def read_npy_chunks(path, x_column, y_column, chunk_rows):
+    """Yield (x, y) chunks of a memory-mapped .npy file with named fields or two columns (time, value)."""
+    array = np.load(path, mmap_mode="r")
+    for start in range(0, len(array), chunk_rows):
+        chunk = array[start:start + chunk_rows]
+        if array.dtype.names:
+            yield np.asarray(chunk[x_column], dtype=np.float32), np.asarray(chunk[y_column], dtype=np.float32)
+        elif array.ndim == 2 and array.shape[1] == 2:
+            yield np.asarray(chunk[:, 0], dtype=np.float32), np.asarray(chunk[:, 1], dtype=np.float32)
+        else:
+            raise ValueError(f"{path} must have fields {x_column}/{y_column} or shape (rows, 2), got {array.shape}")
+
+def read_csv_chunks(path, x_column, y_column, chunk_rows):
+    """Yield (x, y) chunks of a CSV file with a header row."""
+    import pandas as pd
+    for frame in pd.read_csv(path, usecols=[x_column, y_column], chunksize=chunk_rows):
+        yield frame[x_column].to_numpy(np.float32), frame[y_column].to_numpy(np.float32)
+
+def read_parquet_chunks(path, x_column, y_column, chunk_rows):
+    """Yield (x, y) chunks of a Parquet file, one row batch at a time."""
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=[x_column, y_column]):
+        yield (batch.column(x_column).to_numpy(zero_copy_only=False).astype(np.float32),
+               batch.column(y_column).to_numpy(zero_copy_only=False).astype(np.float32))
+
+READERS = {".npy": read_npy_chunks, ".csv": read_csv_chunks, ".parquet": read_parquet_chunks}
+
+def read_chunks(path, x_column, y_column, chunk_rows):
+    """Yield (x, y) float32 chunks of every dataset file at path, in order."""
+    for filename in data_files(path):
+        yield from READERS[os.path.splitext(filename)[1]](filename, x_column, y_column, chunk_rows)
+
+def synthetic_chunks(seed):
+    """Yield the built-in sample time series (a noisy linear temperature trend) as a single chunk."""
+    time_steps = np.arange(100)
+    temperature = 20 + 0.1 * time_steps + np.random.default_rng(seed).normal(0, 1, 100)
+    yield time_steps.astype(np.float32), temperature.astype(np.float32)
+
+def windowed_chunks(chunk_source, window):
+    """
+    Yield (x, y) chunks where each x row is the window of the last `window` inputs, oldest first,
+    and y is the target at the newest one. Windows span chunk boundaries; the first window - 1
+    rows of the data, which have no full window, are dropped.
+    """
+    history = np.zeros(0, dtype=np.float32)
+    for x, y in chunk_source():
+        joined = np.concatenate([history, x])
+        if len(joined) >= window:
+            windows = np.lib.stride_tricks.sliding_window_view(joined, window)
+            # The last window ends at the last reading, so the windows line up with the last targets
+            yield np.ascontiguousarray(windows), y[len(y) - len(windows):]
+        history = joined[max(len(joined) - (window - 1), 0):] if window > 1 else history
+
+def head_rows(chunk_source, rows):
+    """Return the first rows (x, y) of a raw chunk source, in order."""
+    xs, ys = [], []
+    count = 0
+    for x, y in chunk_source():
+        xs.append(x[:rows - count])
+        ys.append(y[:rows - count])
+        count += len(xs[-1])
+        if count >= rows:
+            break
+    return np.concatenate(xs), np.concatenate(ys)
+
+def estimate_size_mb(path):
+    """Estimate the size of the dataset as float32 (x, y) pairs in MB, without reading it."""
+    if path is None:
+        return 0.0
+    size = 0
+    for filename in data_files(path):
+        extension = os.path.splitext(filename)[1]
+        if extension == ".npy":
+            size += len(np.load(filename, mmap_mode="r")) * 8
+        elif extension == ".parquet":
+            import pyarrow.parquet as pq
+            size += pq.ParquetFile(filename).metadata.num_rows * 8
+        else:
+            # Text is at least as large as the binary values it holds
+            size += os.path.getsize(filename)
+    return size / 2**20
+
+def assign_splits(first_row, count, seed, test_fraction, val_fraction):
+    """
+    Return the split id of rows first_row..first_row + count from a hash of the row index.
+    val_fraction is the fraction of the non-test rows used for validation.
+    """
+    z = np.arange(first_row, first_row + count, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        # splitmix64 finaliser
+        z = z + np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    uniform = (z >> np.uint64(11)).astype(np.float64) / 2.0**53
+    splits = np.full(count, TRAIN, dtype=np.uint8)
+    splits[uniform < test_fraction + (1 - test_fraction) * val_fraction] = VAL
+    splits[uniform < test_fraction] = TEST
+    return splits
+
+def split_chunks(chunk_source, split, seed, test_fraction, val_fraction):
+    """Yield (chunk index, x, y) with only the rows of one split."""
+    first_row = 0
+    for index, (x, y) in enumerate(chunk_source()):
+        mask = assign_splits(first_row, len(x), seed, test_fraction, val_fraction) == split
+        first_row += len(x)
+        yield index, x[mask], y[mask]
+
+def collect_split(chunk_source, split, seed, test_fraction, val_fraction, max_rows=None):
+    """Materialise the rows of one split (at most max_rows, in row order) as (N, window) and (N,) arrays."""
+    xs, ys = [], []
+    rows = 0
+    for _, x, y in split_chunks(chunk_source, split, seed, test_fraction, val_fraction):
+        if max_rows is not None:
+            x, y = x[:max_rows - rows], y[:max_rows - rows]
+        xs.append(x)
+        ys.append(y)
+        rows += len(x)
+        if max_rows is not None and rows >= max_rows:
+            break
+    x = np.concatenate(xs) if xs else np.zeros((0, 1), dtype=np.float32)
+    y = np.concatenate(ys) if ys else np.zeros(0, dtype=np.float32)
+    return x, y
+
+class StreamingDataset(IterableDataset):
+    """
+    Streams mini-batches of the training split chunk by chunk, shuffling rows within each chunk.
+    Chunks are shared out between DataLoader workers, so use it with batch_size=None.
+    """
+    def __init__(self, chunk_source, seed, test_fraction, val_fraction, batch_size):
+        self.chunk_source = chunk_source
+        self.seed = seed
+        self.test_fraction = test_fraction
+        self.val_fraction = val_fraction
+        self.batch_size = batch_size
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        """Change the shuffling order for the next pass."""
+        self.epoch = epoch
+
+    def __iter__(self):
+        worker = get_worker_info()
+        for index, x, y in split_chunks(self.chunk_source, TRAIN, self.seed, self.test_fraction, self.val_fraction):
+            if worker is not None and index % worker.num_workers != worker.id:
+                continue
+            order = np.random.default_rng([self.seed, self.epoch, index]).permutation(len(x))
+            x = torch.from_numpy(x[order])
+            y = torch.from_numpy(y[order]).view(-1, 1)
+            for start in range(0, len(x), self.batch_size):
+                yield x[start:start + self.batch_size], y[start:start + self.batch_size]
+
+def streaming_batches(loader, epoch):
+    """Return the batches of a DataLoader over a StreamingDataset for one epoch."""
+    loader.dataset.set_epoch(epoch)
+    return loader
@@ -1,25 +1,48 @@
 """
 Script for training PyTorch model and exporting to ONNX.
 This will run inside the AML pipeline.
+
+With --checkpoint_dir (the output of a previous run), the model is fine-tuned from the saved
+weights for a few epochs instead of being trained from scratch, and keeps them unless the
+validation loss improves. The export is deterministic, so unchanged weights give an unchanged
+ONNX file, whose graph hash is written to model_hash.json for the later steps.
 """
 import os
+import sys
+import time
+import json
+import random
+import hashlib
 import argparse
 import shutil
 import numpy as np
+import onnx
 import torch
 import torch.nn as nn
 import torch.optim as optim
 import matplotlib.pyplot as plt
-from torch.utils.data import DataLoader, TensorDataset
-from sklearn.model_selection import train_test_split
+from torch.utils.data import DataLoader
+from functools import partial
+import onnxruntime as ort
+from onnxruntime.quantization import (
+    CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.telemetry import Telemetry
+from common.test_data import save_binary
+from data import (
+    TRAIN, VAL, TEST, StreamingDataset, collect_split, estimate_size_mb, head_rows, read_chunks, streaming_batches,
+    synthetic_chunks, windowed_chunks
+)
 
 # Copy your training script here, or import it
 class SimpleTimeSeriesModel(nn.Module):
-    def __init__(self):
+    def __init__(self, window=1):
         super(SimpleTimeSeriesModel, self).__init__()
-        # Very simple network: input -> hidden layer (4 neurons) -> output
+        # Very simple network: last `window` inputs -> hidden layer (4 neurons) -> output
         self.model = nn.Sequential(
-            nn.Linear(1, 4),
+            nn.Linear(window, 4),
             nn.ReLU(),
             nn.Linear(4, 1)
         )
@@ -27,67 +50,355 @@ class SimpleTimeSeriesModel(nn.Module):
     def forward(self, x):
         return self.model(x)
 
-def main():
-    # Parse arguments
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--output_dir", type=str, help="Output directory")
-    args = parser.parse_args()
-    
-    os.makedirs(args.output_dir, exist_ok=True)
-    
-    # Generate sample time series data
-    time = np.arange(100)
-    temperature = 20 + 0.1 * time + np.random.normal(0, 1, 100)
+ONNX_FILE = "simple_time_series_model.onnx"
 
-    # Split data and convert to PyTorch tensors
-    X = time.reshape(-1, 1).astype(np.float32)  # Cast to float32 for PyTorch
-    y = temperature.astype(np.float32)
+# Weights and training state saved for warm-starting the next run
+CHECKPOINT_FILE = "checkpoint.pt"
+CHECKPOINT_VERSION = 1
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+# Graph hash of the exported model, and whether fine-tuning changed it
+MODEL_HASH_FILE = "model_hash.json"
 
-    # Convert to PyTorch tensors
-    X_train_tensor = torch.FloatTensor(X_train)
-    y_train_tensor = torch.FloatTensor(y_train).view(-1, 1)  # Reshape for PyTorch
-    X_test_tensor = torch.FloatTensor(X_test)
-    y_test_tensor = torch.FloatTensor(y_test).view(-1, 1)
+class TrainingDataReader(CalibrationDataReader):
+    """Feeds the training inputs to the static quantization calibrator one sample at a time."""
+    def __init__(self, inputs):
+        self.samples = iter([{"input": inputs[i:i + 1]} for i in range(len(inputs))])
+    
+    def get_next(self):
+        return next(self.samples, None)
 
-    # Create data loaders
-    train_dataset = TensorDataset(X_train_tensor, y_train_tensor)
-    train_loader = DataLoader(train_dataset, batch_size=8, shuffle=True)
+def quantize_model(onnx_path, quantized_path, calibration_inputs):
+    """
+    Quantize an ONNX model to int8 with QDQ nodes, calibrated on the given inputs.
+    QDQ keeps the float operators between QuantizeLinear/DequantizeLinear pairs, and onnx2c converts
+    them as they are: the C code stores int8 weights but still computes in float, with a rescaling
+    at every pair. It saves ROM, not arithmetic, so it is no faster than the float model, least of
+    all on soft-float targets. The integer-only model for those is the fixed_point step's.
+    """
+    quantize_static(
+        model_input=onnx_path,
+        model_output=quantized_path,
+        calibration_data_reader=TrainingDataReader(calibration_inputs),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=False,
+        calibrate_method=CalibrationMethod.MinMax
+    )
 
-    # Initialize model, loss function, and optimizer
-    model = SimpleTimeSeriesModel()
-    criterion = nn.MSELoss()
-    optimizer = optim.Adam(model.parameters(), lr=0.01)
+def seed_everything(seed):
+    """Seed every random number generator used by the data generation and training."""
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    torch.use_deterministic_algorithms(True, warn_only=True)
 
-    # Train the model
-    epochs = 200
-    losses = []
+def load_checkpoint(checkpoint_dir, window):
+    """Load the checkpoint saved by a previous run, checking that it fits a model with this window."""
+    path = os.path.join(checkpoint_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{CHECKPOINT_FILE} not found in {checkpoint_dir}")
+    checkpoint = torch.load(path, map_location="cpu", weights_only=True)
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {checkpoint.get('version')} in {path}")
+    if checkpoint["window"] != window:
+        raise ValueError(f"The checkpoint in {checkpoint_dir} was trained with --window {checkpoint['window']}, not {window}")
+    return checkpoint
+
+def graph_hash(onnx_path):
+    """Return the SHA-256 of the opsets and graph of an ONNX model, ignoring the exporter's producer fields."""
+    model = onnx.load(onnx_path)
+    digest = hashlib.sha256()
+    for opset in model.opset_import:
+        digest.update(opset.SerializeToString(deterministic=True))
+    digest.update(model.graph.SerializeToString(deterministic=True))
+    return digest.hexdigest()
+
+def in_memory_batches(X, y, batch_size, generator, epoch):
+    """Yield shuffled mini-batches by indexing the full tensors, without DataLoader overhead."""
+    order = torch.randperm(len(X), generator=generator)
+    for start in range(0, len(X), batch_size):
+        index = order[start:start + batch_size]
+        yield X[index], y[index]
 
-    print("Training neural network model...")
+def train_model(model, batches, X_val, y_val, args, epochs=None, masks=None, lr=None, keep_initial=False):
+    """
+    Train with Adam and MSE loss on batches(epoch), stopping early when the validation loss has not
+    improved by more than args.min_delta for args.patience epochs (the best weights are restored).
+    Returns the per-epoch history. Runs args.epochs at args.lr unless epochs or lr is given; masks
+    keep pruned weights at zero after every step. With keep_initial and early stopping, the starting
+    weights count as the best so far, so they are restored unless an epoch improves on them.
+    """
+    epochs = args.epochs if epochs is None else epochs
+    criterion = nn.MSELoss()
+    optimizer = optim.Adam(model.parameters(), lr=args.lr if lr is None else lr)
+    train_step_model = torch.compile(model) if args.compile else model
+    
+    history = []
+    best_val_loss = float("inf")
+    best_state = None
+    epochs_since_best = 0
+    if keep_initial and args.patience and len(X_val):
+        model.eval()
+        with torch.no_grad():
+            best_val_loss = criterion(model(X_val), y_val).item()
+        best_state = {name: value.clone() for name, value in model.state_dict().items()}
+        print(f"Initial validation loss: {best_val_loss:.4f}")
     for epoch in range(epochs):
+        start = time.time()
         model.train()
-        total_loss = 0
+        total_loss = 0.0
+        num_batches = 0
+        num_samples = 0
         
-        for batch_X, batch_y in train_loader:
+        for batch_X, batch_y in batches(epoch):
             # Forward pass
-            outputs = model(batch_X)
+            outputs = train_step_model(batch_X)
             loss = criterion(outputs, batch_y)
             
             # Backward pass and optimize
             optimizer.zero_grad()
             loss.backward()
             optimizer.step()
+            if masks:
+                apply_masks(masks)
             
-            total_loss += loss.item()
+            # Accumulate on the tensor to avoid a device sync per batch
+            total_loss += loss.detach()
+            num_batches += 1
+            num_samples += len(batch_X)
+        if num_batches == 0:
+            raise ValueError("The training split is empty, use more data or lower --test_fraction/--val_fraction")
         
-        avg_loss = total_loss / len(train_loader)
-        losses.append(avg_loss)
+        model.eval()
+        with torch.no_grad():
+            val_loss = criterion(model(X_val), y_val).item() if len(X_val) else None
+        seconds = time.time() - start
         
+        history.append({
+            "epoch": epoch + 1,
+            "train_loss": float(total_loss) / num_batches,
+            "val_loss": val_loss,
+            "samples": num_samples,
+            "seconds": round(seconds, 6),
+            "samples_per_sec": round(num_samples / seconds, 1) if seconds else None
+        })
         if (epoch + 1) % 50 == 0:
-            print(f"Epoch {epoch+1}/{epochs}, Loss: {avg_loss:.4f}")
+            print(f"Epoch {epoch+1}/{epochs}, Loss: {history[-1]['train_loss']:.4f}" +
+                  (f", Val loss: {val_loss:.4f}" if val_loss is not None else ""))
+        
+        if args.patience and val_loss is not None:
+            if val_loss < best_val_loss - args.min_delta:
+                best_val_loss = val_loss
+                best_state = {name: value.clone() for name, value in model.state_dict().items()}
+                epochs_since_best = 0
+            else:
+                epochs_since_best += 1
+                if epochs_since_best >= args.patience:
+                    print(f"Early stopping after epoch {epoch+1}, best validation loss {best_val_loss:.4f}")
+                    break
+    
+    if best_state is not None:
+        model.load_state_dict(best_state)
+    return history
+
+def magnitude_masks(model, sparsity):
+    """Return {weight: mask} zeroing the smallest-magnitude fraction of each Linear layer's weights."""
+    masks = {}
+    for module in model.modules():
+        if isinstance(module, nn.Linear):
+            weight = module.weight.detach()
+            # Every layer keeps at least one weight so that its output still depends on its input
+            pruned = min(int(round(weight.numel() * sparsity)), weight.numel() - 1)
+            mask = torch.ones_like(weight)
+            if pruned > 0:
+                mask.view(-1)[torch.argsort(weight.abs().view(-1))[:pruned]] = 0.0
+            masks[module.weight] = mask
+    return masks
+
+def apply_masks(masks):
+    """Zero the pruned weights."""
+    with torch.no_grad():
+        for weight, mask in masks.items():
+            weight.mul_(mask)
+
+def prune_model(model, batches, X_val, y_val, args):
+    """
+    Prune the trained model to args.prune_sparsity by weight magnitude in args.prune_steps steps,
+    fine-tuning for up to args.prune_epochs after each one. The sparsity follows a cubic schedule,
+    pruning most in the first steps while the remaining weights can still compensate.
+    Returns the pruning report.
+    """
+    steps = []
+    masks = {}
+    for step in range(1, args.prune_steps + 1):
+        sparsity = args.prune_sparsity * (1 - (1 - step / args.prune_steps) ** 3)
+        masks = magnitude_masks(model, sparsity)
+        apply_masks(masks)
+        history = train_model(model, batches, X_val, y_val, args, epochs=args.prune_epochs, masks=masks)
+        val_losses = [entry["val_loss"] for entry in history if entry["val_loss"] is not None]
+        steps.append({
+            "target_sparsity": round(sparsity, 4),
+            "epochs_run": len(history),
+            "best_val_loss": min(val_losses) if val_losses else None
+        })
+        print(f"Pruning step {step}/{args.prune_steps}: {sparsity:.1%} of the weights pruned, "
+              f"fine-tuned {len(history)} epochs" +
+              (f", best validation loss {steps[-1]['best_val_loss']:.4f}" if val_losses else ""))
+    return sparsity_report(masks, args.prune_sparsity, steps)
+
+def sparsity_report(masks, target_sparsity, steps):
+    """Return the pruning report of the weights of masks: overall and per-layer sparsity, and the pruning steps."""
+    layers = [
+        {"shape": list(weight.shape), "nonzeros": int(torch.count_nonzero(weight)), "weights": weight.numel()}
+        for weight in masks
+    ]
+    total = sum(layer["weights"] for layer in layers)
+    return {
+        "target_sparsity": target_sparsity,
+        "sparsity": 1.0 - sum(layer["nonzeros"] for layer in layers) / total,
+        "layers": layers,
+        "steps": steps
+    }
+
+def main():
+    # Parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output_dir", type=str, help="Output directory")
+    parser.add_argument("--quantize", action="store_true",
+                        help="Also export an int8 model calibrated on the training data")
+    parser.add_argument("--epochs", type=int, default=200, help="Maximum number of training epochs")
+    parser.add_argument("--batch_size", type=int, default=8, help="Mini-batch size")
+    parser.add_argument("--lr", type=float, default=0.01, help="Adam learning rate")
+    parser.add_argument("--data", type=str, default=None,
+                        help="Training data: a .npy, .csv or .parquet file or a folder of them (sample data if not set)")
+    parser.add_argument("--x_column", type=str, default="time", help="Input column of the training data")
+    parser.add_argument("--y_column", type=str, default="temperature", help="Target column of the training data")
+    parser.add_argument("--window", type=int, default=1,
+                        help="Number of consecutive inputs the model takes, oldest first (1 for a single input)")
+    parser.add_argument("--stream_rows", type=int, default=10000,
+                        help="Number of consecutive rows saved for the streaming replay of the C test harness")
+    parser.add_argument("--chunk_rows", type=int, default=1000000, help="Rows read from the training data at a time")
+    parser.add_argument("--test_fraction", type=float, default=0.2, help="Fraction of the rows used for testing")
+    parser.add_argument("--max_test_rows", type=int, default=1000000,
+                        help="Maximum number of test rows kept for evaluation and the C test data")
+    parser.add_argument("--max_val_rows", type=int, default=100000,
+                        help="Maximum number of validation rows evaluated after every epoch")
+    parser.add_argument("--calibration_rows", type=int, default=10000,
+                        help="Number of training rows used to calibrate the int8 model")
+    parser.add_argument("--csv_max_rows", type=int, default=1000000,
+                        help="Also write the test data as CSV when it has at most this many rows")
+    parser.add_argument("--val_fraction", type=float, default=0.1,
+                        help="Fraction of the training data held out for validation and early stopping")
+    parser.add_argument("--patience", type=int, default=20,
+                        help="Stop after this many epochs without a lower validation loss (0 disables early stopping)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the data generation, splits and training")
+    parser.add_argument("--threads", type=int, default=None, help="Number of intra-op threads used by PyTorch")
+    parser.add_argument("--compile", action="store_true", help="Train with torch.compile")
+    parser.add_argument("--in_memory_max_mb", type=float, default=512,
+                        help="Load the training data into memory when it is at most this size, otherwise stream it")
+    parser.add_argument("--loader_workers", type=int, default=0,
+                        help="DataLoader worker processes reading the training data when it is streamed")
+    parser.add_argument("--prune_sparsity", type=float, default=0.0,
+                        help="Fraction of the weights of every layer pruned by magnitude after training (0 disables pruning)")
+    parser.add_argument("--prune_steps", type=int, default=4,
+                        help="Number of pruning steps reaching --prune_sparsity, each followed by fine-tuning")
+    parser.add_argument("--prune_epochs", type=int, default=50, help="Maximum fine-tuning epochs after each pruning step")
+    parser.add_argument("--checkpoint_dir", type=str, default=None,
+                        help="Output of a previous run to fine-tune from (its checkpoint.pt) instead of training from scratch")
+    parser.add_argument("--finetune_epochs", type=int, default=20, help="Maximum epochs when fine-tuning from a checkpoint")
+    parser.add_argument("--finetune_lr", type=float, default=0.001, help="Adam learning rate when fine-tuning from a checkpoint")
+    parser.add_argument("--min_delta", type=float, default=0.0,
+                        help="Smallest decrease of the validation loss that counts as an improvement for early stopping")
+    args = parser.parse_args()
+    telemetry = Telemetry("pytorch_train", args.output_dir)
+    
+    telemetry.phase("setup")
+    os.makedirs(args.output_dir, exist_ok=True)
+    seed_everything(args.seed)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    
+    # Read the training data in chunks, or use the built-in sample time series
+    telemetry.phase("load_data")
+    if args.data:
+        raw_source = partial(read_chunks, args.data, args.x_column, args.y_column, args.chunk_rows)
+    else:
+        raw_source = partial(synthetic_chunks, args.seed)
+    chunk_source = partial(windowed_chunks, raw_source, args.window)
+    splits = (args.seed, args.test_fraction, args.val_fraction)
+
+    # Rows are assigned to splits by hashing their index, so only the capped test and validation
+    # sets are materialised here
+    X_test, y_test = collect_split(chunk_source, TEST, *splits, max_rows=args.max_test_rows)
+    X_val, y_val = collect_split(chunk_source, VAL, *splits, max_rows=args.max_val_rows)
+    X_test_tensor = torch.from_numpy(X_test)
+    y_test_tensor = torch.from_numpy(y_test).view(-1, 1)  # Reshape for PyTorch
+    X_val_tensor = torch.from_numpy(X_val)
+    y_val_tensor = torch.from_numpy(y_val).view(-1, 1)
+
+    # Batch by indexing tensors when the training data fits in memory, otherwise stream it
+    data_mb = estimate_size_mb(args.data)
+    if data_mb <= args.in_memory_max_mb:
+        X_fit, y_fit = collect_split(chunk_source, TRAIN, *splits)
+        generator = torch.Generator().manual_seed(args.seed)
+        batches = partial(in_memory_batches, torch.from_numpy(X_fit), torch.from_numpy(y_fit).view(-1, 1),
+                          args.batch_size, generator)
+        print(f"Training on {len(X_fit)} samples in memory ({data_mb:.1f} MB), batch size {args.batch_size}")
+    else:
+        dataset = StreamingDataset(chunk_source, *splits, args.batch_size)
+        batches = partial(streaming_batches, DataLoader(dataset, batch_size=None, num_workers=args.loader_workers))
+        print(f"Streaming {data_mb:.1f} MB of training data in chunks of {args.chunk_rows} rows "
+              f"with {args.loader_workers} workers, batch size {args.batch_size}")
+    print(f"Validation samples: {len(X_val)}, test samples: {len(X_test)}")
+
+    # Initialize model, from the weights of the previous run when fine-tuning, and the loss function used for evaluation
+    model = SimpleTimeSeriesModel(args.window)
+    checkpoint = load_checkpoint(args.checkpoint_dir, args.window) if args.checkpoint_dir else None
+    masks = None
+    if checkpoint:
+        model.load_state_dict(checkpoint["state_dict"])
+        print(f"Loaded checkpoint from {args.checkpoint_dir}: {checkpoint['epochs_trained']} epochs trained, "
+              f"graph {checkpoint['onnx_sha256'][:12]}")
+        # A checkpoint pruned to the same sparsity keeps its pattern instead of being pruned again
+        if args.prune_sparsity and checkpoint["prune_sparsity"] == args.prune_sparsity:
+            masks = {module.weight: (module.weight.detach() != 0).float()
+                     for module in model.modules() if isinstance(module, nn.Linear)}
+    criterion = nn.MSELoss()
+
+    # Train the model
+    telemetry.phase("train")
+    training_start = time.time()
+    if checkpoint:
+        print(f"Fine-tuning neural network model for up to {args.finetune_epochs} epochs...")
+        history = train_model(model, batches, X_val_tensor, y_val_tensor, args, epochs=args.finetune_epochs,
+                              masks=masks, lr=args.finetune_lr, keep_initial=True)
+    else:
+        print("Training neural network model...")
+        history = train_model(model, batches, X_val_tensor, y_val_tensor, args)
+    training_seconds = time.time() - training_start
+    losses = [entry["train_loss"] for entry in history]
+    val_losses = [entry["val_loss"] for entry in history if entry["val_loss"] is not None]
+    epochs_run = len(history)
+    print(f"Trained {len(history)} epochs in {training_seconds:.2f} s")
+
+    # Prune the smallest weights and fine-tune the rest, keeping the dense predictions for comparison
+    dense_predictions = None
+    if masks:
+        pruning = sparsity_report(masks, args.prune_sparsity, [])
+        print(f"Kept the {pruning['sparsity']:.1%} sparsity pattern of the checkpoint")
+    elif args.prune_sparsity:
+        telemetry.phase("prune")
+        model.eval()
+        with torch.no_grad():
+            dense_predictions = model(X_test_tensor)
+            dense_mse = criterion(dense_predictions, y_test_tensor).item()
+        print(f"Pruning to {args.prune_sparsity:.0%} sparsity, dense Test Loss (MSE): {dense_mse:.4f}")
+        pruning = prune_model(model, batches, X_val_tensor, y_val_tensor, args)
+        epochs_run += sum(step["epochs_run"] for step in pruning["steps"])
 
     # Evaluate model
+    telemetry.phase("evaluate")
     model.eval()
     with torch.no_grad():
         test_predictions = model(X_test_tensor)
@@ -103,8 +414,9 @@ def main():
         print(f"R² Score: {r2_score.item():.4f}")
 
     # Export model to ONNX
-    onnx_path = os.path.join(args.output_dir, "simple_time_series_model.onnx")
-    dummy_input = torch.randn(1, 1)  # Example input for tracing
+    telemetry.phase("export")
+    onnx_path = os.path.join(args.output_dir, ONNX_FILE)
+    dummy_input = torch.zeros(1, args.window)  # Example input for tracing, fixed so the export is deterministic
 
     # Export the model
     torch.onnx.export(
@@ -121,12 +433,73 @@ def main():
     )
     print(f"Model saved as '{onnx_path}'")
 
-    # Save test data for C++ implementation
-    np.savetxt(os.path.join(args.output_dir, 'test_input.csv'), X_test, delimiter=',')
-    np.savetxt(os.path.join(args.output_dir, 'expected_output.csv'), y_test, delimiter=',')
+    # Fine-tuning that kept the checkpoint weights leaves the graph unchanged: the previous file is
+    # kept byte for byte, so the steps that only depend on it can be reused
+    export = {
+        "onnx_sha256": graph_hash(onnx_path),
+        "previous_onnx_sha256": checkpoint["onnx_sha256"] if checkpoint else None
+    }
+    export["unchanged"] = export["onnx_sha256"] == export["previous_onnx_sha256"]
+    previous_onnx_path = os.path.join(args.checkpoint_dir, ONNX_FILE) if checkpoint else None
+    if (export["unchanged"] and os.path.exists(previous_onnx_path)
+            and graph_hash(previous_onnx_path) == export["onnx_sha256"]):
+        shutil.copy(previous_onnx_path, onnx_path)
+        print(f"Model unchanged by fine-tuning (graph {export['onnx_sha256'][:12]}), kept the previous ONNX file")
+    with open(os.path.join(args.output_dir, MODEL_HASH_FILE), "w") as f:
+        json.dump(export, f, indent=2)
+
+    # Checkpoint for warm-starting the next run
+    torch.save({
+        "version": CHECKPOINT_VERSION,
+        "window": args.window,
+        "state_dict": model.state_dict(),
+        "epochs_trained": (checkpoint["epochs_trained"] if checkpoint else 0) + epochs_run,
+        "prune_sparsity": args.prune_sparsity,
+        "onnx_sha256": export["onnx_sha256"]
+    }, os.path.join(args.output_dir, CHECKPOINT_FILE))
+
+    # Reference predictions of the exported graph, used to check the fidelity of the C conversion
+    reference_output = ort.InferenceSession(onnx_path).run(None, {"input": X_test})[0]
+    print(f"Max difference between PyTorch and onnxruntime outputs: "
+          f"{np.max(np.abs(reference_output - test_predictions.numpy())):.3g}")
+
+    # Post-training int8 quantization, compared against the float model with onnxruntime
+    if args.quantize:
+        telemetry.phase("quantize")
+        quantized_path = os.path.join(args.output_dir, "simple_time_series_model_int8.onnx")
+        X_calibration, _ = collect_split(chunk_source, TRAIN, *splits, max_rows=args.calibration_rows)
+        quantize_model(onnx_path, quantized_path, X_calibration)
+        print(f"Quantized model saved as '{quantized_path}'")
+
+        float_predictions = reference_output
+        int8_predictions = ort.InferenceSession(quantized_path).run(None, {"input": X_test})[0]
+        float_mse = float(np.mean((float_predictions.ravel() - y_test) ** 2))
+        int8_mse = float(np.mean((int8_predictions.ravel() - y_test) ** 2))
+        max_output_diff = float(np.max(np.abs(int8_predictions - float_predictions)))
+
+        print(f"Float Test Loss (MSE): {float_mse:.4f}")
+        print(f"Int8 Test Loss (MSE): {int8_mse:.4f} (delta {int8_mse - float_mse:+.4f})")
+        print(f"Int8 max output difference vs float: {max_output_diff:.4f}")
+
+    # Save test data for C++ implementation, the C harness reads the binary files when present
+    telemetry.phase("save_test_data")
+    if len(X_test) <= args.csv_max_rows:
+        np.savetxt(os.path.join(args.output_dir, 'test_input.csv'), X_test, delimiter=',')
+        np.savetxt(os.path.join(args.output_dir, 'expected_output.csv'), y_test, delimiter=',')
+    save_binary(os.path.join(args.output_dir, 'test_input.bin'), X_test)
+    save_binary(os.path.join(args.output_dir, 'expected_output.bin'), y_test)
+    save_binary(os.path.join(args.output_dir, 'reference_output.bin'), reference_output)
+    if dense_predictions is not None:
+        save_binary(os.path.join(args.output_dir, 'dense_reference_output.bin'), dense_predictions.numpy())
+
+    # Consecutive readings for the streaming replay, the first window - 1 targets have no prediction
+    stream_input, stream_expected = head_rows(raw_source, args.stream_rows)
+    save_binary(os.path.join(args.output_dir, 'stream_input.bin'), stream_input)
+    save_binary(os.path.join(args.output_dir, 'stream_expected.bin'), stream_expected)
     print("Test data saved for C implementation")
 
     # Plot training results
+    telemetry.phase("plot")
     plt.figure(figsize=(12, 5))
 
     # Plot 1: Training loss
@@ -136,10 +509,11 @@ def main():
     plt.xlabel('Epoch')
     plt.ylabel('Loss')
 
-    # Plot 2: Predictions vs. Actual
+    # Plot 2: Predictions vs. Actual, for the first test rows
+    plot_rows = slice(0, 10000)
     plt.subplot(1, 2, 2)
-    plt.scatter(X_test, y_test, label='Actual data', alpha=0.5)
-    plt.scatter(X_test, test_predictions.numpy(), label='Predictions', alpha=0.5, color='red')
+    plt.scatter(X_test[plot_rows, -1], y_test[plot_rows], label='Actual data', alpha=0.5)
+    plt.scatter(X_test[plot_rows, -1], test_predictions.numpy()[plot_rows], label='Predictions', alpha=0.5, color='red')
     plt.title('Predictions vs. Actual')
     plt.xlabel('Time')
     plt.ylabel('Temperature')
@@ -148,10 +522,49 @@ def main():
     plt.tight_layout()
     plt.savefig(os.path.join(args.output_dir, 'model_visualization.png'))
     
-    # Save metrics to file for Azure ML to track
+    # Save metrics to file for Azure ML to track, as JSON
+    metrics = {
+        "dataset": {
+            "source": args.data or "sample",
+            "size_mb": round(data_mb, 3),
+            "in_memory": data_mb <= args.in_memory_max_mb,
+            "window": args.window,
+            "validation_samples": len(X_val),
+            "test_samples": len(X_test)
+        },
+        "test_mse": test_loss.item(),
+        "r2_score": r2_score.item(),
+        "training": {
+            "seed": args.seed,
+            "batch_size": args.batch_size,
+            "warm_start": checkpoint is not None,
+            "epochs_run": len(history),
+            "total_seconds": round(training_seconds, 3),
+            "samples_per_sec": (round(sum(entry["samples"] for entry in history) / training_seconds, 1)
+                                if history and training_seconds else None),
+            "best_val_loss": min(val_losses) if val_losses else None,
+            "epochs": history
+        },
+        "export": export
+    }
+    if args.quantize:
+        metrics["int8"] = {
+            "test_mse": int8_mse,
+            "mse_delta_vs_float": int8_mse - float_mse,
+            "max_output_diff_vs_float": max_output_diff
+        }
+    if args.prune_sparsity:
+        metrics["pruning"] = pruning
+        if dense_predictions is not None:
+            metrics["pruning"] = dict(
+                pruning,
+                dense_test_mse=dense_mse,
+                mse_delta_vs_dense=test_loss.item() - dense_mse
+            )
     with open(os.path.join(args.output_dir, 'metrics.txt'), 'w') as f:
-        f.write(f"Test Loss (MSE): {test_loss.item():.4f}\n")
-        f.write(f"R² Score: {r2_score.item():.4f}\n")
+        json.dump(metrics, f, indent=2)
+    
+    telemetry.write()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+Script for building the batch scoring library and load testing the scoring server.
+This will run inside the AML pipeline.
+
+The model code is built as an optimised shared library, checked against a single instance on the
+test inputs, then served over a Unix socket with an increasing number of workers while client
+threads send fixed-size batch requests. Throughput, queue and round-trip latency and the scaling
+efficiency versus one worker are written to scoring_report.json.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import shutil
+import tempfile
+import threading
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.fan_out import find_models, fan_out
+from common.native_model import NativeModel
+from common.telemetry import Telemetry, timed_run
+from common.test_data import load_binary
+from server import ScoringServer, load_replicas, make_socket_server, percentiles, read_frame, write_frame
+
+SERVER_LIBRARY = "libtime_series_model_server.so"
+
+# The library is built from the same model_impl.c and header as the test step
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "compile_test", "templates")
+
+# Per-model reports merged into models_report.json when load testing a model family
+MODEL_REPORTS = ["scoring_report.json"]
+
+def build_library(c_code_dir, work_dir, cflags):
+    """Compile the model code with the batched kernel, if any, into the scoring library and return its path."""
+    for filename in ["model_impl.c", "time_series_model.h"]:
+        shutil.copy(os.path.join(TEMPLATE_DIR, filename), work_dir)
+    sources = ["model_impl.c", "time_series_model.c"]
+    defines = []
+    for filename in ["time_series_model.c", "time_series_model_entry.h", "time_series_model_batch.c",
+                     "time_series_model_batch.h"]:
+        if os.path.exists(os.path.join(c_code_dir, filename)):
+            shutil.copy(os.path.join(c_code_dir, filename), work_dir)
+    if os.path.exists(os.path.join(work_dir, "time_series_model_batch.c")):
+        sources.append("time_series_model_batch.c")
+        defines.append("-DTIME_SERIES_MODEL_HAVE_BATCH")
+
+    print(f"Building {SERVER_LIBRARY} with flags: {cflags}")
+    result = timed_run(["gcc", "-shared", "-fPIC"] + cflags.split() + sources + defines + ["-o", SERVER_LIBRARY, "-lm"],
+                       cwd=work_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Compilation of {SERVER_LIBRARY} failed with error:\n{result.stderr}")
+    return os.path.join(work_dir, SERVER_LIBRARY)
+
+def client(socket_path, payload, window, deadline, latencies, errors):
+    """Send the same request until the deadline and record the round-trip latency of each."""
+    samples = payload.size // window
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            stream = sock.makefile("rwb")
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                write_frame(stream, payload, window)
+                outputs = read_frame(stream, 1, samples)
+                if outputs is None or outputs.size != samples:
+                    raise RuntimeError(f"Expected {samples} outputs, got {None if outputs is None else outputs.size}")
+                latencies.append(time.perf_counter() - start)
+            stream.write(b"\0\0\0\0")
+            stream.flush()
+    except Exception as e:
+        errors.append(repr(e))
+
+def load_test(library_path, workers, clients, inputs, request_size, shard_size, duration, replica_dir):
+    """Serve the model with the given number of workers and drive it with client threads for duration seconds."""
+    models = load_replicas(library_path, workers, replica_dir)
+    window = models[0].window
+    payload = np.resize(inputs, request_size * window)
+    server = ScoringServer(models, shard_size)
+    socket_path = os.path.join(replica_dir, "scoring.sock")
+    socket_server = make_socket_server(server, socket_path, request_size)
+    serve_thread = threading.Thread(target=socket_server.serve_forever, daemon=True)
+    serve_thread.start()
+    try:
+        latencies, errors = [], []
+        server.stats(reset=True)
+        deadline = time.perf_counter() + duration
+        threads = [threading.Thread(target=client, args=(socket_path, payload, window, deadline, latencies, errors))
+                   for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = server.stats()
+    finally:
+        socket_server.shutdown()
+        socket_server.server_close()
+        server.close()
+    if errors:
+        raise RuntimeError(f"Load generator clients failed: {errors[0]}")
+
+    stats["clients"] = clients
+    stats["request_size"] = request_size
+    stats["round_trip_latency"] = percentiles(latencies)
+    print(f"{workers} workers, {clients} clients: {stats['samples_per_sec']:.0f} samples/sec, "
+          f"queue p99 {stats['queue_latency']['p99_ms']} ms, round trip p99 {stats['round_trip_latency']['p99_ms']} ms")
+    return stats
+
+def main():
+    # Parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--c_code_dir", type=str, help="Directory containing C code")
+    parser.add_argument("--model_dir", type=str, help="Directory containing the test data from model training")
+    parser.add_argument("--output_dir", type=str, help="Output directory for the scoring library and report")
+    parser.add_argument("--cflags", type=str, default="-O2", help="Compiler flags for the scoring library")
+    parser.add_argument("--workers", type=str, default=None,
+                        help="Comma separated worker counts to load test (default: powers of two and the CPU count)")
+    parser.add_argument("--clients_per_worker", type=int, default=2, help="Load generator connections per worker")
+    parser.add_argument("--request_size", type=int, default=16384, help="Samples per request")
+    parser.add_argument("--shard_size", type=int, default=4096, help="Largest number of samples per worker call")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds of load per worker count")
+    args = parser.parse_args()
+    telemetry = Telemetry("scoring_server", args.output_dir)
+
+    # A model family is load tested by re-running this script once per model, one at a time
+    models = find_models(args.c_code_dir)
+    if models:
+        telemetry.phase("fan_out")
+        fan_out(os.path.abspath(__file__), sys.argv[1:], models, ["--c_code_dir", "--model_dir"],
+                args.output_dir, 1, MODEL_REPORTS)
+        telemetry.write()
+        return
+
+    telemetry.phase("build")
+    os.makedirs(args.output_dir, exist_ok=True)
+    work_dir = os.path.join(args.output_dir, "work")
+    os.makedirs(work_dir, exist_ok=True)
+    library_path = build_library(args.c_code_dir, work_dir, args.cflags)
+    shutil.copy(library_path, os.path.join(args.output_dir, SERVER_LIBRARY))
+
+    input_path = os.path.join(args.model_dir, "test_input.bin")
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"test_input.bin not found in {args.model_dir}")
+    inputs = load_binary(input_path).reshape(-1)
+
+    if args.workers:
+        worker_counts = [int(count) for count in args.workers.split(",")]
+    else:
+        cpus = os.cpu_count() or 1
+        worker_counts = [1 << i for i in range(cpus.bit_length()) if 1 << i < cpus] + [cpus]
+
+    with tempfile.TemporaryDirectory() as replica_dir:
+        # The outputs of the test set split across all the workers must be identical to a single call
+        telemetry.phase("verify")
+        reference = NativeModel(library_path)
+        expected = reference.predict(inputs)
+        reference.close()
+        server = ScoringServer(load_replicas(library_path, max(worker_counts), replica_dir),
+                               max(1, -(-expected.size // max(worker_counts))))
+        try:
+            outputs = server.score(inputs)
+        finally:
+            server.close()
+        if not np.array_equal(outputs, expected):
+            raise RuntimeError("Sharded scoring outputs differ from a single call of the model library")
+        print(f"Sharded outputs of {expected.size} test samples match a single call")
+
+        telemetry.phase("load_test")
+        runs = [load_test(library_path, workers, workers * args.clients_per_worker, inputs, args.request_size,
+                          args.shard_size, args.duration, replica_dir)
+                for workers in worker_counts]
+
+    # Throughput per worker relative to one worker, 1.0 is linear scaling
+    base = runs[0]["samples_per_sec"] / runs[0]["workers"]
+    for run in runs:
+        run["scaling_efficiency"] = round(run["samples_per_sec"] / (base * run["workers"]), 3) if base else None
+    report = {"library": SERVER_LIBRARY, "cflags": args.cflags, "cpu_count": os.cpu_count(), "runs": runs}
+    with open(os.path.join(args.output_dir, "scoring_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    for run in runs:
+        if run["scaling_efficiency"] is not None and run["scaling_efficiency"] < 0.7:
+            print(f"Warning: {run['workers']} workers reach {run['scaling_efficiency']:.0%} of linear scaling, "
+                  f"increase --request_size or --shard_size if the per-call overhead dominates")
+
+    telemetry.write()
+    print("Scoring server load test completed successfully")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Batch scoring service around the compiled model, for gateways scoring readings from many devices.
+
+Requests are batches of samples (window float32 values each). Every request is split into shards
+of at most shard_size samples, which a pool of worker threads runs through time_series_model_run_batch
+(and so through the batched entry). ctypes releases the GIL during the call, so the workers run
+in parallel. onnx2c keeps the intermediate tensors in static buffers, so each worker loads its own
+copy of the shared library: the copies share nothing and the throughput scales with the cores.
+
+Frames are a little-endian uint32 sample count followed by the float32 values, over a Unix socket
+or stdin/stdout. The response has the same layout with one output per sample, and a zero count
+ends the session. Usage:
+    python scoring_server/server.py --library libtime_series_model_server.so --socket /run/scoring.sock
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import struct
+import signal
+import argparse
+import tempfile
+import threading
+import socketserver
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.native_model import NativeModel
+
+FRAME_HEADER = struct.Struct("<I")
+
+# Largest request accepted by default, so that a bad frame header cannot make the gateway buffer gigabytes
+DEFAULT_MAX_SAMPLES = 1 << 20
+
+def load_replicas(library_path, count, directory):
+    """
+    Load count independent instances of the model library, each from its own copy in a new
+    subdirectory of directory (the dynamic loader returns the loaded instance for a known path).
+    """
+    replica_dir = tempfile.mkdtemp(prefix="replicas_", dir=directory)
+    models = []
+    for i in range(count):
+        path = os.path.join(replica_dir, f"worker{i}_{os.path.basename(library_path)}")
+        shutil.copy(library_path, path)
+        models.append(NativeModel(path))
+    return models
+
+def percentiles(values):
+    """Return the p50, p99 and max of a list of seconds, in milliseconds."""
+    if not values:
+        return {"p50_ms": None, "p99_ms": None, "max_ms": None}
+    values = np.asarray(values) * 1000.0
+    return {"p50_ms": round(float(np.percentile(values, 50)), 3),
+            "p99_ms": round(float(np.percentile(values, 99)), 3),
+            "max_ms": round(float(values.max()), 3)}
+
+class Request:
+    """A batch being scored, completed when all of its shards are done."""
+
+    def __init__(self, inputs, window):
+        self.inputs = inputs
+        self.outputs = np.empty(inputs.size // window, dtype=np.float32)
+        self.enqueued = time.perf_counter()
+        self.started = None
+        self.remaining = 0
+        self.error = None
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+class ScoringServer:
+    """A pool of worker threads, each with its own model instance, scoring sharded batch requests."""
+
+    def __init__(self, models, shard_size=4096):
+        self.models = models
+        self.window = models[0].window
+        self.shard_size = shard_size
+        self._shards = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._queue_latencies = []
+        self._latencies = []
+        self._samples = 0
+        self._started = time.perf_counter()
+        self._threads = [threading.Thread(target=self._work, args=(model,), daemon=True) for model in models]
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self, model):
+        """Run shards through one model instance until the server is closed."""
+        while True:
+            shard = self._shards.get()
+            if shard is None:
+                return
+            request, start, stop = shard
+            if request.started is None:
+                request.started = time.perf_counter()
+            try:
+                model.predict(request.inputs[start * self.window:stop * self.window], out=request.outputs[start:stop])
+            except Exception as e:
+                # Handed to the caller by score(); the worker carries on with the next shard
+                request.error = request.error or e
+            with request.lock:
+                request.remaining -= 1
+                finished = request.remaining == 0
+            if finished:
+                self._finish(request)
+
+    def _finish(self, request):
+        """Record the latencies of a completed request and wake up its caller."""
+        now = time.perf_counter()
+        with self._stats_lock:
+            self._queue_latencies.append(request.started - request.enqueued)
+            self._latencies.append(now - request.enqueued)
+            self._samples += request.outputs.size
+        request.done.set()
+
+    def score(self, inputs):
+        """Score a batch (window values per sample, flat or one row per sample) and return one output per sample."""
+        inputs = np.ascontiguousarray(inputs, dtype=np.float32).reshape(-1)
+        if inputs.size % self.window:
+            raise ValueError(f"Expected a whole number of {self.window}-value windows, got {inputs.size} values")
+        request = Request(inputs, self.window)
+        samples = request.outputs.size
+        if samples == 0:
+            return request.outputs
+        bounds = [(start, min(start + self.shard_size, samples)) for start in range(0, samples, self.shard_size)]
+        request.remaining = len(bounds)
+        for start, stop in bounds:
+            self._shards.put((request, start, stop))
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.outputs
+
+    def stats(self, reset=False):
+        """Return the throughput and latencies since the start (or the last reset)."""
+        with self._stats_lock:
+            elapsed = time.perf_counter() - self._started
+            report = {
+                "workers": len(self.models),
+                "shard_size": self.shard_size,
+                "requests": len(self._latencies),
+                "samples": self._samples,
+                "seconds": round(elapsed, 3),
+                "samples_per_sec": round(self._samples / elapsed, 1) if elapsed else None,
+                "queue_latency": percentiles(self._queue_latencies),
+                "latency": percentiles(self._latencies)
+            }
+            if reset:
+                self._queue_latencies, self._latencies, self._samples = [], [], 0
+                self._started = time.perf_counter()
+        return report
+
+    def close(self):
+        """Stop the workers and release the model instances."""
+        for _ in self._threads:
+            self._shards.put(None)
+        for thread in self._threads:
+            thread.join()
+        for model in self.models:
+            model.close()
+
+def read_exact(stream, size):
+    """Read exactly size bytes, or return None at the end of the stream."""
+    data = bytearray()
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+def read_frame(stream, window, max_samples=DEFAULT_MAX_SAMPLES):
+    """
+    Read a request frame and return its float32 values, or None at the end of the session.
+    Raises ValueError, before reading the payload, for frames of more than max_samples samples.
+    """
+    header = read_exact(stream, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (samples,) = FRAME_HEADER.unpack(header)
+    if samples == 0:
+        return None
+    if max_samples and samples > max_samples:
+        raise ValueError(f"Frame of {samples} samples is larger than the limit of {max_samples}")
+    payload = read_exact(stream, samples * window * 4)
+    if payload is None:
+        raise EOFError(f"Stream ended inside a frame of {samples} samples")
+    return np.frombuffer(payload, dtype="<f4")
+
+def write_frame(stream, values, window=1):
+    """Write a frame of float32 values, window values per sample."""
+    values = np.ascontiguousarray(values, dtype="<f4").reshape(-1)
+    stream.write(FRAME_HEADER.pack(values.size // window) + values.tobytes())
+    stream.flush()
+
+def serve_stream(server, reader, writer, max_samples=DEFAULT_MAX_SAMPLES):
+    """Answer the request frames of one session."""
+    while True:
+        inputs = read_frame(reader, server.window, max_samples)
+        if inputs is None:
+            return
+        write_frame(writer, server.score(inputs))
+
+def make_socket_server(server, path, max_samples=DEFAULT_MAX_SAMPLES):
+    """Return a Unix socket server answering each connection on its own thread."""
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            # An oversized or truncated frame leaves the stream out of sync, so only that session is closed
+            try:
+                serve_stream(server, self.rfile, self.wfile, max_samples)
+            except (ValueError, EOFError) as e:
+                print(f"Closing session: {e}", file=sys.stderr)
+
+    if os.path.exists(path):
+        os.remove(path)
+    socket_server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    socket_server.daemon_threads = True
+    return socket_server
+
+def main():
+    # Parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--library", type=str, help="Model shared library built with time_series_model_run_batch")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker threads")
+    parser.add_argument("--shard_size", type=int, default=4096, help="Largest number of samples per worker call")
+    parser.add_argument("--max_samples", type=int, default=DEFAULT_MAX_SAMPLES,
+                        help="Largest number of samples accepted in one request frame (0 for no limit)")
+    parser.add_argument("--socket", type=str, default=None,
+                        help="Unix socket path to listen on (frames are read from stdin and written to stdout if not set)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as replica_dir:
+        server = ScoringServer(load_replicas(args.library, max(1, args.workers), replica_dir), args.shard_size)
+        try:
+            if args.socket:
+                socket_server = make_socket_server(server, args.socket, args.max_samples)
+                signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=socket_server.shutdown).start())
+                print(f"Scoring on {args.socket} with {args.workers} workers", file=sys.stderr)
+                try:
+                    socket_server.serve_forever()
+                except KeyboardInterrupt:
+                    pass
+                socket_server.server_close()
+                os.remove(args.socket)
+            else:
+                serve_stream(server, sys.stdin.buffer, sys.stdout.buffer, args.max_samples)
+            print(json.dumps(server.stats(), indent=2), file=sys.stderr)
+        finally:
+            server.close()
+
+if __name__ == "__main__":
+    main()
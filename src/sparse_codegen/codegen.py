@@ -0,0 +1,125 @@
+"""
+Sparse float code generation for pruned models.
+onnx2c emits a dense loop over every weight of a Gemm, including the ones pruned to zero. Here each
+dense layer only keeps its nonzero weights, either in CSR arrays (values, column indices and row
+starts, with the smallest index types that fit) or as unrolled multiply-adds with the weights as
+literals. The generated entry function has the same signature as the onnx2c one, so the sparse
+source is a drop-in replacement for time_series_model.c.
+"""
+import numpy as np
+from common.dense_layers import c_float, c_floats
+
+FORMATS = ["csr", "unrolled"]
+
+def index_ctype(limit):
+    """Return the smallest unsigned C type holding values up to limit."""
+    for ctype, maximum in [("uint8_t", 2**8 - 1), ("uint16_t", 2**16 - 1)]:
+        if limit <= maximum:
+            return ctype
+    return "uint32_t"
+
+INDEX_BYTES = {"uint8_t": 1, "uint16_t": 2, "uint32_t": 4}
+
+def layer_stats(layer, fmt):
+    """Return the nonzero count and the weight storage bytes of a layer, dense and in the given format."""
+    weight = layer["weight"].astype(np.float32)
+    rows, columns = weight.shape
+    nonzeros = int(np.count_nonzero(weight))
+    if fmt == "csr":
+        storage = nonzeros * (4 + INDEX_BYTES[index_ctype(columns - 1)]) + (rows + 1) * INDEX_BYTES[index_ctype(nonzeros)]
+    else:
+        # The literals are embedded in the instructions or a constant pool, one per nonzero
+        storage = nonzeros * 4
+    return {
+        "inputs": int(columns),
+        "outputs": int(rows),
+        "relu": layer["relu"],
+        "format": fmt,
+        "nonzeros": nonzeros,
+        "sparsity": 1.0 - nonzeros / weight.size if weight.size else 0.0,
+        "dense_weight_bytes": int(weight.size * 4),
+        "sparse_weight_bytes": int(storage)
+    }
+
+def choose_format(layer, fmt, unroll_max_nonzeros):
+    """Pick the format of a layer: unrolled for few nonzeros (or none, which CSR cannot hold), otherwise CSR."""
+    nonzeros = int(np.count_nonzero(layer["weight"].astype(np.float32)))
+    if fmt == "auto":
+        return "unrolled" if nonzeros <= unroll_max_nonzeros else "csr"
+    return "unrolled" if nonzeros == 0 else fmt
+
+def activation(layer, value):
+    """Return the C expression applying the layer's activation to value."""
+    return f"({value} > 0.0f ? {value} : 0.0f)" if layer["relu"] else value
+
+def generate_layer(index, layer, fmt):
+    """Return the C lines of one layer in the given format."""
+    weight = layer["weight"].astype(np.float32)
+    bias = layer["bias"].astype(np.float32)
+    rows, columns = weight.shape
+    nonzeros = int(np.count_nonzero(weight))
+    lines = [
+        f"/* Layer {index}: {columns} -> {rows}{', ReLU' if layer['relu'] else ''}, "
+        f"{nonzeros} of {weight.size} weights nonzero ({fmt}) */",
+        f"static const float layer{index}_bias[{rows}] = {c_floats(bias)};",
+    ]
+
+    if fmt == "csr":
+        row_index, column_index = np.nonzero(weight)
+        row_start = np.concatenate([[0], np.cumsum(np.bincount(row_index, minlength=rows))])
+        column_ctype, row_ctype = index_ctype(columns - 1), index_ctype(nonzeros)
+        lines += [
+            f"static const float layer{index}_values[{nonzeros}] = {c_floats(weight[row_index, column_index])};",
+            f"static const {column_ctype} layer{index}_columns[{nonzeros}] = "
+            "{" + ", ".join(str(int(c)) for c in column_index) + "};",
+            f"static const {row_ctype} layer{index}_row_start[{rows + 1}] = "
+            "{" + ", ".join(str(int(r)) for r in row_start) + "};",
+            "",
+            f"static void layer{index}(const float x[{columns}], float y[{rows}]) {{",
+            f"    for (int n = 0; n < {rows}; n++) {{",
+            "        float acc = 0.0f;",
+            f"        for (int i = layer{index}_row_start[n]; i < layer{index}_row_start[n + 1]; i++) {{",
+            f"            acc += layer{index}_values[i] * x[layer{index}_columns[i]];",
+            "        }",
+            f"        acc += layer{index}_bias[n];",
+            f"        y[n] = {activation(layer, 'acc')};",
+            "    }",
+            "}",
+            "",
+        ]
+    else:
+        lines += ["", f"static void layer{index}(const float x[{columns}], float y[{rows}]) {{", "    float acc;"]
+        for n in range(rows):
+            lines.append("    acc = 0.0f;")
+            for k in np.nonzero(weight[n])[0]:
+                lines.append(f"    acc += {c_float(weight[n, k])} * x[{k}];")
+            lines += [f"    acc += layer{index}_bias[{n}];", f"    y[{n}] = {activation(layer, 'acc')};"]
+        lines += ["}", ""]
+    return lines
+
+def generate_source(layers, formats, entry_name, source_name):
+    """Return the C source of the sparse model, with the onnx2c entry signature."""
+    window = layers[0]["weight"].shape[1]
+    outputs = layers[-1]["weight"].shape[0]
+    if outputs != 1:
+        raise ValueError(f"Sparse generation supports models with one output value, this one has {outputs}")
+
+    lines = [
+        f"/* Generated by sparse_codegen/run.py from {source_name}: only the nonzero weights are stored and multiplied */",
+        "#include <stdint.h>",
+        "",
+    ]
+    for index, (layer, fmt) in enumerate(zip(layers, formats)):
+        lines += generate_layer(index, layer, fmt)
+
+    lines.append(f"void {entry_name}(const float tensor_input[1][{window}], float tensor_output[1][1]) {{")
+    previous = "tensor_input[0]"
+    for index, layer in enumerate(layers):
+        if index == len(layers) - 1:
+            lines.append(f"    layer{index}({previous}, tensor_output[0]);")
+        else:
+            rows = layer["weight"].shape[0]
+            lines += [f"    float a{index}[{rows}];", f"    layer{index}({previous}, a{index});"]
+            previous = f"a{index}"
+    lines.append("}")
+    return "\n".join(lines) + "\n"
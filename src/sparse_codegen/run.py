@@ -0,0 +1,90 @@
+"""
+Script for generating sparse C code from a pruned model, as an alternative to the dense onnx2c
+output. This will run inside the AML pipeline.
+
+onnx2c keeps every weight of a Gemm as a literal and multiplies it on every inference, so the
+weights pruned to zero by the training step still cost flash and cycles. The code generated here
+only stores and multiplies the nonzero weights, and is compared against the dense build by the
+test and minimal binary steps.
+"""
+import os
+import sys
+import glob
+import json
+import argparse
+import onnx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.dense_layers import extract_layers
+from common.fan_out import model_name
+from common.telemetry import Telemetry
+from codegen import FORMATS, choose_format, layer_stats, generate_source
+
+SPARSE_SOURCE = "time_series_model_sparse.c"
+
+def generate(onnx_path, output_dir, entry_name, fmt, unroll_max_nonzeros):
+    """Generate the sparse C code of one model and write sparse_report.json."""
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Generating sparse code for {os.path.basename(onnx_path)}...")
+    layers = extract_layers(onnx.load(onnx_path))
+    formats = [choose_format(layer, fmt, unroll_max_nonzeros) for layer in layers]
+
+    with open(os.path.join(output_dir, SPARSE_SOURCE), "w") as f:
+        f.write(generate_source(layers, formats, entry_name, os.path.basename(onnx_path)))
+
+    stats = [layer_stats(layer, layer_fmt) for layer, layer_fmt in zip(layers, formats)]
+    weights = sum(entry["inputs"] * entry["outputs"] for entry in stats)
+    nonzeros = sum(entry["nonzeros"] for entry in stats)
+    report = {
+        "model": os.path.basename(onnx_path),
+        "entry": entry_name,
+        "layers": stats,
+        "weights": weights,
+        "nonzeros": nonzeros,
+        "sparsity": 1.0 - nonzeros / weights if weights else 0.0,
+        "dense_weight_bytes": sum(entry["dense_weight_bytes"] for entry in stats),
+        "sparse_weight_bytes": sum(entry["sparse_weight_bytes"] for entry in stats)
+    }
+    with open(os.path.join(output_dir, "sparse_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{len(layers)} layers ({', '.join(formats)}), {nonzeros} of {weights} weights nonzero "
+          f"({report['sparsity']:.1%} sparse), weight storage {report['sparse_weight_bytes']} bytes "
+          f"(dense {report['dense_weight_bytes']} bytes)")
+    if report["sparsity"] < 0.5:
+        print("Warning: the model is less than 50% sparse, the dense onnx2c code is likely smaller and faster")
+    return report
+
+def main():
+    # Parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir", type=str, help="Directory containing the pruned ONNX models")
+    parser.add_argument("--output_dir", type=str, help="Output directory for the sparse C code")
+    parser.add_argument("--format", type=str, choices=["auto"] + FORMATS, default="auto",
+                        help="csr: nonzero values with column indices and row starts, unrolled: one multiply-add "
+                             "per nonzero weight, auto: unrolled for layers with at most --unroll_max_nonzeros")
+    parser.add_argument("--unroll_max_nonzeros", type=int, default=64,
+                        help="Largest number of nonzero weights of a layer unrolled by --format auto")
+    args = parser.parse_args()
+    telemetry = Telemetry("sparse_codegen", args.output_dir)
+
+    # The int8 QDQ models are not pruned separately and are not supported
+    onnx_files = [path for path in sorted(glob.glob(os.path.join(args.model_dir, "*.onnx")))
+                  if not path.endswith("_int8.onnx")]
+    if not onnx_files:
+        raise FileNotFoundError(f"No ONNX model found in {args.model_dir}")
+
+    telemetry.phase("generate")
+    if len(onnx_files) == 1:
+        generate(onnx_files[0], args.output_dir, "entry", args.format, args.unroll_max_nonzeros)
+    else:
+        # A model family gets one subdirectory per model and the prefixed entry symbols of the onnx2c step
+        for path in onnx_files:
+            name = model_name(path)
+            generate(path, os.path.join(args.output_dir, name), f"{name}_entry", args.format, args.unroll_max_nonzeros)
+
+    telemetry.write()
+    print("Sparse code generation completed successfully")
+
+if __name__ == "__main__":
+    main()
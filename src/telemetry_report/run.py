@@ -0,0 +1,50 @@
+"""
+Script for aggregating the timings.json written by every pipeline step.
+This will run inside the AML pipeline, after all the other steps.
+
+The phases of all the steps are ranked by wall time, and the subprocess time is totalled per
+program (onnx2c, gcc, the test binaries...), to show which stages are worth optimising or caching.
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.telemetry import aggregate, format_report
+
+def main():
+    # Parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--step_dir", type=str, action="append", default=[],
+                        help="Output directory of a step as NAME=PATH (repeatable)")
+    parser.add_argument("--output_dir", type=str, help="Output directory for the aggregated timings")
+    args = parser.parse_args()
+
+    step_dirs = {}
+    for spec in args.step_dir:
+        name, separator, path = spec.partition("=")
+        if not separator:
+            raise ValueError(f"Expected a step directory as NAME=PATH, got {spec}")
+        step_dirs[name] = path
+
+    report = aggregate(step_dirs)
+    if not report["steps"]:
+        raise FileNotFoundError(f"No timings.json found in {', '.join(step_dirs.values())}")
+    missing = [name for name, path in step_dirs.items() if not any(
+        step == name or step.startswith(f"{name}/") for step in report["steps"])]
+    for name in missing:
+        print(f"Warning: no timings.json found for {name}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, "pipeline_timings.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    table = format_report(report)
+    with open(os.path.join(args.output_dir, "pipeline_timings.txt"), "w") as f:
+        f.write(table)
+    print(table)
+
+    print("Timing aggregation completed successfully")
+
+if __name__ == "__main__":
+    main()
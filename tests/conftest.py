@@ -0,0 +1,8 @@
+"""
+Tests of the code generators. The step scripts put src/ on sys.path themselves; the tests do the same.
+C round trips are skipped when gcc is not installed.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
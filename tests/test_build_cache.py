@@ -0,0 +1,61 @@
+"""Damaged entries and abandoned temporary folders must not take cache space forever."""
+import os
+import time
+
+from common.build_cache import BuildCache, ENTRY_METADATA, TMP_MARKER, TMP_GRACE_SECONDS
+
+def write_file(path, size):
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+
+def test_put_replaces_damaged_entry(tmp_path):
+    cache = BuildCache(str(tmp_path / "cache"))
+    key = BuildCache.make_key(values=["damaged"])
+    entry_dir = tmp_path / "cache" / key
+    entry_dir.mkdir()
+    (entry_dir / ENTRY_METADATA).write_text("{\"files\": [")
+
+    write_file(tmp_path / "out.bin", 16)
+    cache.put(key, [str(tmp_path / "out.bin")])
+
+    metadata = cache.get(key, str(tmp_path / "restored"))
+    assert metadata is not None and metadata["files"] == ["out.bin"]
+
+def test_evict_reclaims_damaged_and_abandoned_dirs(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache = BuildCache(str(cache_dir))
+    damaged = cache_dir / "damaged"
+    damaged.mkdir()
+    write_file(damaged / "out.bin", 1024)
+
+    abandoned = cache_dir / ("crashed" + TMP_MARKER + "abc")
+    abandoned.mkdir()
+    write_file(abandoned / "out.bin", 1024)
+    old = time.time() - TMP_GRACE_SECONDS - 60
+    os.utime(abandoned, (old, old))
+
+    in_progress = cache_dir / ("running" + TMP_MARKER + "def")
+    in_progress.mkdir()
+    write_file(in_progress / "out.bin", 1024)
+
+    cache.evict()
+    assert not damaged.exists()
+    assert not abandoned.exists()
+    assert in_progress.exists()
+
+def test_temporary_dirs_count_toward_the_limit(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache = BuildCache(str(cache_dir), max_size_mb=1 / 1024)  # 1024 bytes
+    in_progress = cache_dir / ("running" + TMP_MARKER + "def")
+    in_progress.mkdir()
+    write_file(in_progress / "out.bin", 1000)
+
+    write_file(tmp_path / "first.bin", 100)
+    cache.put(BuildCache.make_key(values=["first"]), [str(tmp_path / "first.bin")])
+    write_file(tmp_path / "second.bin", 100)
+    cache.put(BuildCache.make_key(values=["second"]), [str(tmp_path / "second.bin")])
+
+    # Without the 1000 bytes in progress both entries would fit
+    assert cache.stats()["evictions"] == 1
+    entries = [name for name in os.listdir(cache_dir) if os.path.isdir(cache_dir / name) and TMP_MARKER not in name]
+    assert entries == [BuildCache.make_key(values=["second"])]
@@ -0,0 +1,49 @@
+"""The generated fixed-point C code must match the bit-exact NumPy simulation."""
+import os
+import sys
+import shutil
+import subprocess
+import numpy as np
+import pytest
+
+pytest.importorskip("onnx")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "fixed_point"))
+from codegen import FORMATS, choose_formats, to_fixed, simulate, generate_source, generate_header
+from common.native_model import FixedPointModel
+
+WINDOW = 4
+HIDDEN = 8
+
+def random_layers(seed):
+    """A random two-layer dense model: WINDOW -> HIDDEN with ReLU, then HIDDEN -> 1."""
+    rng = np.random.default_rng(seed)
+    return [
+        {"weight": rng.normal(size=(HIDDEN, WINDOW)), "bias": rng.normal(size=HIDDEN), "relu": True},
+        {"weight": rng.normal(size=(1, HIDDEN)), "bias": rng.normal(size=1), "relu": False},
+    ]
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="gcc is not installed")
+@pytest.mark.parametrize("fmt", sorted(FORMATS))
+@pytest.mark.parametrize("seed", [0, 1])
+def test_generated_code_matches_simulation(tmp_path, fmt, seed):
+    layers = random_layers(seed)
+    inputs = np.random.default_rng(seed + 100).uniform(-10.0, 10.0, size=(256, WINDOW))
+    input_frac = choose_formats(layers, inputs, fmt, 1.25)
+
+    (tmp_path / "time_series_model_fixed.c").write_text(generate_source(layers, fmt, "test.onnx"))
+    (tmp_path / "time_series_model_fixed.h").write_text(generate_header(layers, fmt, input_frac))
+    library = str(tmp_path / "libtime_series_model_fixed.so")
+    subprocess.run(["gcc", "-shared", "-fPIC", "-O2", "time_series_model_fixed.c", "-o", library],
+                   cwd=tmp_path, check=True)
+
+    model = FixedPointModel(library, {
+        "window": WINDOW,
+        "bits": FORMATS[fmt]["bits"],
+        "input_frac_bits": input_frac,
+        "output_frac_bits": layers[-1]["output_frac"],
+    })
+    # Inputs past the calibration range exercise the saturation paths too
+    test_inputs = np.concatenate([inputs, inputs * 4.0])
+    expected, _ = simulate(layers, to_fixed(test_inputs, input_frac, FORMATS[fmt]["bits"]), fmt)
+    expected = (expected.reshape(-1).astype(np.float64) / 2.0 ** layers[-1]["output_frac"]).astype(np.float32)
+    np.testing.assert_array_equal(model.predict(test_inputs), expected)
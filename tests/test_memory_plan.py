@@ -0,0 +1,43 @@
+"""The worst-case stack path of the minimal binary must include the frames of static functions."""
+import os
+import sys
+import shutil
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "minimal_binary"))
+from memory_plan import analyze_stack
+
+# onnx2c emits its node functions as static, so the deepest frame is usually a static callee
+MAIN_SOURCE = """\
+int model_run(int x);
+int main(int argc, char** argv) {
+    (void)argv;
+    return model_run(argc);
+}
+"""
+
+MODEL_SOURCE = """\
+static int node_leaf(int x) {
+    volatile int buffer[64];
+    buffer[x & 63] = x;
+    return buffer[(x + 1) & 63];
+}
+
+int model_run(int x) {
+    return node_leaf(x) + 1;
+}
+"""
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="gcc is not installed")
+def test_static_callee_counts_toward_worst_case(tmp_path, monkeypatch):
+    (tmp_path / "main.c").write_text(MAIN_SOURCE)
+    (tmp_path / "model.c").write_text(MODEL_SOURCE)
+    monkeypatch.chdir(tmp_path)
+
+    stack = analyze_stack(["main.c", "model.c"], ["-O0"])
+
+    assert stack["worst_case_path"] == ["main", "model_run", "model.c:node_leaf"]
+    frames = stack["frames"]
+    # x86-64 leaf functions keep part of their locals in the red zone, below the reported frame
+    assert frames["model.c:node_leaf"]["bytes"] > frames["model_run"]["bytes"]
+    assert stack["worst_case_bytes"] == sum(frames[function]["bytes"] for function in stack["worst_case_path"])
@@ -0,0 +1,73 @@
+"""
+The hashed splits must not depend on how the data is chunked, and a warm start must round-trip the
+checkpoint: an unchanged retrain exports the previous ONNX file byte for byte. Skipped without the
+PyTorch environment (torch, onnx, onnxruntime and matplotlib).
+"""
+import os
+import sys
+import json
+import subprocess
+from functools import partial
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+for module in ["onnx", "onnxruntime", "matplotlib"]:
+    pytest.importorskip(module)
+
+TRAIN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "pytorch_train")
+sys.path.insert(0, TRAIN_DIR)
+import data
+import run
+from common.test_data import load_binary
+
+WINDOW = 3
+
+def train(output_dir, *extra):
+    """Run the training step on the sample data, with a short schedule."""
+    subprocess.run([sys.executable, os.path.join(TRAIN_DIR, "run.py"), "--output_dir", str(output_dir),
+                    "--window", str(WINDOW), "--epochs", "5", "--patience", "0", "--stream_rows", "50"] + list(extra),
+                   check=True, env=dict(os.environ, MPLBACKEND="Agg"))
+
+def test_splits_are_deterministic(tmp_path):
+    whole = data.assign_splits(0, 10000, 7, 0.2, 0.1)
+    assert np.array_equal(whole, data.assign_splits(0, 10000, 7, 0.2, 0.1))
+    assert np.array_equal(whole, np.concatenate([data.assign_splits(0, 3001, 7, 0.2, 0.1),
+                                                 data.assign_splits(3001, 6999, 7, 0.2, 0.1)]))
+    assert not np.array_equal(whole, data.assign_splits(0, 10000, 8, 0.2, 0.1))
+    assert abs(np.mean(whole == data.TEST) - 0.2) < 0.02
+    assert abs(np.mean(whole == data.VAL) - 0.08) < 0.02
+
+    # The same rows land in each split however the file is read
+    path = tmp_path / "series.npy"
+    np.save(path, np.random.default_rng(0).normal(size=(1000, 2)).astype(np.float32))
+    splits = {}
+    for chunk_rows in [7, 1000]:
+        source = partial(data.windowed_chunks, partial(data.read_chunks, str(path), "time", "temperature", chunk_rows), WINDOW)
+        splits[chunk_rows] = [data.collect_split(source, split, 7, 0.2, 0.1) for split in [data.TRAIN, data.VAL, data.TEST]]
+    for (x_small, y_small), (x_large, y_large) in zip(splits[7], splits[1000]):
+        assert np.array_equal(x_small, x_large) and np.array_equal(y_small, y_large)
+
+def test_checkpoint_round_trip(tmp_path):
+    first = tmp_path / "first"
+    train(first)
+
+    checkpoint = run.load_checkpoint(str(first), WINDOW)
+    model = run.SimpleTimeSeriesModel(WINDOW)
+    model.load_state_dict(checkpoint["state_dict"])
+    model.eval()
+    with torch.no_grad():
+        outputs = model(torch.from_numpy(np.ascontiguousarray(load_binary(first / "test_input.bin")))).numpy()
+    assert np.allclose(outputs, load_binary(first / "reference_output.bin"), atol=1e-5)
+    assert checkpoint["onnx_sha256"] == run.graph_hash(str(first / run.ONNX_FILE))
+    with pytest.raises(ValueError):
+        run.load_checkpoint(str(first), WINDOW + 1)
+
+    # Fine-tuning that cannot improve on the checkpoint keeps its weights, and so its ONNX file
+    second = tmp_path / "second"
+    train(second, "--checkpoint_dir", str(first), "--finetune_epochs", "2", "--finetune_lr", "0", "--patience", "20")
+    with open(second / run.MODEL_HASH_FILE, "r") as f:
+        export = json.load(f)
+    assert export["unchanged"]
+    assert (second / run.ONNX_FILE).read_bytes() == (first / run.ONNX_FILE).read_bytes()
+    assert run.load_checkpoint(str(second), WINDOW)["epochs_trained"] == checkpoint["epochs_trained"] + 2
@@ -0,0 +1,108 @@
+"""The weight blob header must describe its payload, and the generated loader must accept only matching blobs."""
+import os
+import sys
+import json
+import zlib
+import ctypes
+import shutil
+import subprocess
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "onnx2c"))
+import weight_blob
+
+# A dense layer in the style of the onnx2c output: constant tensors followed by the entry function
+MODEL_CODE = """\
+#include <stdint.h>
+static const float tensor_weight[2][3] = {{0.5f, -1.25f, 2.0f}, {3.0f, 0.25f, -0.75f}};
+static const float tensor_bias[2] = {0.125f, -4.0f};
+static const int8_t tensor_scale[3] = {1, -2, 3};
+
+void entry(const float input[1][3], float output[1][2]) {
+    for (int n = 0; n < 2; n++) {
+        float acc = tensor_bias[n];
+        for (int k = 0; k < 3; k++) {
+            acc += tensor_weight[n][k] * input[0][k] * tensor_scale[k];
+        }
+        output[0][n] = acc;
+    }
+}
+"""
+
+def write_blob(output_dir):
+    unit = {"path": os.path.join(output_dir, "time_series_model_blob.c"), "code": MODEL_CODE,
+            "setter": "entry_set_weights"}
+    weight_blob.write_blob_files(output_dir, [unit], "entry", "test.onnx")
+    with open(os.path.join(output_dir, weight_blob.BLOB_FILE), "rb") as f:
+        blob = f.read()
+    with open(os.path.join(output_dir, weight_blob.LAYOUT_FILE), "r") as f:
+        layout = json.load(f)
+    return blob, layout
+
+def test_header_describes_payload(tmp_path):
+    blob, layout = write_blob(str(tmp_path))
+    magic, version, header_bytes, layout_crc, payload_bytes, payload_crc = weight_blob.HEADER.unpack_from(blob)
+    payload = blob[weight_blob.HEADER.size:]
+
+    assert (magic, version, header_bytes) == (weight_blob.MAGIC, weight_blob.VERSION, weight_blob.HEADER.size)
+    assert payload_bytes == len(payload) == layout["payload_bytes"]
+    assert len(payload) % weight_blob.ALIGNMENT == 0
+    assert payload_crc == zlib.crc32(payload) == int(layout["payload_crc32"], 16)
+    assert layout_crc == weight_blob.layout_hash(layout["tensors"]) == int(layout["layout"], 16)
+
+    # Every tensor sits at an aligned offset and holds the values of its initializer
+    values = {constant["name"]: constant["values"] for constant in weight_blob.extract_constants(MODEL_CODE)}
+    for tensor in layout["tensors"]:
+        assert tensor["offset"] % weight_blob.ALIGNMENT == 0
+        expected = values[tensor["name"]]
+        stored = np.frombuffer(payload, dtype=weight_blob.CTYPES[tensor["ctype"]], count=expected.size,
+                               offset=tensor["offset"])
+        np.testing.assert_array_equal(stored, expected)
+
+def test_layout_hash_depends_on_layout():
+    _, layout = weight_blob.layout_blob([{"setter": "entry_set_weights",
+                                          "constants": weight_blob.extract_constants(MODEL_CODE)}])
+    moved = [dict(tensor, offset=tensor["offset"] + weight_blob.ALIGNMENT) for tensor in layout]
+    assert weight_blob.layout_hash(layout) == weight_blob.layout_hash([dict(t) for t in layout])
+    assert weight_blob.layout_hash(moved) != weight_blob.layout_hash(layout)
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="gcc is not installed")
+def test_loader_round_trip(tmp_path):
+    blob, _ = write_blob(str(tmp_path))
+    (tmp_path / "compiled.c").write_text(MODEL_CODE)
+    for library, sources in [("libcompiled.so", ["compiled.c"]),
+                             ("libblob.so", ["time_series_model_blob.c", weight_blob.LOADER_FILE])]:
+        subprocess.run(["gcc", "-shared", "-fPIC", "-O2"] + sources + ["-o", library], cwd=tmp_path, check=True)
+
+    def run(lib, inputs):
+        output = np.zeros(2, dtype=np.float32)
+        lib.entry(inputs.ctypes.data_as(ctypes.c_void_p), output.ctypes.data_as(ctypes.c_void_p))
+        return output
+
+    compiled = ctypes.CDLL(str(tmp_path / "libcompiled.so"))
+    lib = ctypes.CDLL(str(tmp_path / "libblob.so"))
+    lib.entry_load_weights.argtypes = [ctypes.c_char_p]
+    codes = {name: -index for index, name in enumerate(weight_blob.RESULTS)}
+
+    def load(name, data):
+        path = tmp_path / name
+        path.write_bytes(data)
+        return lib.entry_load_weights(str(path).encode())
+
+    inputs = np.array([1.5, -2.0, 0.25], dtype=np.float32)
+    assert load("good.bin", blob) == codes["OK"]
+    np.testing.assert_array_equal(run(lib, inputs), run(compiled, inputs))
+
+    damaged = bytearray(blob)
+    damaged[-1] ^= 0x01
+    assert load("damaged.bin", bytes(damaged)) == codes["BAD_CHECKSUM"]
+    mismatched = bytearray(blob)
+    mismatched[8] ^= 0x01
+    assert load("mismatched.bin", bytes(mismatched)) == codes["BAD_LAYOUT"]
+    assert load("truncated.bin", blob[:-weight_blob.ALIGNMENT]) == codes["BAD_SIZE"]
+    assert load("bad_magic.bin", b"XXXX" + blob[4:]) == codes["BAD_MAGIC"]
+    assert lib.entry_load_weights(str(tmp_path / "missing.bin").encode()) == codes["IO_ERROR"]
+
+    # Rejected blobs leave the previously bound weights in place
+    np.testing.assert_array_equal(run(lib, inputs), run(compiled, inputs))